@@ -0,0 +1,300 @@
+# ===================================================== BENCHMARK DATA ANALYSIS =====================================================
+# ------------------------------------------ LEITURA, FILTRO E GRÁFICO DA ABA DE DATA ANALYSIS ------------------------------------------
+
+
+
+## Propósito deste código
+# Medir cada etapa do caminho que roda a cada interação na aba Data_Analysis (leitura do arquivo, clean_to_chart, chart_interactive e
+# serialização do gráfico) com universos sintéticos de 1 mil a 1 milhão de fundos, comparando com uma baseline gravada.
+
+## Uso
+# python "03. Benchmark/Benchmark_Data_Analysis.py"                       -> compara com a baseline e falha se houver regressão
+# python "03. Benchmark/Benchmark_Data_Analysis.py" --gravar-baseline     -> grava os resultados atuais como nova baseline
+# python "03. Benchmark/Benchmark_Data_Analysis.py" --tamanhos 1000,10000 --limite-regressao 0.5
+
+## Sumário
+# 01. Introdução
+# 02. Cockpit
+# 03. Funções
+# 04. Pipeline
+
+
+# ------------------------------------------------------------- 01. INTRODUÇÃO -------------------------------------------------------------
+
+
+
+# Importa bibliotecas
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Pastas do benchmark e do projeto
+benchmark_path = os.path.dirname(os.path.abspath(__file__))
+project_path = os.path.dirname(benchmark_path)
+
+# Importa a ferramenta a partir da pasta do projeto
+os.chdir(project_path)
+sys.path.append(project_path)
+import FerramentaInvestimento as fi
+
+
+# --------------------------------------------------------------- 02. COCKPIT --------------------------------------------------------------
+
+
+
+# Tamanhos de universo padrão
+TAMANHOS = [1000, 10000, 100000, 1000000]
+
+# Acima deste tamanho a leitura do Excel não é medida (gravar o arquivo de teste fica lento demais)
+MAX_LINHAS_EXCEL = 100000
+
+# Etapas medidas, na ordem em que rodam na aplicação
+ETAPAS = ["load_excel", "load_parquet", "clean_to_chart", "chart_interactive", "serializacao"]
+
+# Arquivo da baseline
+BASELINE_PATH = benchmark_path + "/Baseline_Data_Analysis.json"
+
+# Aumento relativo de tempo tolerado antes de considerar regressão (0.3 = 30% mais lento)
+LIMITE_REGRESSAO = 0.3
+
+# Tempos menores que este (em segundos) são ruído e não são comparados
+TEMPO_MINIMO_COMPARACAO = 0.01
+
+# Parâmetros do gráfico usados no benchmark (valores padrão da sidebar)
+SCORE_TYPE = "60m"
+MAX_VOLATILITY = 100
+
+
+
+# -------------------------------------------------------------- 03. FUNÇÕES ---------------------------------------------------------------
+
+
+
+# Função que cria um universo sintético de fundos a partir do template de resultados
+def create_universe(
+    n_ativos: int,
+    seed: int = 0
+):
+    """
+    Função que cria um universo sintético de fundos a partir do template de resultados
+
+    Args:
+        n_ativos (int): Quantidade de fundos
+        seed (int): Semente do gerador de números aleatórios
+
+    Returns:
+        pd.DataFrame: DataFrame no formato do Template_SuperCarteira_Result.xlsx
+    """
+    rng = np.random.default_rng(seed)
+    df_template = pd.read_excel("Template_SuperCarteira_Result.xlsx", engine = "openpyxl")
+
+    # Sorteia linhas do template e adiciona ruído às colunas numéricas
+    df_universe = df_template.iloc[rng.integers(0, len(df_template), size = n_ativos)].reset_index(drop = True)
+    for column in df_universe.select_dtypes(include = "float").columns:
+        df_universe[column] = df_universe[column] * rng.normal(1, 0.1, size = n_ativos)
+
+    # Identificadores únicos
+    df_universe["cnpj"] = rng.choice(10 ** 13, size = n_ativos, replace = False) + 10 ** 13
+    df_universe["name"] = "FUNDO SINTETICO " + df_universe["cnpj"].astype(str)
+
+    return df_universe
+
+
+# Função que mede tempo e pico de memória de uma etapa
+def measure(
+    funcao,
+    repeticoes: int,
+    preparar = None
+):
+    """
+    Função que mede tempo e pico de memória de uma etapa
+
+    Args:
+        funcao (callable): Etapa a ser medida, recebe o retorno de preparar (ou nada)
+        repeticoes (int): Quantidade de execuções cronometradas
+        preparar (callable): Função chamada fora do cronômetro antes de cada execução
+
+    Returns:
+        tuple: (mediana do tempo em segundos, pico de memória alocada em MB, retorno da última execução)
+    """
+    list_tempos = []
+    for _ in range(repeticoes):
+        argumentos = () if preparar is None else (preparar(),)
+        inicio = time.perf_counter()
+        resultado = funcao(*argumentos)
+        list_tempos.append(time.perf_counter() - inicio)
+
+    # O tracemalloc deixa a execução mais lenta, então a memória é medida em uma execução separada
+    argumentos = () if preparar is None else (preparar(),)
+    tracemalloc.start()
+    resultado = funcao(*argumentos)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return float(np.median(list_tempos)), pico / 1024 ** 2, resultado
+
+
+# Função que executa todas as etapas para um tamanho de universo
+def run_size(
+    n_ativos: int,
+    repeticoes: int,
+    pasta: str,
+    seed: int = 0
+):
+    """
+    Função que executa todas as etapas para um tamanho de universo
+
+    Args:
+        n_ativos (int): Quantidade de fundos
+        repeticoes (int): Quantidade de execuções cronometradas por etapa
+        pasta (str): Pasta temporária para os arquivos do universo
+        seed (int): Semente do gerador de números aleatórios
+
+    Returns:
+        dict: {etapa: {"tempo_s": ..., "memoria_mb": ...}}
+    """
+    df_universe = create_universe(n_ativos, seed)
+    resultados = {}
+
+    # Leitura do Excel com o schema compacto (como no upload ou no template)
+    if n_ativos <= MAX_LINHAS_EXCEL:
+        arquivo_excel = f"{pasta}/universo_{n_ativos}.xlsx"
+        df_universe.to_excel(arquivo_excel, index = False)
+        tempo, memoria, _ = measure(lambda: fi.apply_result_schema(pd.read_excel(arquivo_excel, engine = "openpyxl")), repeticoes)
+        resultados["load_excel"] = {"tempo_s": tempo, "memoria_mb": memoria}
+
+    # Leitura do Parquet com o schema compacto (como no histórico de webscrappings)
+    arquivo_parquet = f"{pasta}/universo_{n_ativos}.parquet"
+    df_universe.to_parquet(arquivo_parquet, index = False)
+    tempo, memoria, df_result = measure(lambda: fi.apply_result_schema(pd.read_parquet(arquivo_parquet)), repeticoes)
+    resultados["load_parquet"] = {"tempo_s": tempo, "memoria_mb": memoria}
+
+    # Filtro; cada execução recebe uma cópia nova, como acontece a cada rerun da aplicação
+    df_result = fi.add_risk_metrics(df_result)
+    tempo, memoria, df_result_chart = measure(
+        lambda df: fi.clean_to_chart(df, SCORE_TYPE, MAX_VOLATILITY = MAX_VOLATILITY),
+        repeticoes,
+        preparar = df_result.copy
+    )
+    resultados["clean_to_chart"] = {"tempo_s": tempo, "memoria_mb": memoria}
+
+    # Construção do gráfico
+    fi.SCORE_TYPE = SCORE_TYPE
+    fi.MAX_VOLATILITY = MAX_VOLATILITY
+    tempo, memoria, fig = measure(lambda: fi.chart_interactive(df_result_chart, True, fi.TOOLTIP_SIMPLE_COLUMNS), repeticoes)
+    resultados["chart_interactive"] = {"tempo_s": tempo, "memoria_mb": memoria}
+
+    # Serialização do gráfico (o que o st.plotly_chart envia ao navegador)
+    tempo, memoria, _ = measure(fig.to_json, repeticoes)
+    resultados["serializacao"] = {"tempo_s": tempo, "memoria_mb": memoria}
+
+    return resultados
+
+
+# Função que compara os resultados com a baseline e retorna as regressões encontradas
+def compare_baseline(
+    resultados: dict,
+    baseline: dict,
+    limite_regressao: float
+):
+    """
+    Função que compara os resultados com a baseline e retorna as regressões encontradas
+
+    Args:
+        resultados (dict): {tamanho: {etapa: {"tempo_s", "memoria_mb"}}}
+        baseline (dict): Mesmo formato de resultados
+        limite_regressao (float): Aumento relativo de tempo tolerado
+
+    Returns:
+        list: Descrição das regressões
+    """
+    list_regressoes = []
+    print("\n" + " | ".join(f"{coluna:>18}" for coluna in ["tamanho", "etapa", "tempo_s", "baseline_s", "variacao", "memoria_mb"]))
+
+    for tamanho, etapas in resultados.items():
+        for etapa, medida in etapas.items():
+            medida_baseline = baseline.get(tamanho, {}).get(etapa)
+            variacao = "-"
+            tempo_baseline = "-"
+
+            if medida_baseline is not None:
+                tempo_baseline = f"{medida_baseline['tempo_s']:.4f}"
+                variacao = f"{medida['tempo_s'] / medida_baseline['tempo_s'] - 1:+.1%}"
+                regrediu = medida["tempo_s"] > medida_baseline["tempo_s"] * (1 + limite_regressao)
+                if regrediu and medida["tempo_s"] > TEMPO_MINIMO_COMPARACAO:
+                    list_regressoes.append(f"{etapa} ({tamanho} linhas): {medida_baseline['tempo_s']:.4f}s -> {medida['tempo_s']:.4f}s")
+
+            print(" | ".join(f"{str(valor):>18}" for valor in [
+                tamanho, etapa, f"{medida['tempo_s']:.4f}", tempo_baseline, variacao, f"{medida['memoria_mb']:.1f}"
+                ]))
+
+    return list_regressoes
+
+
+# Função que le os argumentos da linha de comando
+def parse_args():
+    """
+    Função que le os argumentos da linha de comando
+
+    Args:
+        None
+
+    Returns:
+        argparse.Namespace: Argumentos
+    """
+    parser = argparse.ArgumentParser(description = "Benchmark da aba de Data Analysis com universos sintéticos")
+    parser.add_argument("--tamanhos", default = ",".join(str(tamanho) for tamanho in TAMANHOS), help = "Quantidades de fundos separadas por vírgula")
+    parser.add_argument("--repeticoes", type = int, default = 3, help = "Execuções cronometradas por etapa")
+    parser.add_argument("--limite-regressao", type = float, default = LIMITE_REGRESSAO, help = "Aumento relativo de tempo tolerado")
+    parser.add_argument("--baseline", default = BASELINE_PATH, help = "Arquivo JSON da baseline")
+    parser.add_argument("--gravar-baseline", action = "store_true", help = "Grava os resultados como nova baseline")
+    parser.add_argument("--seed", type = int, default = 0, help = "Semente do gerador de números aleatórios")
+
+    return parser.parse_args()
+
+
+
+# -------------------------------------------------------------- 04. PIPELINE --------------------------------------------------------------
+
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    # Executa as etapas para cada tamanho
+    resultados = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        for n_ativos in [int(tamanho) for tamanho in args.tamanhos.split(",")]:
+            print(f"Executando universo com {n_ativos} fundos...")
+            resultados[str(n_ativos)] = run_size(n_ativos, args.repeticoes, pasta, args.seed)
+
+    # Lê a baseline, se existir
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)["resultados"]
+
+    list_regressoes = compare_baseline(resultados, baseline, args.limite_regressao)
+
+    # Grava nova baseline, mantendo os tamanhos que não foram executados agora
+    if args.gravar_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"resultados": {**baseline, **resultados}}, file, indent = 2)
+        print(f"\nBaseline gravada em {args.baseline}")
+        sys.exit(0)
+
+    if list_regressoes:
+        print("\nRegressões acima de {:.0%}:".format(args.limite_regressao))
+        for regressao in list_regressoes:
+            print(f"  {regressao}")
+        sys.exit(1)
+
+    print("\nSem regressões.")
@@ -0,0 +1,454 @@
+# ======================================================= BENCHMARK WEBSCRAPPING ========================================================
+# ------------------------------------------------- MAIS RETORNO & BTG SEM ACESSO À INTERNET -------------------------------------------------
+
+
+
+## Propósito deste código
+# Medir a performance dos webscrappings (throughput, latência p95 e pico de memória) de forma repetível, sem acessar api.maisretorno.com
+# nem o site do BTG. Um servidor HTTP local devolve as respostas gravadas em "Respostas/" com latência, variação e taxa de erro configuráveis.
+
+## Uso
+# python "03. Benchmark/Benchmark_Webscrapping.py" --tamanhos 100,1000,10000 --latencia 0.02 --jitter 0.01 --taxa-erro 0.01
+# python "03. Benchmark/Benchmark_Webscrapping.py" --cenarios maisretorno --tamanhos 1000 --capacidade 20 --retry-after 0.5
+#   -> o servidor responde 429 acima de 20 req/s, para verificar se o controle adaptativo converge para perto desse limite
+# Cada cenário roda em um processo separado, para que o pico de memória de um não contamine o outro.
+
+## Sumário
+# 01. Introdução
+# 02. Cockpit
+# 03. Funções
+# 04. Pipeline
+
+
+# ------------------------------------------------------------- 01. INTRODUÇÃO -------------------------------------------------------------
+
+
+
+# Importa bibliotecas
+import os
+import sys
+import json
+import copy
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+# Pastas do benchmark e do projeto
+benchmark_path = os.path.dirname(os.path.abspath(__file__))
+project_path = os.path.dirname(benchmark_path)
+respostas_path = benchmark_path + "/Respostas"
+
+
+# --------------------------------------------------------------- 02. COCKPIT --------------------------------------------------------------
+
+
+
+# Cenários disponíveis e função de webscrapping correspondente
+CENARIOS = ["maisretorno", "btg", "all"]
+
+# Tamanhos de universo padrão
+TAMANHOS = [100, 1000, 10000]
+
+# Categorias da SuperCarteira usadas no universo sintético
+list_categorias = ["ANTIFRAGILIDADE", "DIVERSIFICACAO", "ESTABILIDADE", "VALORIZACAO", "OUTROS"]
+
+# Tamanho da página do BTG usado no benchmark
+SIZE_PER_PAGE_BTG = 150
+
+# Prefixo da linha com o resultado de cada cenário na saída do processo filho
+PREFIXO_RESULTADO = "RESULTADO_BENCHMARK="
+
+
+
+# -------------------------------------------------------------- 03. FUNÇÕES ---------------------------------------------------------------
+
+
+
+# Função que cria os arquivos da SuperCarteira com um universo sintético de ativos
+def create_universe(
+    n_ativos: int,
+    pasta: str,
+    seed: int = 0
+):
+    """
+    Função que cria os arquivos da SuperCarteira com um universo sintético de ativos
+
+    Args:
+        n_ativos (int): Quantidade de ativos do universo
+        pasta (str): Pasta onde os arquivos SuperCarteira_{categoria}.json são gravados
+        seed (int): Semente do gerador de números aleatórios
+
+    Returns:
+        list: CNPJs (somente números) do universo
+    """
+    rng = np.random.default_rng(seed)
+    cnpjs = [f"{cnpj:014d}" for cnpj in rng.choice(10 ** 13, size = n_ativos, replace = False) + 10 ** 13]
+
+    # Distribui os ativos entre as categorias
+    for posicao, categoria in enumerate(list_categorias):
+        ativos = [
+            {
+                "identifier": f"ID_FUNDO_{cnpj}",
+                "label": f"FUNDO SINTETICO {cnpj}",
+                "cnpj": f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}",
+                "situation": "Em funcionamento normal",
+                "managementCompany": "GESTORA SINTETICA",
+                "isin": f"BR{cnpj[:10]}",
+                "type": None,
+                "stockExchange": None,
+                "assetType": "FI"
+            }
+            for cnpj in cnpjs[posicao::len(list_categorias)]
+        ]
+        with open(f"{pasta}/SuperCarteira_{categoria}.json", "w") as file:
+            json.dump({categoria: ativos}, file)
+
+    return cnpjs
+
+
+# Função que cria o servidor local que devolve as respostas gravadas
+def create_mock_server(
+    cnpjs_btg: list,
+    latencia: float,
+    jitter: float,
+    taxa_erro: float,
+    status_erro: int = 500,
+    capacidade: float = None,
+    retry_after: float = None,
+    seed: int = 0
+):
+    """
+    Função que cria o servidor local que devolve as respostas gravadas
+
+    Args:
+        cnpjs_btg (list): CNPJs listados nas páginas do BTG
+        latencia (float): Latência base de cada resposta em segundos
+        jitter (float): Variação máxima (uniforme) somada à latência em segundos
+        taxa_erro (float): Probabilidade de uma resposta ser um erro
+        status_erro (int): Status HTTP devolvido nos erros (ex.: 500, 429, 503)
+        capacidade (float): Requisições por segundo aceitas; acima disso responde 429 (caso None não há limite)
+        retry_after (float): Segundos enviados no header Retry-After das respostas 429/503 (caso None o header não é enviado)
+        seed (int): Semente do gerador de números aleatórios
+
+    Returns:
+        ThreadingHTTPServer: Servidor pronto para ser iniciado, em uma porta livre de 127.0.0.1 (n_limitadas conta as respostas 429)
+    """
+    # Respostas gravadas
+    with open(f"{respostas_path}/maisretorno_stats.json", "r") as file:
+        resposta_maisretorno = json.load(file)
+    with open(f"{respostas_path}/btg_funds_list.json", "r") as file:
+        item_btg = json.load(file)["items"][0]
+
+    gerador = random.Random(seed)
+    trava_gerador = threading.Lock()
+
+    # Balde de fichas que limita as requisições aceitas por segundo (rajada de até 1 segundo de capacidade)
+    balde = {"fichas": capacidade or 0, "atualizacao": time.monotonic()}
+
+    class MockHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlparse(self.path)
+
+            # Latência simulada, sorteio de erro e consumo de ficha da capacidade
+            with trava_gerador:
+                espera = latencia + gerador.uniform(0, jitter)
+                erro = gerador.random() < taxa_erro
+                limitada = False
+                if capacidade is not None:
+                    agora = time.monotonic()
+                    balde["fichas"] = min(capacidade, balde["fichas"] + (agora - balde["atualizacao"]) * capacidade)
+                    balde["atualizacao"] = agora
+                    limitada = balde["fichas"] < 1
+                    if limitada:
+                        servidor.n_limitadas += 1
+                    else:
+                        balde["fichas"] -= 1
+            time.sleep(espera)
+
+            if limitada:
+                return self.send_json({"message": "limite de requisições"}, 429)
+
+            if erro:
+                return self.send_json({"message": "erro simulado"}, status_erro)
+
+            # Estatísticas do Mais Retorno: mesma resposta gravada, com o cnpj pedido
+            if url.path.startswith("/v3/general/stats/"):
+                ativo = url.path.rsplit("/", 1)[-1].split(":")[0]
+                return self.send_json(dict(resposta_maisretorno, cnpj = ativo), 200)
+
+            # Lista de fundos do BTG: página com os cnpjs do universo
+            if url.path.endswith("/funds/list"):
+                parametros = parse_qs(url.query)
+                page = int(parametros["page"][0])
+                size = int(parametros["size"][0])
+                items = []
+                for cnpj in cnpjs_btg[(page - 1) * size:page * size]:
+                    item = copy.deepcopy(item_btg)
+                    item["CNPJ"] = int(cnpj)
+                    items.append(item)
+                return self.send_json({"items": items}, 200)
+
+            return self.send_json({"message": "não encontrado"}, 404)
+
+        def send_json(self, corpo, status):
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if status in [429, 503] and retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, format, *args):
+            return None
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    servidor.n_limitadas = 0
+
+    return servidor
+
+
+# Função que mede o tempo de cada requisição HTTP feita pelos webscrappings
+def instrument_requests():
+    """
+    Função que mede o tempo de cada requisição HTTP feita pelos webscrappings
+
+    Args:
+        None
+
+    Returns:
+        list: Lista preenchida com a duração (em segundos) de cada requisição
+    """
+    import requests
+
+    list_latencias = []
+    send_original = requests.Session.send
+
+    def send_medido(self, request, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return send_original(self, request, **kwargs)
+        finally:
+            list_latencias.append(time.perf_counter() - inicio)
+
+    requests.Session.send = send_medido
+
+    return list_latencias
+
+
+# Função que mede o pico de memória do processo em MB
+def peak_rss_mb():
+    """
+    Função que mede o pico de memória do processo em MB
+
+    Args:
+        None
+
+    Returns:
+        float: Pico de memória residente (RSS) em MB
+    """
+    import resource
+
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # No macOS o valor é em bytes, no Linux em KB
+    return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+
+
+# Função que executa um cenário do benchmark no processo atual
+def run_scenario(
+    cenario: str,
+    n_ativos: int,
+    latencia: float,
+    jitter: float,
+    taxa_erro: float,
+    status_erro: int,
+    capacidade: float,
+    retry_after: float,
+    taxa_maxima: float,
+    seed: int
+):
+    """
+    Função que executa um cenário do benchmark no processo atual
+
+    Args:
+        cenario (str): "maisretorno", "btg" ou "all"
+        n_ativos (int): Quantidade de ativos do universo
+        latencia (float): Latência base do servidor local em segundos
+        jitter (float): Variação máxima da latência em segundos
+        taxa_erro (float): Probabilidade de erro em cada resposta
+        status_erro (int): Status HTTP dos erros
+        capacidade (float): Requisições por segundo aceitas pelo servidor local (None = sem limite)
+        retry_after (float): Segundos do header Retry-After (None = sem header)
+        taxa_maxima (float): Taxa máxima do controle adaptativo da ferramenta em req/s
+        seed (int): Semente dos geradores de números aleatórios
+
+    Returns:
+        dict: Métricas do cenário
+    """
+    # Importa a ferramenta a partir da pasta do projeto
+    os.chdir(project_path)
+    sys.path.append(project_path)
+    import FerramentaInvestimento as fi
+
+    pasta_universo = tempfile.mkdtemp()
+    cnpjs = create_universe(n_ativos, pasta_universo, seed)
+
+    # Servidor local em segundo plano
+    servidor = create_mock_server(cnpjs, latencia, jitter, taxa_erro, status_erro, capacidade, retry_after, seed)
+    threading.Thread(target = servidor.serve_forever, daemon = True).start()
+    endereco = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    # Aponta a ferramenta para o universo sintético e para o servidor local, começando na taxa máxima
+    fi.input_path = pasta_universo
+    fi.SLEEP_SECONDS = 0
+    fi.TAXA_MAXIMA_REQUISICOES = taxa_maxima
+    fi.URL_MAISRETORNO_STATS = endereco + "/v3/general/stats/{ativo}:fi"
+    fi.URL_BTG_FUNDOS = endereco + "/services/api/funds-public/public/funds/list"
+    max_products_btg = int(np.ceil(n_ativos / SIZE_PER_PAGE_BTG) * SIZE_PER_PAGE_BTG)
+    list_latencias = instrument_requests()
+
+    # Executa o webscrapping do cenário
+    inicio = time.perf_counter()
+    if cenario == "maisretorno":
+        df_result, dm_ativos, dm_ativos_not_found, list_not_found = fi.webscrapping_maisretorno(list_categorias)
+        n_resultado = len(df_result)
+    elif cenario == "btg":
+        df_result = fi.webscrapping_btg(max_products_btg, SIZE_PER_PAGE_BTG)
+        n_resultado = len(df_result)
+    else:
+        resultado = fi.webscrapping_all(list_categorias, None, max_products_btg, SIZE_PER_PAGE_BTG)
+        n_resultado = len(resultado[0])
+    duracao = time.perf_counter() - inicio
+
+    servidor.shutdown()
+
+    return {
+        "cenario": cenario,
+        "n_ativos": n_ativos,
+        "n_resultado": n_resultado,
+        "requisicoes": len(list_latencias),
+        "tempo_s": round(duracao, 3),
+        "throughput_req_s": round(len(list_latencias) / duracao, 1),
+        "limitadas_429": servidor.n_limitadas,
+        "aceitas_req_s": round((len(list_latencias) - servidor.n_limitadas) / duracao, 1),
+        "latencia_p50_ms": round(float(np.percentile(list_latencias, 50)) * 1000, 1) if list_latencias else None,
+        "latencia_p95_ms": round(float(np.percentile(list_latencias, 95)) * 1000, 1) if list_latencias else None,
+        "pico_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+# Função que executa um cenário em um processo separado e retorna suas métricas
+def run_scenario_subprocess(
+    cenario: str,
+    n_ativos: int,
+    args: argparse.Namespace
+):
+    """
+    Função que executa um cenário em um processo separado e retorna suas métricas
+
+    Args:
+        cenario (str): "maisretorno", "btg" ou "all"
+        n_ativos (int): Quantidade de ativos do universo
+        args (argparse.Namespace): Parâmetros do servidor local
+
+    Returns:
+        dict: Métricas do cenário, ou None caso o processo falhe
+    """
+    comando = [
+        sys.executable, os.path.abspath(__file__),
+        "--executar-cenario", cenario,
+        "--tamanhos", str(n_ativos),
+        "--latencia", str(args.latencia),
+        "--jitter", str(args.jitter),
+        "--taxa-erro", str(args.taxa_erro),
+        "--status-erro", str(args.status_erro),
+        "--taxa-maxima", str(args.taxa_maxima),
+        "--seed", str(args.seed)
+    ]
+    comando += [] if args.capacidade is None else ["--capacidade", str(args.capacidade)]
+    comando += [] if args.retry_after is None else ["--retry-after", str(args.retry_after)]
+    processo = subprocess.run(comando, capture_output = True, text = True)
+
+    # A última linha com o prefixo contém o resultado em JSON
+    for linha in reversed(processo.stdout.splitlines()):
+        if linha.startswith(PREFIXO_RESULTADO):
+            return json.loads(linha[len(PREFIXO_RESULTADO):])
+
+    print(f"Erro no cenário {cenario} ({n_ativos} ativos):\n{processo.stderr[-2000:]}")
+
+    return None
+
+
+# Função que le os argumentos da linha de comando
+def parse_args():
+    """
+    Função que le os argumentos da linha de comando
+
+    Args:
+        None
+
+    Returns:
+        argparse.Namespace: Argumentos
+    """
+    parser = argparse.ArgumentParser(description = "Benchmark dos webscrappings com servidor local de respostas gravadas")
+    parser.add_argument("--cenarios", default = ",".join(CENARIOS), help = "Cenários separados por vírgula (maisretorno, btg, all)")
+    parser.add_argument("--tamanhos", default = ",".join(str(tamanho) for tamanho in TAMANHOS), help = "Quantidades de ativos separadas por vírgula")
+    parser.add_argument("--latencia", type = float, default = 0.02, help = "Latência base das respostas em segundos")
+    parser.add_argument("--jitter", type = float, default = 0.01, help = "Variação máxima da latência em segundos")
+    parser.add_argument("--taxa-erro", type = float, default = 0.0, help = "Probabilidade de erro em cada resposta")
+    parser.add_argument("--status-erro", type = int, default = 500, help = "Status HTTP devolvido nos erros")
+    parser.add_argument("--capacidade", type = float, default = None, help = "Requisições por segundo aceitas pelo servidor local; acima disso responde 429")
+    parser.add_argument("--retry-after", type = float, default = None, help = "Segundos enviados no header Retry-After das respostas 429/503")
+    parser.add_argument("--taxa-maxima", type = float, default = 1000.0, help = "Taxa máxima (req/s) do controle adaptativo da ferramenta")
+    parser.add_argument("--seed", type = int, default = 0, help = "Semente dos geradores de números aleatórios")
+    parser.add_argument("--saida", default = None, help = "Arquivo JSON onde os resultados são gravados")
+    parser.add_argument("--executar-cenario", default = None, help = argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+
+# -------------------------------------------------------------- 04. PIPELINE --------------------------------------------------------------
+
+
+
+if __name__ == "__main__":
+
+    args = parse_args()
+
+    # Processo filho: executa um único cenário e imprime o resultado
+    if args.executar_cenario is not None:
+        resultado = run_scenario(args.executar_cenario, int(args.tamanhos), args.latencia, args.jitter, args.taxa_erro, args.status_erro, args.capacidade, args.retry_after, args.taxa_maxima, args.seed)
+        print(PREFIXO_RESULTADO + json.dumps(resultado))
+        sys.exit(0)
+
+    # Processo principal: executa todos os cenários e mostra a tabela de resultados
+    list_resultados = []
+    for cenario in args.cenarios.split(","):
+        for n_ativos in [int(tamanho) for tamanho in args.tamanhos.split(",")]:
+            print(f"Executando {cenario} com {n_ativos} ativos...")
+            resultado = run_scenario_subprocess(cenario, n_ativos, args)
+            if resultado is not None:
+                list_resultados.append(resultado)
+                print(json.dumps(resultado))
+
+    # Tabela final
+    colunas = ["cenario", "n_ativos", "n_resultado", "requisicoes", "tempo_s", "throughput_req_s", "limitadas_429", "aceitas_req_s", "latencia_p50_ms", "latencia_p95_ms", "pico_rss_mb"]
+    print("\n" + " | ".join(f"{coluna:>16}" for coluna in colunas))
+    for resultado in list_resultados:
+        print(" | ".join(f"{str(resultado[coluna]):>16}" for coluna in colunas))
+
+    # Grava resultados para comparação futura
+    if args.saida is not None:
+        with open(args.saida, "w") as file:
+            json.dump({"parametros": vars(args), "resultados": list_resultados}, file, indent = 2)
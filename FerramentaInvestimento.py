@@ -37,17 +37,45 @@ import streamlit as st
 
 # Bibliotecas de manipulação de dados e webscrapping
 import http.client
+import queue                                                                                                                                # Fila de eventos de progresso dos webscrappings em segundo plano
+import threading                                                                                                                            # Execução dos webscrappings em segundo plano
+import uuid                                                                                                                                 # Identificador de cada sessão inscrita em um webscrapping compartilhado
 import requests
 import json
+import re                                                                                                                                   # Identifica as pastas de snapshots datados ("YYYY-MM")
+import warnings                                                                                                                             # Silencia avisos de carteiras sem meses suficientes no backtest
+import hashlib                                                                                                                              # Hash dos arquivos carregados (chave do cache de uploads)
+from collections import deque                                                                                                               # Fila de ativos a consultar (ativos limitados pelo servidor voltam para o fim)
+from email.utils import parsedate_to_datetime                                                                                               # Leitura do header Retry-After quando enviado como data
 
 # Bibliotecas para manipulação de datas e horas
 import time                                                                                                                                 # Biblioteca que permite realizar operações relacionadas com tempo 
 from   datetime import timedelta                                                                                                            # Biblioteca para calcular duração de trechos do código
 from   datetime import datetime                                                                                                             # Biblioteca para dizer data de hoje
+import cProfile                                                                                                                             # Profiling das etapas de cada rerun (modo de desenvolvimento)
+import pstats
+from contextlib import contextmanager
 
 # Biblioteca para criar gráficos
 import plotly.express as px
 import plotly.io as pio
+import plotly.graph_objects as go
+
+# Bibliotecas para armazenamento colunar do histórico de webscrappings
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Biblioteca para otimização de carteira
+from scipy.optimize import minimize                                                                                                         # Solver de programação quadrática (SLSQP)
+from scipy import sparse                                                                                                                    # Matriz esparsa (fundos x n-gramas) do índice de busca
+
+# Processamento em paralelo
+from concurrent.futures import ProcessPoolExecutor                                                                                         # Pool de processos para decodificar as respostas dos webscrappings
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing                                                                                                                      # Processos criados por spawn (fork a partir das threads de webscrapping pode travar)
+from Workers_Processamento import (                                                                                                          # Funções executadas nos processos do pool
+    dict_rename_maisretorno, decode_maisretorno_batch, build_backtest_weights, backtest_portfolios, init_backtest_worker, backtest_worker
+)
 
 # Adiciona o caminho para a pasta principal ao caminho do sistema
 sys.path.append(os.path.join(os.path.dirname(sys.path[0])))
@@ -63,6 +91,10 @@ os.chdir(wdir)
 # Cria um caminho para puxar os dados brutos e outro para o armazenamento dos resultados
 input_path = wdir + "/01. Input"
 output_path = wdir + "/02. Output"
+retornos_path = output_path + "/Retornos"
+historico_path = output_path + "/Historico"
+dataset_path = output_path + "/Dataset"
+profiles_path = output_path + "/Profiles"
 
 
 # --------------------------------------------------------------- 02. COCKPIT --------------------------------------------------------------
@@ -77,24 +109,209 @@ headers = { 'User-Agent': "insomnia/8.6.1" }
 # Nome das categorias da SuperCarteira
 list_categorias = ["ANTIFRAGILIDADE", "DIVERSIFICACAO", "ESTABILIDADE", "VALORIZACAO", "OUTROS"]
 
-# Tempo de espera entre requisições
+# Tempo de espera entre requisições (define a taxa inicial do controle adaptativo)
 SLEEP_SECONDS = 2
 
+# Controle adaptativo da taxa de requisições (AIMD: aumento aditivo enquanto o servidor responde bem, redução multiplicativa quando limita)
+TAXA_MINIMA_REQUISICOES = 0.1                                                                                                               # Requisições por segundo
+TAXA_MAXIMA_REQUISICOES = 5.0                                                                                                               # Requisições por segundo
+AUMENTO_TAXA_REQUISICOES = 0.05                                                                                                             # Aumento da taxa (req/s) a cada resposta bem sucedida
+FATOR_REDUCAO_TAXA = 0.5                                                                                                                    # Multiplica a taxa a cada resposta de limite (429/503)
+STATUS_LIMITE_REQUISICOES = [429, 503]                                                                                                      # Status HTTP que indicam que o servidor está limitando as requisições
+MAX_TENTATIVAS_LIMITE = 5                                                                                                                   # Vezes que um ativo limitado volta para a fila antes de ser considerado não encontrado
+
+# Decodificação das respostas em um pool de processos
+N_PROCESSOS_DECODIFICACAO = min(4, os.cpu_count() or 1)                                                                                    # Processos do pool
+TAMANHO_LOTE_DECODIFICACAO = 50                                                                                                             # Respostas enviadas de uma vez para cada processo (lotes menores são decodificados no próprio processo)
+
+# Intervalo mínimo (em segundos) entre atualizações da tela com o progresso dos webscrappings
+INTERVALO_ATUALIZACAO_UI = 1.0
+
+# Webscrappings compartilhados entre sessões: pedidos iguais (mesma fonte, categorias, parâmetros e arquivos de entrada) usam um único webscrapping
+JANELA_VALIDADE_WEBSCRAPPING_MIN = 30                                                                                                       # Webscrappings concluídos há menos minutos que isto são reaproveitados sem um novo webscrapping
+TEMPO_INSCRICAO_INATIVA_S = 30                                                                                                              # Sessões sem acompanhar o progresso há mais segundos que isto (aba fechada, sessão expirada) deixam de contar como inscritas
+
+# Preview do webscrapping do Mais Retorno: amostra estratificada por categoria da SuperCarteira (respostas reaproveitadas pelo webscrapping completo)
+TAMANHO_AMOSTRA_PREVIEW = 10                                                                                                                # Fundos sorteados em cada categoria
+FRACAO_AMOSTRA_PREVIEW = 0.05                                                                                                               # Fração sorteada de cada categoria, quando escolhida no lugar do tamanho
+SEED_AMOSTRA_PREVIEW = 0                                                                                                                    # Semente do sorteio (mesma semente, mesma amostra)
+
+# Headers usados nas requisições à API do Mais Retorno
+HEADERS_MAISRETORNO = {
+    "Accept": "application/json, text/plain, */*",
+    "Referer": "https://maisretorno.com/",
+    "sec-ch-ua": '"Chromium";v="134", "Not:A-Brand";v="24", "Google Chrome";v="134"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"macOS"',
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
+}
+
+# Endpoints dos webscrappings (podem ser trocados, por exemplo, pelo servidor local do benchmark)
+URL_MAISRETORNO_STATS = "https://api.maisretorno.com/v3/general/stats/{ativo}:fi"
+URL_BTG_FUNDOS = "https://investimentos.btgpactual.com/services/api/funds-public/public/funds/list"
+
+# Parametros para série histórica de retornos mensais do Mais Retorno
+URL_MAISRETORNO_RETORNOS = "https://api.maisretorno.com/v3/general/profitability/{ativo}:fi/monthly"                                       # Endpoint com a rentabilidade mensal do ativo
+CAMPO_DATA_RETORNOS = "date"                                                                                                                # Campo com a data (mês) de cada registro
+CAMPO_VALOR_RETORNOS = "profitability"                                                                                                      # Campo com a rentabilidade do mês (em %)
+MIN_MESES_CORRELACAO = 12                                                                                                                   # Quantidade mínima de meses em comum para usar a correlação entre dois ativos
+
 # Define as opções de score que podem ser escolhidas
 SCORE_OPTIONS = ["12m", "36m", "60m", "begin"]
-TOOLTIP_SIMPLE_COLUMNS = ["name", "profitability", "volatility", "categoria"]
+TOOLTIP_SIMPLE_COLUMNS = ["name", "profitability", "volatility", "categoria", "risk_metric", "cluster"]
+
+# Define as métricas de risco calculadas a partir das séries de retornos mensais
+JANELAS_SHARPE = [12, 36, 60]
+RISK_METRIC_OPTIONS = ["sortino", "calmar", "max_drawdown", "downside_deviation"] + [f"sharpe_rolling_{janela}m" for janela in JANELAS_SHARPE]
+COLOR_OPTIONS = ["categoria", "risk_metric", "cluster"]
+
+# Parametros para clusterização dos fundos (k-means sobre métricas e, quando há painel de retornos, sobre as séries mensais)
+N_CLUSTERS_PADRAO = 8                                                                                                                       # Quantidade de clusters sugerida
+MAX_CLUSTERS = 30                                                                                                                           # Quantidade máxima de clusters escolhida pelo usuário
+MAX_ITERACOES_KMEANS = 100                                                                                                                  # Iterações máximas do k-means
+SEED_CLUSTER = 0                                                                                                                            # Semente da inicialização (k-means++), para clusters estáveis entre reruns
+MESES_CLUSTER = 60                                                                                                                          # Meses mais recentes do painel de retornos usados na clusterização
+PESO_CORRELACAO_CLUSTER = 1.0                                                                                                               # Peso das séries de retornos (correlação) em relação às métricas (1.0 = mesma variância total dos dois blocos)
+
+# Parametros para ranking dos melhores fundos por categoria
+RANKING_OPTIONS = [f"score_{score}" for score in SCORE_OPTIONS] + ["score_mean", "score_all"] + RISK_METRIC_OPTIONS                      # Colunas que podem ordenar o ranking
+RANKING_MENOR_MELHOR = ["downside_deviation"]                                                                                               # Colunas em que o menor valor é o melhor
+TOP_K_PADRAO = 10                                                                                                                           # Quantidade de fundos por categoria sugerida
+
+# Parametros para busca de fundos por nome, gestora, ISIN ou CNPJ
+N_GRAMA_BUSCA = 3                                                                                                                           # Tamanho dos n-gramas do índice
+MAX_RESULTADOS_BUSCA = 20                                                                                                                   # Quantidade de fundos retornados por busca
+RELEVANCIA_MINIMA_BUSCA = 0.3                                                                                                               # Fração mínima dos n-gramas da busca encontrados no fundo
+BONUS_PREFIXO_BUSCA = 0.5                                                                                                                   # Bônus de relevância quando alguma palavra do fundo começa com a busca
+
+# Modo de profiling (desenvolvimento): ativado pela variável de ambiente ou pelo botão no fim da sidebar
+VARIAVEL_AMBIENTE_PROFILING = "FERRAMENTA_PROFILING"                                                                                        # Valor "1" ativa o profiling de todos os reruns
+N_HOTSPOTS_PROFILING = 20                                                                                                                   # Quantidade de funções mostradas na lista de hotspots
+
+# Schema compacto dos DataFrames de resultados, aplicado na construção e na leitura (colunas ausentes são ignoradas)
+SCHEMA_RESULTADO = {
+    "name": "str",
+    "cnpj": "int64",
+    "categoria": "category",
+    "managementCompany": "category",
+    "positive_months": "Int16",
+    "negative_months": "Int16",
+    "total_months": "Int16",
+    "disponibilidade_btg": "bool"
+}
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5                                                                                                        # Colunas de texto fora do schema viram category quando (valores distintos / linhas) <= limite
+
+# Uploads de resultados: formatos aceitos e colunas sem as quais a análise não funciona (as demais colunas do template são opcionais)
+FORMATOS_UPLOAD = ["xlsx", "csv", "parquet"]
+COLUNAS_OBRIGATORIAS_RESULTADO = ["name", "categoria", "cnpj"] + [f"{medida}_{score}" for score in SCORE_OPTIONS for medida in ["profitability", "volatility"]]
+
+# Resumo por categoria (materializado uma vez por versão dos dados)
+QUANTIS_RESUMO = [0, 0.25, 0.5, 0.75, 1]                                                                                                    # Quantis de cada medida (0 e 1 são o mínimo e o máximo, usados nos limites da sidebar)
+MEDIDAS_RESUMO = ["profitability", "volatility", "score"]                                                                                   # Medidas resumidas em cada horizonte de SCORE_OPTIONS
+CATEGORIA_TOTAL_RESUMO = "Todas"                                                                                                            # Linha do resumo com o universo inteiro
+
+# Histórico de webscrappings (uma partição run_date=YYYY-MM-DD com os dados e o índice de cada execução)
+SUFIXO_INDICE_HISTORICO = ".indice.parquet"                                                                                                 # Índice (cnpj, run_date) gravado ao lado do arquivo de dados de cada execução
+
+# Versões do dataset compartilhado mantidas em disco (a atual e a anterior, que ainda pode estar em uso por alguma sessão)
+MAX_VERSOES_DATASET = 2
 
 # Parametros para webscrapping do BTG
 SIZE_PER_PAGE_BTG = 150
 MAX_PRODUCTS_BTG = 750
 MAX_PAGES_BTG = int(MAX_PRODUCTS_BTG / SIZE_PER_PAGE_BTG)
 
+# Parametros para otimização de carteira
+TAXA_LIVRE_RISCO = 10.0                                                                                                                     # Taxa livre de risco em % a.a. (referência CDI)
+CORRELACAO_PADRAO = 0.3                                                                                                                     # Correlação assumida entre ativos quando não há matriz de correlação
+MAX_PESO_ATIVO = 0.25                                                                                                                       # Peso máximo de um único ativo na carteira
+MAX_ATIVOS_POR_CATEGORIA_OTIMIZACAO = 20                                                                                                    # Quantidade de ativos por categoria (melhores scores) considerados na otimização
+N_PONTOS_FRONTEIRA = 25                                                                                                                     # Quantidade de pontos calculados na fronteira eficiente
+MESES_HORIZONTE = {"12m": 12, "36m": 36, "60m": 60}                                                                                        # Quantidade de meses de cada horizonte de dados
+
+# Parametros para simulação de Monte Carlo da carteira
+N_SIMULACOES_PADRAO = 100000                                                                                                                # Quantidade de caminhos simulados
+MESES_SIMULACAO_PADRAO = 60                                                                                                                 # Horizonte da simulação em meses
+PERCENTIS_SIMULACAO = [5, 25, 50, 75, 95]                                                                                                   # Percentis mostrados nas bandas
+SEED_SIMULACAO = 0                                                                                                                          # Semente do gerador (mesmos parâmetros, mesmos caminhos)
+MAX_MEMORIA_BLOCO_SIMULACAO_MB = 64                                                                                                         # Memória máxima dos sorteios de cada bloco de caminhos
+N_FAIXAS_HISTOGRAMA_SIMULACAO = 4096                                                                                                        # Faixas (em log do valor) do histograma de cada mês usado nos percentis, sem guardar todos os caminhos
+
+# Parametros para backtest das carteiras da SuperCarteira (snapshots em "01. Input/<YYYY-MM>/")
+PADRAO_PASTA_SNAPSHOT = r"^\d{4}-\d{2}$"                                                                                                    # Nome das pastas com snapshots datados
+ESQUEMAS_PESOS_BACKTEST = ["igual", "score"]                                                                                                # Pesos iguais ou proporcionais ao score_all da data
+TOP_N_BACKTEST = [None, 5, 10]                                                                                                              # Quantidade de ativos de maior score mantidos por categoria (None = todos)
+HORIZONTES_BACKTEST = [12, 24, 36]                                                                                                          # Meses acompanhados após cada snapshot
+
 
 
 # -------------------------------------------------------------- 03. FUNCTIONS -------------------------------------------------------------
 
 
 
+######## Schema dos Resultados ########
+# Função que converte o cnpj (texto com ou sem pontuação, ou número) para inteiro
+def cnpj_to_int(
+    cnpj: pd.Series
+):
+    """
+    Função que converte o cnpj (texto com ou sem pontuação, ou número) para inteiro
+
+    Args:
+        cnpj (pd.Series): Coluna de cnpj
+
+    Returns:
+        pd.Series: cnpj como int64 (ou Int64 caso algum cnpj seja inválido)
+    """
+    if pd.api.types.is_numeric_dtype(cnpj) == False:
+        cnpj = pd.to_numeric(cnpj.astype(str).str.replace(r"\D", "", regex = True), errors = "coerce")
+
+    return cnpj.astype("Int64") if cnpj.isnull().any() else cnpj.astype(np.int64)
+
+
+# Função que aplica o schema compacto aos DataFrames de resultados
+def apply_result_schema(
+    df_result: pd.DataFrame,
+    schema: dict = SCHEMA_RESULTADO
+):
+    """
+    Função que aplica o schema compacto aos DataFrames de resultados
+
+    Colunas do schema recebem o tipo definido nele; as demais colunas float viram float32 e as de texto com
+    poucos valores distintos (categoria, gestora, tipo...) viram category.
+
+    Args:
+        df_result (pd.DataFrame): DataFrame de resultados (Mais Retorno, BTG, join ou arquivo carregado)
+        schema (dict): Tipo de cada coluna conhecida
+
+    Returns:
+        pd.DataFrame: Cópia do DataFrame com os tipos compactos
+    """
+    df_result = df_result.copy()
+
+    for column in df_result.columns:
+        tipo = schema.get(column)
+
+        if column == "cnpj":
+            df_result[column] = cnpj_to_int(df_result[column])
+        elif tipo == "bool":
+            df_result[column] = df_result[column].fillna(False).astype(bool)
+        elif tipo is not None and tipo.startswith("Int"):
+            df_result[column] = pd.to_numeric(df_result[column], errors = "coerce").round().astype(tipo)
+        elif tipo is not None:
+            df_result[column] = df_result[column].astype(tipo)
+        elif pd.api.types.is_float_dtype(df_result[column]):
+            df_result[column] = df_result[column].astype(np.float32)
+        elif pd.api.types.is_string_dtype(df_result[column]) and len(df_result) > 0:
+            try:
+                if df_result[column].nunique() / len(df_result) <= LIMITE_CARDINALIDADE_CATEGORIA:
+                    df_result[column] = df_result[column].astype("category")
+            except TypeError:
+                pass                                                                                                                        # Colunas com listas/dicionários (ex.: json do BTG) ficam como estão
+
+    return df_result
+
+
 ######### Webscrapping ########
 # Função que pega cnpj de gestora de fundos de investimento desta categoria e adiciona ao df de ativos
 def get_cnpj(
@@ -194,6 +411,49 @@ def calculate_std(
         return np.std(scores)
 
 
+# Função que calcula os scores de todos os ativos de uma vez
+def calculate_scores(
+    df_result: pd.DataFrame
+):
+    """
+    Função que calcula os scores de todos os ativos de uma vez (mesmo resultado de calculate_mean e calculate_std linha a linha)
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com rentabilidade, volatilidade e meses positivos/negativos de cada ativo
+
+    Returns:
+        pd.DataFrame: DataFrame com os scores por horizonte, média, desvio padrão, score_all e estatísticas de meses
+    """
+    # Score de cada horizonte
+    df_result = (
+        df_result
+        .assign(score_12m = lambda _: _.profitability_12m / _.volatility_12m)
+        .assign(score_36m = lambda _: _.profitability_36m / _.volatility_36m)
+        .assign(score_60m = lambda _: _.profitability_60m / _.volatility_60m)
+        .assign(score_begin = lambda _: _.profitability_begin / _.volatility_begin)
+    )
+
+    # Média e desvio padrão ignorando valores nulos; com somente um score disponível o desvio padrão é o score_begin
+    scores = df_result[["score_12m", "score_36m", "score_60m", "score_begin"]].to_numpy(dtype = float)
+    n_nulos = np.isnan(scores).sum(axis = 1)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        soma = np.nansum(scores, axis = 1)
+        score_mean = np.where(n_nulos < 4, soma / (4 - n_nulos), np.nan)
+        desvios = np.where(np.isnan(scores), 0, scores - score_mean[:, None])
+        score_std = np.where(n_nulos < 4, np.sqrt((desvios ** 2).sum(axis = 1) / (4 - n_nulos)), np.nan)
+    score_std = np.where(n_nulos == 3, df_result["score_begin"].to_numpy(dtype = float), score_std)
+
+    return (
+        df_result
+        .assign(score_mean = score_mean)
+        .assign(score_std = score_std)
+        .assign(score_all = lambda _: _.score_mean / _.score_std)
+        .assign(total_months = lambda _: _.positive_months + _.negative_months)
+        .assign(perc_positive_months = lambda _: _.positive_months / _.total_months)
+        .assign(perc_negative_months = lambda _: _.negative_months / _.total_months)
+    )
+
+
 # Função que faz com que itens string dentro de uma lista se fornem integer
 def string_to_int(
     string_list
@@ -210,6 +470,133 @@ def string_to_int(
     return [int(item) for item in string_list]
 
 
+# Função que converte o header Retry-After (segundos ou data HTTP) em segundos de espera
+def retry_after_seconds(
+    retry_after: str
+):
+    """
+    Função que converte o header Retry-After (segundos ou data HTTP) em segundos de espera
+
+    Args:
+        retry_after (str): Valor do header, ou None
+
+    Returns:
+        float: Segundos de espera, ou None caso o header não exista ou seja inválido
+    """
+    if retry_after is None:
+        return None
+
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        data_retry = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+    return max((data_retry - datetime.now(tz = data_retry.tzinfo)).total_seconds(), 0.0)
+
+
+# Controle adaptativo (AIMD) da taxa de requisições a um servidor
+class AdaptiveRateLimiter:
+    """
+    Controle adaptativo (AIMD) da taxa de requisições a um servidor
+
+    A cada resposta bem sucedida a taxa aumenta AUMENTO_TAXA_REQUISICOES req/s; a cada 429/503 ela é multiplicada por
+    FATOR_REDUCAO_TAXA e as próximas requisições esperam o Retry-After, quando enviado. Com isso a taxa oscila logo abaixo
+    do limite que o servidor aceita.
+
+    Args:
+        taxa_inicial (float): Requisições por segundo no início, caso None usa 1 / SLEEP_SECONDS
+        taxa_minima (float): Menor taxa permitida, caso None usa TAXA_MINIMA_REQUISICOES
+        taxa_maxima (float): Maior taxa permitida, caso None usa TAXA_MAXIMA_REQUISICOES
+    """
+
+    def __init__(
+        self,
+        taxa_inicial: float = None,
+        taxa_minima: float = None,
+        taxa_maxima: float = None
+    ):
+        self.taxa_minima = TAXA_MINIMA_REQUISICOES if taxa_minima is None else taxa_minima
+        self.taxa_maxima = TAXA_MAXIMA_REQUISICOES if taxa_maxima is None else taxa_maxima
+        if taxa_inicial is None:
+            taxa_inicial = 1 / SLEEP_SECONDS if SLEEP_SECONDS > 0 else self.taxa_maxima
+        self.taxa = min(max(taxa_inicial, self.taxa_minima), self.taxa_maxima)
+        self.proxima_requisicao = time.monotonic()
+        self.n_sucessos = 0
+        self.n_limitadas = 0
+        self._lock = threading.Lock()
+
+    # Espera até o horário da próxima requisição e reserva o horário seguinte
+    def wait(self):
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self.proxima_requisicao)
+            self.proxima_requisicao = horario + 1 / self.taxa
+        time.sleep(horario - agora)
+
+    # Ajusta a taxa de acordo com a resposta e retorna True caso o servidor tenha limitado a requisição
+    def register_response(self, response: requests.Response):
+        with self._lock:
+            if response.status_code in STATUS_LIMITE_REQUISICOES:
+                self.taxa = max(self.taxa * FATOR_REDUCAO_TAXA, self.taxa_minima)
+                espera = retry_after_seconds(response.headers.get("Retry-After"))
+                self.proxima_requisicao = max(self.proxima_requisicao, time.monotonic() + (1 / self.taxa if espera is None else espera))
+                self.n_limitadas += 1
+                return True
+
+            if response.ok:
+                self.taxa = min(self.taxa + AUMENTO_TAXA_REQUISICOES, self.taxa_maxima)
+                self.n_sucessos += 1
+
+            return False
+
+
+# Respostas cruas do Mais Retorno guardadas por um preview para serem reaproveitadas pelo webscrapping completo
+class ResponseCache:
+    """
+    Respostas cruas do Mais Retorno guardadas por um preview para serem reaproveitadas pelo webscrapping completo
+
+    Somente respostas bem sucedidas são guardadas; respostas mais antigas que a janela de validade são descartadas na leitura.
+
+    Args:
+        JANELA_VALIDADE_WEBSCRAPPING_MIN (float): Minutos em que uma resposta guardada é reaproveitada
+    """
+
+    def __init__(
+        self,
+        JANELA_VALIDADE_WEBSCRAPPING_MIN: float = JANELA_VALIDADE_WEBSCRAPPING_MIN
+    ):
+        self.janela_validade = timedelta(minutes = JANELA_VALIDADE_WEBSCRAPPING_MIN)
+        self.respostas = {}
+        self.n_reaproveitadas = 0
+        self._lock = threading.Lock()
+
+    # Guarda a resposta de um ativo
+    def put(self, ativo, conteudo: bytes):
+        with self._lock:
+            self.respostas[str(ativo)] = (datetime.now(), conteudo)
+
+    # Retorna a resposta guardada de um ativo, ou None caso não exista ou tenha expirado
+    def get(self, ativo):
+        with self._lock:
+            horario, conteudo = self.respostas.get(str(ativo), (None, None))
+            if horario is None:
+                return None
+            if datetime.now() - horario > self.janela_validade:
+                del self.respostas[str(ativo)]
+                return None
+            self.n_reaproveitadas += 1
+            return conteudo
+
+    # Representação fixa: o cache faz parte dos argumentos dos webscrappings, que compõem a chave do registro de webscrappings
+    def __repr__(self):
+        return "ResponseCache()"
+
+
 # Função que executa o webscrapping
 def webscrapping_maisretorno_old(
     list_categorias: list,
@@ -369,169 +756,445 @@ def webscrapping_maisretorno_old(
     return df_result, dm_ativos, dm_ativos_not_found, list_not_found
 
 
-# Função que executa o webscrapping
-def webscrapping_maisretorno(
-    list_categorias: list,
-    tab_webscrapping: st.tabs
+# Função que le os arquivos da SuperCarteira e monta o mapeamento (muitos para muitos) entre fundos e categorias
+def load_supercarteira_ativos(
+    list_categorias: list
 ):
     """
-    Função que executa o webscrapping
+    Função que le os arquivos da SuperCarteira e monta o mapeamento (muitos para muitos) entre fundos e categorias
 
     Args:
         list_categorias (list): Lista de categorias de ativos
 
     Returns:
-        df_result: DataFrame com dados limpos para criar gráficos
-        dm_ativos: DataFrame com CNPJ de gestoras de fundos de investimento
-        dm_ativos_not_found: Lista de ativos não encontrados
-        list_not_found: Lista de ativos não encontrados
+        dm_ativos: DataFrame com um par (cnpj, categoria) por linha, sem repetições
     """
-    # Abertura de listas vazias e contadores para o Loop
     dm_ativos = pd.DataFrame()
-    df_result = pd.DataFrame()
-    list_not_found = []
-    count = 0
-
-    # Dicionário que ajuda a renomear as colunas
-    dict_rename_maisretorno = {
-        "nicename": "name",
-        "cnpj": "cnpj",
-        "stats.positive_months": "positive_months",
-        "stats.negative_months": "negative_months",
-        "stats.timeframe.last_12_months.profitability": "profitability_12m",
-        "stats.timeframe.last_12_months.volatility": "volatility_12m",
-        "stats.timeframe.last_36_months.profitability": "profitability_36m",
-        "stats.timeframe.last_36_months.volatility": "volatility_36m",
-        "stats.timeframe.last_60_months.profitability": "profitability_60m",
-        "stats.timeframe.last_60_months.volatility": "volatility_60m",
-        "stats.timeframe.begin.profitability": "profitability_begin",
-        "stats.timeframe.begin.volatility": "volatility_begin",
-        "stats.timeframe.begin.sharpe_ratio": "sharpe_ratio_begin"
-    }
-
-    # Cria barra de progresso e percentual do progresso do webscrapping
-    progress_bar = tab_webscrapping.progress(0)
 
     # Para cada categoria de ativos da SuperCarteira, pega cnpj de gestora de fundos de investimento desta categoria
     for categoria in list_categorias:
         dm_ativos = get_cnpj(dm_ativos, f"{input_path}/SuperCarteira_{categoria}.json", categoria).reset_index(drop = True)
         # dm_ativos = dm_ativos.assign(Index = lambda _: _.index + 1).query("Index < 3").drop(columns = "Index")
-        
-    # Para cada ativo da SuperCarteira, pega rentabilidade e volatividade
-    for ativo in dm_ativos.cnpj:
 
-        # try, se nao funcionar, então guarda mensagem de erro e contagem de erro
-        try:
+    # Um mesmo fundo pode estar em mais de uma categoria: cada cnpj é consultado uma única vez e o resultado vale para todas elas
+    return dm_ativos.drop_duplicates(subset = ["cnpj", "categoria"]).reset_index(drop = True)
 
-            # Categoria do ativo
-            categoria = dm_ativos.query("cnpj == @ativo")["categoria"].values[0]
 
-            # Espera x segundos para não sobrecarregar o servidor
-            time.sleep(SLEEP_SECONDS)
-            count += 1
+# Função que sorteia uma amostra estratificada do mapeamento entre fundos e categorias
+def sample_supercarteira_ativos(
+    dm_ativos: pd.DataFrame,
+    tamanho_amostra: int = None,
+    fracao_amostra: float = None,
+    seed: int = SEED_AMOSTRA_PREVIEW
+):
+    """
+    Função que sorteia uma amostra estratificada do mapeamento entre fundos e categorias
 
-            # Parametros para realizar o webcrawling
-            url = f"https://api.maisretorno.com/v3/general/stats/{ativo}:fi"
-            querystring = {"format_decimal":"false"}
-            payload = ""
-            headers = {
-                "Accept": "application/json, text/plain, */*",
-                "Referer": "https://maisretorno.com/",
-                "sec-ch-ua": '"Chromium";v="134", "Not:A-Brand";v="24", "Google Chrome";v="134"',
-                "sec-ch-ua-mobile": "?0",
-                "sec-ch-ua-platform": '"macOS"',
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
-            }
+    Cada categoria recebe uma chave aleatória por fundo e mantém os fundos de menor chave, então todas as categorias são
+    sorteadas de uma vez e a mesma semente sempre gera a mesma amostra.
 
-            # Executa a busca da informação
-            response = requests.request("GET", url, data=payload, headers=headers, params=querystring)
+    Args:
+        dm_ativos (pd.DataFrame): Mapeamento (cnpj, categoria)
+        tamanho_amostra (int): Fundos sorteados em cada categoria (categorias menores entram inteiras)
+        fracao_amostra (float): Fração sorteada de cada categoria (ao menos um fundo), usada caso tamanho_amostra seja None
+        seed (int): Semente do sorteio
 
-            # Contabiliza progresso em barra e um texto com o percentual de progresso
-            print(f"count = {count}/{len(dm_ativos.cnpj)}", end = "\r")
-            progress_bar.empty()
-            progress_bar.progress(value = count / len(dm_ativos.cnpj), text = f"{count} dos {len(dm_ativos.cnpj)} ativos analisados")
+    Returns:
+        dm_amostra: Mapeamento (cnpj, categoria) somente com os fundos sorteados
+    """
+    rng = np.random.default_rng(seed)
+    tamanho_categoria = dm_ativos.groupby("categoria")["cnpj"].transform("size")
 
-            # Captura a informação desse ativo e ajusta o DataFrame
-            df_result_temp = (pd.json_normalize(response.json())
-                    .reset_index()
-                    .assign(cnpj = ativo)
-                    .rename(columns = dict_rename_maisretorno)
-                    .filter(list(dict_rename_maisretorno.values()))
-                    .assign(score_12m = lambda _: _.profitability_12m / _.volatility_12m)
-                    .assign(score_36m = lambda _: _.profitability_36m / _.volatility_36m)
-                    .assign(score_60m = lambda _: _.profitability_60m / _.volatility_60m)
-                    .assign(score_begin = lambda _: _.profitability_begin / _.volatility_begin)
-                    .assign(score_mean = lambda _: _.apply(calculate_mean, axis=1))  
-                    .assign(score_std = lambda _: _.apply(calculate_std, axis=1))  
-                    .assign(score_all = lambda _: _.score_mean / _.score_std)
-                    .sort_values(by = "score_all", ascending = False)
-                    .assign(total_months = lambda _: _.positive_months + _.negative_months)
-                    .assign(perc_positive_months = lambda _: _.positive_months / _.total_months)
-                    .assign(perc_negative_months = lambda _: _.negative_months / _.total_months)
-                    .assign(categoria = categoria)
-            )
+    # Quantidade sorteada em cada categoria
+    if tamanho_amostra is not None:
+        n_sorteados = np.minimum(tamanho_categoria, tamanho_amostra)
+    else:
+        n_sorteados = np.maximum(np.ceil(tamanho_categoria * fracao_amostra), 1)
 
-            # Junta ao DataFrame de resultados
-            df_result = pd.concat([df_result, df_result_temp], ignore_index=True)
+    # Posição de cada fundo na ordem aleatória da sua categoria
+    posicao = dm_ativos.assign(chave = rng.random(len(dm_ativos))).groupby("categoria")["chave"].rank(method = "first") - 1
 
-        # Caso não seja possível puxar algum dos ativos
-        except Exception as e:
+    return dm_ativos[posicao < n_sorteados].reset_index(drop = True)
 
-            # Adicionar o ativo a lista de ativos não encontrados
+
+# Função que retorna o resultado de um lote enviado ao pool de decodificação
+def collect_decoded_batch(
+    lote: list,
+    future
+):
+    """
+    Função que retorna o resultado de um lote enviado ao pool de decodificação
+
+    Args:
+        lote (list): Lote enviado, com tuplas (ativo, bytes da resposta)
+        future (Future): Future retornado pelo pool
+
+    Returns:
+        list: Tuplas (ativo, valores); caso o processo falhe, todos os ativos do lote voltam com valores None
+    """
+    try:
+        return future.result()
+    except Exception:
+        return [(ativo, None) for ativo, _ in lote]
+
+
+# Função que transforma um lote decodificado em DataFrame de resultados
+def build_maisretorno_batch(
+    list_decodificados: list,
+    dm_ativos: pd.DataFrame,
+    list_not_found: list
+):
+    """
+    Função que transforma um lote decodificado em DataFrame de resultados
+
+    Args:
+        list_decodificados (list): Tuplas (ativo, valores) retornadas por decode_maisretorno_batch
+        dm_ativos (pd.DataFrame): Mapeamento (cnpj, categoria) usado para replicar o resultado em todas as categorias do fundo
+        list_not_found (list): Lista onde os ativos sem estatísticas são adicionados
+
+    Returns:
+        df_lote: DataFrame com scores e uma linha por par (fundo, categoria), ou None caso nenhum ativo do lote tenha sido encontrado
+    """
+    list_encontrados = []
+    for ativo, valores in list_decodificados:
+        if valores is None:
             list_not_found.append(ativo)
+        else:
+            list_encontrados.append(valores + (ativo,))
+
+    if len(list_encontrados) == 0:
+        return None
+
+    # Calcula os scores do lote de uma vez
+    df_lote = (
+        pd.DataFrame(list_encontrados, columns = list(dict_rename_maisretorno.values()) + ["cnpj_consultado"])
+        .assign(cnpj = lambda _: _.cnpj_consultado)
+        .drop(columns = "cnpj_consultado")
+        .pipe(calculate_scores)
+        .merge(dm_ativos, on = "cnpj", how = "inner")                                                                                     # Uma linha por par (fundo, categoria)
+        .filter(list(dict_rename_maisretorno.values()) + [
+            "score_12m", "score_36m", "score_60m", "score_begin", "score_mean", "score_std", "score_all",
+            "total_months", "perc_positive_months", "perc_negative_months", "categoria"
+            ])
+    )
 
-            print(f"Erro: {e}")
-            print(f"Erro no cnpj: {ativo}")
-            print(f"Erro no count: {count}")
+    return apply_result_schema(df_lote)
+
+
+# Pool de decodificação compartilhado por todas as sessões do servidor
+@st.cache_resource
+def decode_pool():
+    """
+    Função que retorna o pool de processos de decodificação, criado uma única vez por servidor
+
+    Os webscrappings rodam em threads, e criar processos por fork a partir de uma thread pode herdar travas já adquiridas
+    por outras threads; por isso os processos são criados por spawn (somente Workers_Processamento é importado neles).
+
+    Args:
+        None
+
+    Returns:
+        ProcessPoolExecutor: Pool único do processo
+    """
+    return ProcessPoolExecutor(max_workers = N_PROCESSOS_DECODIFICACAO, mp_context = multiprocessing.get_context("spawn"))
+
+
+# Função que executa o webscrapping entregando os resultados em lotes, à medida que chegam
+def iter_webscrapping_maisretorno(
+    list_categorias: list,
+    progress_callback = None,
+    cancel_event: threading.Event = None,
+    rate_limiter: AdaptiveRateLimiter = None,
+    list_not_found: list = None,
+    dm_ativos: pd.DataFrame = None,
+    cache_respostas: ResponseCache = None,
+    guardar_respostas: bool = False
+):
+    """
+    Função que executa o webscrapping entregando os resultados em lotes, à medida que chegam
+
+    Cada lote é um DataFrame pronto (scores, categorias e schema compacto), então quem consome pode gravar, plotar ou
+    fazer o join com o BTG sem esperar o fim do webscrapping.
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        progress_callback (function): Função chamada a cada ativo com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe as requisições e entrega o que já foi coletado
+        rate_limiter (AdaptiveRateLimiter): Controle da taxa de requisições, caso None cria um novo a partir de SLEEP_SECONDS
+        list_not_found (list): Lista onde os ativos não encontrados são adicionados
+        dm_ativos (pd.DataFrame): Mapeamento (cnpj, categoria), caso None le os arquivos da SuperCarteira
+        cache_respostas (ResponseCache): Respostas já buscadas (por um preview), usadas no lugar de novas requisições
+        guardar_respostas (bool): Guarda as respostas novas em cache_respostas
+
+    Yields:
+        df_lote: DataFrame com os ativos de um lote (até TAMANHO_LOTE_DECODIFICACAO fundos)
+    """
+    list_not_found = [] if list_not_found is None else list_not_found
+    dm_ativos = load_supercarteira_ativos(list_categorias) if dm_ativos is None else dm_ativos
+    list_cnpj = dm_ativos.cnpj.unique()
+    count = 0
+
+    # Controle adaptativo da taxa de requisições
+    if rate_limiter is None:
+        rate_limiter = AdaptiveRateLimiter()
+
+    # Fila de ativos a consultar; ativos limitados pelo servidor voltam para o fim da fila
+    fila_ativos = deque(list_cnpj)
+    dict_tentativas = {}
+
+    # Respostas são decodificadas em lotes pelo pool de processos, enquanto este loop segue fazendo requisições
+    list_lote = []
+    list_lotes_enviados = []
+
+    try:
+
+        # Para cada ativo da SuperCarteira, pega rentabilidade e volatividade
+        while len(fila_ativos) > 0:
+            ativo = fila_ativos.popleft()
+
+            # Interrompe caso o usuário tenha cancelado o webscrapping
+            if cancel_event is not None and cancel_event.is_set():
+                break
+
+            # try, se nao funcionar, então guarda mensagem de erro e contagem de erro
+            try:
+
+                # Respostas já buscadas por um preview recente são usadas sem uma nova requisição
+                conteudo = cache_respostas.get(ativo) if cache_respostas is not None else None
+                if conteudo is None:
+
+                    # Espera a vez desta requisição para não sobrecarregar o servidor
+                    rate_limiter.wait()
+
+                    # Parametros para realizar o webcrawling
+                    url = URL_MAISRETORNO_STATS.format(ativo = ativo)
+                    querystring = {"format_decimal":"false"}
+                    payload = ""
+
+                    # Executa a busca da informação
+                    response = requests.request("GET", url, data=payload, headers=HEADERS_MAISRETORNO, params=querystring)
+
+                    # Caso o servidor esteja limitando as requisições, o ativo volta para a fila (até MAX_TENTATIVAS_LIMITE vezes)
+                    if rate_limiter.register_response(response):
+                        dict_tentativas[ativo] = dict_tentativas.get(ativo, 0) + 1
+                        if dict_tentativas[ativo] < MAX_TENTATIVAS_LIMITE:
+                            fila_ativos.append(ativo)
+                            continue
+                        raise Exception(f"Servidor limitou as requisições {MAX_TENTATIVAS_LIMITE} vezes (status {response.status_code})")
+
+                    conteudo = response.content
+                    if guardar_respostas == True and cache_respostas is not None and response.ok:
+                        cache_respostas.put(ativo, conteudo)
+
+                count += 1
+
+                # Publica o progresso (a tela é atualizada fora deste loop)
+                if progress_callback is not None:
+                    progress_callback(count, len(list_cnpj), f"{count} dos {len(list_cnpj)} ativos analisados ({rate_limiter.taxa:.1f} req/s)")
+
+                # Guarda a resposta crua; a cada lote completo, envia para decodificação em outro processo
+                list_lote.append((ativo, conteudo))
+                if len(list_lote) >= TAMANHO_LOTE_DECODIFICACAO:
+                    try:
+                        future = decode_pool().submit(decode_maisretorno_batch, list_lote)
+                    except BrokenProcessPool:                                                                                               # Um processo do pool morreu: recria o pool
+                        decode_pool.clear()
+                        future = decode_pool().submit(decode_maisretorno_batch, list_lote)
+                    list_lotes_enviados.append((list_lote, future))
+                    list_lote = []
+
+            # Caso não seja possível puxar algum dos ativos, adiciona à lista de não encontrados (mostrada no resultado)
+            except Exception:
+                list_not_found.append(ativo)
+
+            # Entrega os lotes que já foram decodificados, na ordem em que foram enviados
+            while len(list_lotes_enviados) > 0 and list_lotes_enviados[0][1].done():
+                df_lote = build_maisretorno_batch(collect_decoded_batch(*list_lotes_enviados.pop(0)), dm_ativos, list_not_found)
+                if df_lote is not None:
+                    yield df_lote
+
+        # Entrega os lotes restantes (o último lote, incompleto, é decodificado aqui mesmo)
+        for lote, future in list_lotes_enviados:
+            df_lote = build_maisretorno_batch(collect_decoded_batch(lote, future), dm_ativos, list_not_found)
+            if df_lote is not None:
+                yield df_lote
+        df_lote = build_maisretorno_batch(decode_maisretorno_batch(list_lote), dm_ativos, list_not_found)
+        if df_lote is not None:
+            yield df_lote
+
+    # Cancela os lotes ainda não iniciados mesmo que quem consome pare antes do fim (o pool é compartilhado e continua ativo)
+    finally:
+        for _, future in list_lotes_enviados:
+            future.cancel()
+
+
+# Função que executa o webscrapping
+def webscrapping_maisretorno(
+    list_categorias: list,
+    tab_webscrapping: st.tabs = None,
+    progress_callback = None,
+    cancel_event: threading.Event = None,
+    rate_limiter: AdaptiveRateLimiter = None,
+    batch_callback = None,
+    dm_ativos: pd.DataFrame = None,
+    cache_respostas: ResponseCache = None,
+    guardar_respostas: bool = False
+):
+    """
+    Função que executa o webscrapping
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        tab_webscrapping (st.tabs): Aba de webscrapping, caso None nada é escrito na tela (execução em segundo plano)
+        progress_callback (function): Função chamada a cada ativo com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping e retorna o que já foi coletado
+        rate_limiter (AdaptiveRateLimiter): Controle da taxa de requisições, caso None cria um novo a partir de SLEEP_SECONDS
+        batch_callback (function): Função chamada com cada lote de resultados assim que ele fica pronto
+        dm_ativos (pd.DataFrame): Mapeamento (cnpj, categoria) a consultar, caso None le todos os fundos dos arquivos da SuperCarteira
+        cache_respostas (ResponseCache): Respostas já buscadas (por um preview), usadas no lugar de novas requisições
+        guardar_respostas (bool): Guarda as respostas novas em cache_respostas
+
+    Returns:
+        df_result: DataFrame com dados limpos para criar gráficos
+        dm_ativos: DataFrame com CNPJ de gestoras de fundos de investimento
+        dm_ativos_not_found: Lista de ativos não encontrados
+        list_not_found: Lista de ativos não encontrados
+    """
+    # Abertura de listas vazias para o Loop
+    list_lotes = []
+    list_not_found = []
+
+    # Caso seja executado direto na tela, cria barra de progresso com atualizações limitadas
+    if progress_callback is None and tab_webscrapping is not None:
+        progress_callback = progress_bar_callback(tab_webscrapping)
+
+    # Mapeamento (cnpj, categoria) dos arquivos da SuperCarteira
+    if dm_ativos is None:
+        dm_ativos = load_supercarteira_ativos(list_categorias)
+
+    # Consome os lotes à medida que ficam prontos
+    for df_lote in iter_webscrapping_maisretorno(
+        list_categorias, progress_callback, cancel_event, rate_limiter, list_not_found, dm_ativos, cache_respostas, guardar_respostas
+    ):
+        list_lotes.append(df_lote)
+        if batch_callback is not None:
+            batch_callback(df_lote)
+
+    # Junta os lotes e aplica o schema compacto (float32, inteiros pequenos, categorias e cnpj inteiro)
+    df_result = apply_result_schema(pd.concat(list_lotes, ignore_index = True)) if len(list_lotes) > 0 else pd.DataFrame()
+
+    # Ordena o resultado completo pelo score (os lotes chegam na ordem das requisições)
+    if len(df_result) > 0:
+        df_result = df_result.sort_values(by = "score_all", ascending = False, ignore_index = True)
 
     # Transforma itens da lista de ativos não encontrados em inteiros
     list_not_found = string_to_int(list_not_found)
 
-    # Cria DataFrame com ativos não encontrados
-    dm_ativos_not_found = dm_ativos.query("cnpj == @list_not_found")
+    # Caso o webscrapping tenha sido cancelado, considera somente os ativos já consultados
+    cnpj_ativos = cnpj_to_int(dm_ativos.cnpj)
+    if cancel_event is not None and cancel_event.is_set():
+        list_consultados = list_not_found + (df_result["cnpj"].tolist() if len(df_result) > 0 else [])
+        dm_ativos = dm_ativos[cnpj_ativos.isin(list_consultados)]
+        cnpj_ativos = cnpj_ativos[cnpj_ativos.isin(list_consultados)]
+
+    # Cria DataFrame com ativos não encontrados (o cnpj de dm_ativos é texto, a lista é de inteiros)
+    mascara_not_found = cnpj_ativos.isin(list_not_found)
+    dm_ativos_not_found = dm_ativos[mascara_not_found]
 
     # Remover o ativo da lista de ativos
-    dm_ativos = dm_ativos.query("cnpj != @list_not_found")
+    dm_ativos = dm_ativos[~mascara_not_found]
 
     # Retorna quantos ativos foram encontrados e quantos não foram
-    tab_webscrapping.write(f"Quantidade de ativos encontrados: {len(dm_ativos)}")
-    tab_webscrapping.write(f"Quantidade de ativos não encontrados: {len(dm_ativos_not_found)}")
+    if tab_webscrapping is not None:
+        tab_webscrapping.write(f"Quantidade de ativos encontrados: {len(dm_ativos)}")
+        tab_webscrapping.write(f"Quantidade de ativos não encontrados: {len(dm_ativos_not_found)}")
 
-    # Nomeia quais ativos não foram encontrados
-    tab_webscrapping.write(f"Ativos não encontrados: {list_not_found}")
+        # Nomeia quais ativos não foram encontrados
+        tab_webscrapping.write(f"Ativos não encontrados: {list_not_found}")
 
     return df_result, dm_ativos, dm_ativos_not_found, list_not_found
 
 
-# Função que executa o webscrapping para descobrir os ativos disponíveis no BTG
-def webscrapping_btg(
-    MAX_PRODUCTS_BTG: int,
-    SIZE_PER_PAGE_BTG: int
+# Função que executa o webscrapping do Mais Retorno somente em uma amostra estratificada de cada categoria
+def webscrapping_preview_maisretorno(
+    list_categorias: list,
+    tamanho_amostra: int = None,
+    fracao_amostra: float = None,
+    seed: int = SEED_AMOSTRA_PREVIEW,
+    cache_respostas: ResponseCache = None,
+    progress_callback = None,
+    cancel_event: threading.Event = None,
+    batch_callback = None
 ):
-
     """
-    Função que executa o webscrapping para descobrir os ativos disponíveis no BTG
+    Função que executa o webscrapping do Mais Retorno somente em uma amostra estratificada de cada categoria
+
+    O preview dá estatísticas aproximadas de cada categoria em pouco tempo. As respostas ficam em cache_respostas e são
+    reaproveitadas pelo próximo webscrapping completo, que faz requisições somente para os fundos fora da amostra.
 
     Args:
         list_categorias (list): Lista de categorias de ativos
+        tamanho_amostra (int): Fundos sorteados em cada categoria
+        fracao_amostra (float): Fração sorteada de cada categoria, usada caso tamanho_amostra seja None
+        seed (int): Semente do sorteio
+        cache_respostas (ResponseCache): Onde as respostas da amostra são guardadas
+        progress_callback (function): Função chamada a cada ativo com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping e retorna o que já foi coletado
+        batch_callback (function): Função chamada com cada lote de resultados assim que ele fica pronto
 
     Returns:
-        df_result: DataFrame com dados limpos para criar gráficos
-        dm_ativos: DataFrame com CNPJ de gestoras de fundos de investimento
-        dm_ativos_not_found: Lista de ativos não encontrados
-        list_not_found: Lista de ativos não encontrados
+        Mesmo retorno de webscrapping_maisretorno, somente com os fundos sorteados
+    """
+    if tamanho_amostra is None and fracao_amostra is None:
+        tamanho_amostra = TAMANHO_AMOSTRA_PREVIEW
+
+    dm_amostra = sample_supercarteira_ativos(load_supercarteira_ativos(list_categorias), tamanho_amostra, fracao_amostra, seed)
+
+    return webscrapping_maisretorno(
+        list_categorias,
+        progress_callback = progress_callback,
+        cancel_event = cancel_event,
+        batch_callback = batch_callback,
+        dm_ativos = dm_amostra,
+        cache_respostas = cache_respostas,
+        guardar_respostas = True
+    )
+
+
+# Função que executa o webscrapping do BTG entregando os produtos página a página
+def iter_webscrapping_btg(
+    MAX_PRODUCTS_BTG: int,
+    SIZE_PER_PAGE_BTG: int,
+    progress_callback = None,
+    cancel_event: threading.Event = None
+):
+
+    """
+    Função que executa o webscrapping do BTG entregando os produtos página a página
+
+    Args:
+        MAX_PRODUCTS_BTG (int): Quantidade máxima de produtos buscados
+        SIZE_PER_PAGE_BTG (int): Quantidade de produtos por página
+        progress_callback (function): Função chamada a cada página com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping
+
+    Yields:
+        webscrapping_btg_temp: DataFrame com os produtos de uma página
     """
-    webscrapping_btg_result = pd.DataFrame()
-    range_pages = range(1, int(MAX_PAGES_BTG) + 1)
+    range_pages = range(1, int(MAX_PRODUCTS_BTG / SIZE_PER_PAGE_BTG) + 1)
     print(f"range_pages = {range_pages}")
 
     # Para cada página de produtos disponíveis no BTG
     for page in range_pages:
 
+        # Interrompe caso o usuário tenha cancelado o webscrapping
+        if cancel_event is not None and cancel_event.is_set():
+            break
+
         # # Espera x segundos para não sobrecarregar o servidor
         # time.sleep(SLEEP_SECONDS)
 
-        url = "https://investimentos.btgpactual.com/services/api/funds-public/public/funds/list"
+        url = URL_BTG_FUNDOS
 
         querystring = {"page": page, "size": SIZE_PER_PAGE_BTG, "sortByName": "FUND_NAME", "sortingDirection": "ASC"}
 
@@ -576,11 +1239,45 @@ def webscrapping_btg(
             # Flatten the JSON data
             webscrapping_btg_temp = pd.json_normalize(data['items']).rename(columns = {"CNPJ": "cnpj"})
 
-            # Junta com o resto dos dados
-            webscrapping_btg_result = pd.concat([webscrapping_btg_result, webscrapping_btg_temp], ignore_index=True)
-
         else:
             print("Request failed with status code:", response.status_code)
+            webscrapping_btg_temp = None
+
+        # Publica o progresso
+        if progress_callback is not None:
+            progress_callback(page, len(range_pages), f"BTG: {page} de {len(range_pages)} páginas")
+
+        # Entrega a página
+        if webscrapping_btg_temp is not None:
+            yield webscrapping_btg_temp
+
+
+# Função que executa o webscrapping para descobrir os ativos disponíveis no BTG
+def webscrapping_btg(
+    MAX_PRODUCTS_BTG: int,
+    SIZE_PER_PAGE_BTG: int,
+    progress_callback = None,
+    cancel_event: threading.Event = None
+):
+
+    """
+    Função que executa o webscrapping para descobrir os ativos disponíveis no BTG
+
+    Args:
+        MAX_PRODUCTS_BTG (int): Quantidade máxima de produtos buscados
+        SIZE_PER_PAGE_BTG (int): Quantidade de produtos por página
+        progress_callback (function): Função chamada a cada página com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping e retorna o que já foi coletado
+
+    Returns:
+        webscrapping_btg_result: DataFrame com os produtos disponíveis no BTG
+    """
+    # Junta as páginas à medida que chegam
+    list_paginas = list(iter_webscrapping_btg(MAX_PRODUCTS_BTG, SIZE_PER_PAGE_BTG, progress_callback, cancel_event))
+    webscrapping_btg_result = pd.concat(list_paginas, ignore_index = True) if len(list_paginas) > 0 else pd.DataFrame()
+
+    # Aplica o schema compacto
+    webscrapping_btg_result = apply_result_schema(webscrapping_btg_result)
 
     return webscrapping_btg_result
 
@@ -598,22 +1295,12 @@ def webscrapping_join(
     Returns:
         webscrapping_join_result: DataFrame com dados do webscrapping do BTG e do Mais Retorno
     """
-    # Garante que o cnpj está no formato correto
-    webscrapping_btg_result = (webscrapping_btg_result
-                                .copy()
-                                .assign(cnpj = lambda _: _.cnpj.astype(str))
-                                # .assign(cnpj = lambda _: _.cnpj.str.replace(".", "", regex = True))
-    )
-
-    # Garante que o cnpj está no formato correto
-    webscrapping_maisretorno_result = (webscrapping_maisretorno_result
-                        .copy()
-                        .assign(cnpj = lambda _: _.cnpj.astype(str))
-                        # .assign(cnpj = lambda _: _.cnpj.str.replace(".", "", regex = True))
-    )
+    # Garante que o cnpj está no mesmo formato (inteiro) nos dois DataFrames
+    webscrapping_btg_result = apply_result_schema(webscrapping_btg_result.rename(columns = {"CNPJ": "cnpj"}).filter(["cnpj"]))
+    webscrapping_maisretorno_result = apply_result_schema(webscrapping_maisretorno_result)
 
     # Lista de cnpj no BTG
-    list_cnpj_btg = list(webscrapping_btg_result.cnpj.unique())
+    list_cnpj_btg = webscrapping_btg_result.cnpj.dropna().unique()
 
     print(f"len(webscrapping_btg_result) = {len(webscrapping_btg_result)}")
     print(f"len(webscrapping_maisretorno_result) = {len(webscrapping_maisretorno_result)}")
@@ -634,15 +1321,23 @@ def webscrapping_all(
     list_categorias: list,
     tab_webscrapping: st.tabs,
     MAX_PRODUCTS_BTG: int,
-    SIZE_PER_PAGE_BTG: int
+    SIZE_PER_PAGE_BTG: int,
+    progress_callback = None,
+    cancel_event: threading.Event = None,
+    batch_callback = None,
+    cache_respostas: ResponseCache = None
     ):
     """
     Função que executa ambos webscrappings e prepara os dados
     Args:
         list_categorias (list): Lista de categorias de ativos
-        tab_webscrapping (st.tabs): Aba de webscrapping
+        tab_webscrapping (st.tabs): Aba de webscrapping, caso None nada é escrito na tela (execução em segundo plano)
         MAX_PRODUCTS_BTG (int): Número máximo de produtos do BTG
         SIZE_PER_PAGE_BTG (int): Número de produtos por página do BTG
+        progress_callback (function): Função chamada a cada ativo/página com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping
+        batch_callback (function): Função chamada com cada lote de resultados do Mais Retorno assim que ele fica pronto
+        cache_respostas (ResponseCache): Respostas do Mais Retorno já buscadas por um preview, reaproveitadas sem nova requisição
     Returns:
         webscrapping_join_result: DataFrame com dados do webscrapping do BTG e do Mais Retorno
         webscrapping_btg_result: 
@@ -651,26 +1346,39 @@ def webscrapping_all(
         dm_ativos_not_found:
         list_not_found:
     """
+    # Caso seja executado direto na tela, cria barra de progresso com atualizações limitadas
+    if progress_callback is None and tab_webscrapping is not None:
+        progress_callback = progress_bar_callback(tab_webscrapping)
+
     # Mostra status Progresso
-    tab_webscrapping.write(f"--- Webscrapping MaisRetorno ---")
+    if tab_webscrapping is not None:
+        tab_webscrapping.write(f"--- Webscrapping MaisRetorno ---")
 
     # Executa o webscrapping do Mais Retorno
     webscrapping_maisretorno_result, dm_ativos, dm_ativos_not_found, list_not_found = webscrapping_maisretorno(
         list_categorias,
-        tab_webscrapping
+        tab_webscrapping,
+        progress_callback,
+        cancel_event,
+        batch_callback = batch_callback,
+        cache_respostas = cache_respostas
     )
 
     # Mostra status Progresso
-    tab_webscrapping.write(f"--- Webscrapping BTG ---")
+    if tab_webscrapping is not None:
+        tab_webscrapping.write(f"--- Webscrapping BTG ---")
 
     # Executa o webscrapping do BTG
     webscrapping_btg_result = webscrapping_btg(
         MAX_PRODUCTS_BTG,
-        SIZE_PER_PAGE_BTG
+        SIZE_PER_PAGE_BTG,
+        progress_callback,
+        cancel_event
     )
 
     # Mostra status Progresso
-    tab_webscrapping.write(f"--- Webscrapping Join ---")
+    if tab_webscrapping is not None:
+        tab_webscrapping.write(f"--- Webscrapping Join ---")
     print(f"webscrapping_maisretorno_result = {webscrapping_maisretorno_result.dtypes}")
     print(f"webscrapping_btg_result = {webscrapping_btg_result.dtypes}")
 
@@ -680,341 +1388,4061 @@ def webscrapping_all(
         webscrapping_btg_result
     )
 
+    # Com o webscrapping cancelado a lista do BTG está incompleta: a disponibilidade fica desconhecida (sem a coluna) em vez de False
+    if cancel_event is not None and cancel_event.is_set():
+        webscrapping_join_result = webscrapping_join_result.drop(columns = "disponibilidade_btg")
+
     return webscrapping_join_result, webscrapping_btg_result, webscrapping_maisretorno_result, dm_ativos, dm_ativos_not_found, list_not_found
 
 
-######## Data Analysis ########
-# Função que prepara os dados para criar os gráficos
-def clean_to_chart(
-    df_result: pd.DataFrame,
-    SCORE_TYPE: str = "60m",
-    MAX_PROFITABILITY: float = 999999,
-    MAX_VOLATILITY: float = 100,
+######## Profiling ########
+# Função que indica se o modo de profiling está ativo neste rerun
+def profiling_enabled():
+    """
+    Função que indica se o modo de profiling está ativo neste rerun
+
+    Args:
+        None
+
+    Returns:
+        bool: True caso a variável de ambiente esteja com "1" ou o botão da sidebar tenha sido ligado
+    """
+    return os.environ.get(VARIAVEL_AMBIENTE_PROFILING) == "1" or st.session_state.get("modo_profiling", False) == True
+
+
+# Trava do profiler, compartilhada por todas as sessões do servidor
+@st.cache_resource
+def profiling_lock():
+    """
+    Função que retorna a trava do profiler compartilhada por todas as sessões do servidor
+
+    A partir do Python 3.12 o cProfile usa o sys.monitoring, que é único por processo: duas sessões medindo ao mesmo tempo
+    fariam o segundo enable() falhar com "Another profiling tool is already active".
+
+    Args:
+        None
+
+    Returns:
+        threading.Lock: Trava única do processo
+    """
+    return threading.Lock()
+
+
+class RerunProfiler:
+    """
+    Classe que mede cada etapa de um rerun com cProfile e salva os perfis em disco
+
+    Cada etapa tem o seu próprio perfil (arquivo .prof, legível com pstats ou snakeviz). O resumo em JSON guarda o tempo de cada
+    etapa e um hash do código, permitindo comparar reruns de versões diferentes da ferramenta.
+
+    Args:
+        ativo (bool): Caso False, as etapas são executadas sem medição
+        profiles_path (str): Pasta onde os perfis são salvos
+    """
+    def __init__(
+        self,
+        ativo: bool,
+        profiles_path: str = profiles_path
+    ):
+        self.ativo = ativo
+        self.profiles_path = profiles_path
+        self.perfis = {}
+        self.tempos = {}
+        self.ignoradas = []
+        self.inicio = datetime.now()
+        self.pasta = None
+
+    @contextmanager
+    def etapa(self, nome):
+        """Mede o bloco de código como a etapa nome (a etapa roda sem medição caso o profiling esteja desligado ou ocupado por outra sessão)"""
+        if self.ativo == False:
+            yield
+            return
+
+        trava = profiling_lock()
+        if trava.acquire(blocking = False) == False:
+            self.ignoradas.append(nome)
+            yield
+            return
+
+        try:
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:                                                                                                              # Outra ferramenta de profiling/debug já está ativa no processo
+                perfil = None
+            if perfil is None:
+                self.ignoradas.append(nome)
+                yield
+                return
+
+            inicio = time.perf_counter()
+            try:
+                yield
+            finally:
+                perfil.disable()
+                self.tempos[nome] = self.tempos.get(nome, 0.0) + time.perf_counter() - inicio
+                self.perfis[nome] = perfil
+        finally:
+            trava.release()
+
+    def summary(self):
+        """Retorna um DataFrame com o tempo de cada etapa, da mais lenta para a mais rápida"""
+        df_resumo = pd.DataFrame({"etapa": list(self.tempos.keys()), "tempo_s": list(self.tempos.values())})
+
+        return df_resumo.assign(percentual = lambda _: _.tempo_s / _.tempo_s.sum() * 100).sort_values(by = "tempo_s", ascending = False)
+
+    def hotspots(self, N_HOTSPOTS_PROFILING = N_HOTSPOTS_PROFILING):
+        """Retorna as funções da ferramenta com maior tempo próprio, somando todas as etapas"""
+        if len(self.perfis) == 0:
+            return pd.DataFrame()
+
+        estatisticas = pstats.Stats(*self.perfis.values())
+        pasta_projeto = os.path.dirname(os.path.abspath(__file__))
+        list_funcoes = [
+            {
+                "funcao": funcao,
+                "arquivo": os.path.basename(arquivo),
+                "linha": linha,
+                "chamadas": chamadas,
+                "tempo_proprio_s": tempo_proprio,
+                "tempo_total_s": tempo_total
+            }
+            for (arquivo, linha, funcao), (_, chamadas, tempo_proprio, tempo_total, _) in estatisticas.stats.items()
+            if arquivo != "~" and os.path.abspath(arquivo).startswith(pasta_projeto)                                                        # "~" são funções nativas do Python
+        ]
+        if len(list_funcoes) == 0:
+            return pd.DataFrame()
+
+        return pd.DataFrame(list_funcoes).sort_values(by = "tempo_total_s", ascending = False).head(N_HOTSPOTS_PROFILING)
+
+    def save(self):
+        """Salva um arquivo .prof por etapa e o resumo do rerun; retorna a pasta criada"""
+        if self.ativo == False or len(self.perfis) == 0:
+            return None
+
+        self.pasta = f"{self.profiles_path}/{self.inicio.strftime('%Y%m%d_%H%M%S_%f')}"
+        os.makedirs(self.pasta, exist_ok = True)
+        for nome, perfil in self.perfis.items():
+            perfil.dump_stats(f"{self.pasta}/{nome}.prof")
+
+        # Hash do código para comparar perfis de versões diferentes
+        with open(os.path.abspath(__file__), "rb") as file:
+            versao_codigo = hashlib.sha256(file.read()).hexdigest()[:12]
+        with open(f"{self.pasta}/resumo.json", "w") as file:
+            json.dump({"inicio": self.inicio.isoformat(), "versao_codigo": versao_codigo, "tempos_s": self.tempos, "etapas_ignoradas": self.ignoradas}, file, indent = 2)
+
+        return self.pasta
+
+
+######## Webscrapping em Segundo Plano ########
+# Função que cria uma barra de progresso com atualizações limitadas para webscrappings executados direto na tela
+def progress_bar_callback(
+    tab_webscrapping: st.tabs,
+    INTERVALO_ATUALIZACAO_UI: float = INTERVALO_ATUALIZACAO_UI
+):
+    """
+    Função que cria uma barra de progresso com atualizações limitadas para webscrappings executados direto na tela
+
+    Args:
+        tab_webscrapping (st.tabs): Aba de webscrapping
+        INTERVALO_ATUALIZACAO_UI (float): Intervalo mínimo em segundos entre atualizações da barra
+
+    Returns:
+        function: Função (count, total, texto) que atualiza a barra de progresso
+    """
+    progress_bar = tab_webscrapping.progress(0)
+    ultima_atualizacao = [0.0]
+
+    # Redesenha a barra somente se passou o intervalo mínimo ou se o webscrapping terminou
+    def callback(count, total, texto = ""):
+        agora = time.monotonic()
+        if agora - ultima_atualizacao[0] >= INTERVALO_ATUALIZACAO_UI or count == total:
+            ultima_atualizacao[0] = agora
+            progress_bar.progress(value = min(count / total, 1.0), text = texto)
+
+    return callback
+
+
+# Classe que executa um webscrapping em uma thread e publica o progresso em uma fila
+class ScrapeJob:
+    """
+    Classe que executa um webscrapping em uma thread e publica o progresso em uma fila
+
+    Args:
+        nome (str): Nome do webscrapping
+        funcao (function): Função de webscrapping que aceita progress_callback e cancel_event
+        kwargs (dict): Demais argumentos da função de webscrapping
+        extrair_resultado (function): Função que extrai do retorno o DataFrame a ser baixado, caso None não há download
+        salvar_historico (bool): Guarda o DataFrame extraído no histórico de webscrappings
+        prefixo_arquivo (str): Prefixo do nome do arquivo Excel de download
+        transmitir_lotes (bool): Passa batch_callback para a função e guarda os lotes parciais para a tela
+        mostrar_resumo (bool): Mostra o resumo por categoria e o gráfico do resultado ao final (usado no preview)
+    """
+    def __init__(
+        self,
+        nome: str,
+        funcao,
+        kwargs: dict,
+        extrair_resultado = None,
+        salvar_historico: bool = False,
+        prefixo_arquivo: str = "Investimento_Webscrapping",
+        transmitir_lotes: bool = False,
+        mostrar_resumo: bool = False
+    ):
+        self.nome = nome
+        self.funcao = funcao
+        self.kwargs = kwargs
+        self.extrair_resultado = extrair_resultado
+        self.salvar_historico = salvar_historico
+        self.prefixo_arquivo = prefixo_arquivo
+        self.transmitir_lotes = transmitir_lotes
+        self.mostrar_resumo = mostrar_resumo
+
+        # Estado do webscrapping, lido pela tela
+        self.fila = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.status = "pendente"
+        self.progresso = (0, 1, "")
+        self.resultado = None
+        self.lotes = []
+        self.df_resultado = None
+        self.excel_resultado = None
+        self.arquivo_resultado = None
+        self.erro = None
+        self.inicio = None
+        self.fim = None
+        self.inscritos = {}
+        self.thread = threading.Thread(target = self._run, daemon = True)
+
+    def start(self):
+        """Inicia o webscrapping em segundo plano"""
+        self.inicio = datetime.now()
+        self.status = "executando"
+        self.thread.start()
+        return self
+
+    def _run(self):
+        """Executa o webscrapping e prepara o arquivo de download fora da thread da tela"""
+        try:
+            kwargs = {**self.kwargs, "batch_callback": self.publish_batch} if self.transmitir_lotes else self.kwargs
+            self.resultado = self.funcao(progress_callback = self.publish, cancel_event = self.cancel_event, **kwargs)
+
+            if self.extrair_resultado is not None:
+                self.df_resultado = self.extrair_resultado(self.resultado)
+
+                # Guarda o resultado no histórico de webscrappings (somente execuções completas)
+                if self.salvar_historico == True and self.cancel_event.is_set() == False:
+                    history_append(self.df_resultado)
+
+                    # Publica a nova posição para todas as sessões (troca atômica do dataset compartilhado)
+                    publish_dataset()
+
+                # Nome e conteúdo do arquivo com resultados do webscrapping
+                time_now = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
+                self.arquivo_resultado = f"{self.prefixo_arquivo}_{time_now}.xlsx"
+                excel_buffer = io.BytesIO()
+                self.df_resultado.to_excel(excel_buffer, index=False)
+                self.excel_resultado = excel_buffer.getvalue()
+
+            self.status = "cancelado" if self.cancel_event.is_set() else "concluido"
+
+        except Exception as e:
+            self.erro = e
+            self.status = "erro"
+            print(f"Erro no webscrapping {self.nome}: {e}")
+
+        finally:
+            self.fim = datetime.now()
+            self.fila.put(("fim", self.status))
+
+    def publish(self, count, total, texto = ""):
+        """Publica um evento de progresso (chamado pelo loop do webscrapping)"""
+        self.fila.put(("progresso", count, total, texto))
+
+    def publish_batch(self, df_lote):
+        """Guarda um lote parcial de resultados (chamado pelo webscrapping a cada lote pronto)"""
+        self.lotes.append(df_lote)
+
+    def partial_result(self):
+        """Retorna os lotes recebidos até agora em um único DataFrame, ou None caso ainda não haja lotes"""
+        list_lotes = list(self.lotes)
+        if len(list_lotes) == 0:
+            return None
+        return apply_result_schema(pd.concat(list_lotes, ignore_index = True))
+
+    def subscribe(self, id_sessao):
+        """Inscreve uma sessão para acompanhar o progresso e o resultado do webscrapping"""
+        self.inscritos[id_sessao] = time.monotonic()
+        return self
+
+    def heartbeat(self, id_sessao):
+        """Registra que a sessão ainda acompanha o webscrapping (chamado a cada atualização do progresso na tela)"""
+        if id_sessao in self.inscritos:
+            self.inscritos[id_sessao] = time.monotonic()
+
+    def cancel(self, id_sessao = None):
+        """Retira a sessão do webscrapping e pede a interrupção somente quando nenhuma outra sessão ativa está inscrita; retorna True caso interrompa"""
+        self.inscritos.pop(id_sessao, None)
+
+        # Sessões que pararam de acompanhar o progresso (aba fechada, sessão expirada) não impedem a interrupção
+        limite = time.monotonic() - TEMPO_INSCRICAO_INATIVA_S
+        self.inscritos = {sessao: ultimo for sessao, ultimo in self.inscritos.items() if ultimo >= limite}
+
+        if len(self.inscritos) == 0:
+            self.cancel_event.set()
+        return self.cancel_event.is_set()
+
+    def poll(self):
+        """Consome os eventos da fila e retorna o progresso mais recente"""
+        while True:
+            try:
+                evento = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if evento[0] == "progresso":
+                self.progresso = evento[1:]
+        return self.progresso
+
+    @property
+    def executando(self):
+        """Indica se o webscrapping ainda está em execução"""
+        return self.thread.is_alive()
+
+
+# Função que retorna a versão dos arquivos de entrada da SuperCarteira usados por um webscrapping
+def scrape_inputs_version(
+    list_categorias: list,
+    input_path: str = input_path
+):
+    """
+    Função que retorna a versão dos arquivos de entrada da SuperCarteira usados por um webscrapping
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        input_path (str): Pasta com os arquivos da SuperCarteira
+
+    Returns:
+        str: Data de modificação de cada arquivo de categoria (arquivos ausentes ficam como None)
+    """
+    list_versoes = []
+    for categoria in sorted(list_categorias):
+        arquivo = f"{input_path}/SuperCarteira_{categoria}.json"
+        list_versoes.append(f"{categoria}:{os.path.getmtime(arquivo) if os.path.exists(arquivo) else None}")
+
+    return "|".join(list_versoes)
+
+
+# Função que monta a chave que identifica pedidos de webscrapping iguais
+def scrape_job_key(
+    job: ScrapeJob
+):
+    """
+    Função que monta a chave que identifica pedidos de webscrapping iguais
+
+    Args:
+        job (ScrapeJob): Webscrapping pedido
+
+    Returns:
+        tuple: (fontes, categorias, demais parâmetros, versão dos arquivos de entrada)
+    """
+    list_categorias = sorted(job.kwargs.get("list_categorias", []))
+    parametros = tuple(sorted((chave, repr(valor)) for chave, valor in job.kwargs.items() if chave not in ["list_categorias", "tab_webscrapping"]))
+
+    return (job.nome, tuple(list_categorias), parametros, scrape_inputs_version(list_categorias))
+
+
+# Classe que guarda os webscrappings de todas as sessões e junta pedidos iguais em um único webscrapping
+class ScrapeJobRegistry:
+    """
+    Classe que guarda os webscrappings de todas as sessões e junta pedidos iguais em um único webscrapping
+
+    Um pedido com a mesma chave de um webscrapping em execução se inscreve nele; um pedido com a mesma chave de um webscrapping
+    concluído dentro da janela de validade recebe o resultado pronto. Somente nos demais casos um novo webscrapping é iniciado.
+
+    Args:
+        JANELA_VALIDADE_WEBSCRAPPING_MIN (float): Minutos em que um webscrapping concluído é reaproveitado
+    """
+    def __init__(
+        self,
+        JANELA_VALIDADE_WEBSCRAPPING_MIN: float = JANELA_VALIDADE_WEBSCRAPPING_MIN
+    ):
+        self.janela_validade = timedelta(minutes = JANELA_VALIDADE_WEBSCRAPPING_MIN)
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def valid(self, job):
+        """Indica se o webscrapping ainda pode ser compartilhado (em execução ou concluído dentro da janela de validade)"""
+        if job.executando:
+            return True
+        return job.status == "concluido" and datetime.now() - job.fim <= self.janela_validade
+
+    def get_or_start(self, job, id_sessao):
+        """
+        Inscreve a sessão no webscrapping com a mesma chave do pedido, iniciando o pedido somente caso não haja um válido
+
+        Returns:
+            job: Webscrapping compartilhado
+            origem: "novo", "em_execucao" (iniciado por outro pedido) ou "recente" (concluído dentro da janela de validade)
+        """
+        chave = scrape_job_key(job)
+
+        # A verificação e o início ficam sob o mesmo lock para que dois cliques simultâneos iniciem um único webscrapping
+        with self.lock:
+            self.jobs = {chave_job: job_registrado for chave_job, job_registrado in self.jobs.items() if self.valid(job_registrado)}
+
+            job_registrado = self.jobs.get(chave)
+            if job_registrado is not None:
+                return job_registrado.subscribe(id_sessao), "em_execucao" if job_registrado.executando else "recente"
+
+            self.jobs[chave] = job.subscribe(id_sessao).start()
+
+        return job, "novo"
+
+
+# Registro de webscrappings compartilhado por todas as sessões do servidor
+@st.cache_resource
+def scrape_job_registry():
+    """
+    Função que retorna o registro de webscrappings compartilhado por todas as sessões do servidor
+
+    Args:
+        None
+
+    Returns:
+        ScrapeJobRegistry: Registro único do processo
+    """
+    return ScrapeJobRegistry()
+
+
+# Respostas do Mais Retorno guardadas pelos previews, compartilhadas por todas as sessões do servidor
+@st.cache_resource
+def scrape_response_cache():
+    """
+    Função que retorna as respostas do Mais Retorno guardadas pelos previews, compartilhadas por todas as sessões do servidor
+
+    Args:
+        None
+
+    Returns:
+        ResponseCache: Cache único do processo
+    """
+    return ResponseCache()
+
+
+######## Séries de Retornos ########
+# Função que busca a série de rentabilidade mensal de um ativo no Mais Retorno
+def fetch_monthly_returns(
+    ativo: str,
+    rate_limiter: AdaptiveRateLimiter = None
+):
+    """
+    Função que busca a série de rentabilidade mensal de um ativo no Mais Retorno
+
+    Args:
+        ativo (str): CNPJ do ativo (somente números)
+        rate_limiter (AdaptiveRateLimiter): Controle da taxa de requisições, caso None a requisição é feita imediatamente
+
+    Returns:
+        pd.Series: Rentabilidade mensal (em decimal) indexada pelo mês no formato "YYYY-MM", ou None caso o servidor tenha limitado a requisição
+    """
+    # Executa a busca da informação
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    url = URL_MAISRETORNO_RETORNOS.format(ativo = ativo)
+    response = requests.get(url, headers = HEADERS_MAISRETORNO, params = {"format_decimal": "false"})
+    if rate_limiter is not None and rate_limiter.register_response(response):
+        return None
+    response.raise_for_status()
+
+    # Aceita tanto uma lista de registros quanto um objeto com a lista em "data"
+    dados = response.json()
+    registros = dados if isinstance(dados, list) else dados.get("data", [])
+
+    # Uma observação por mês, rentabilidade em decimal
+    serie_retornos = (
+        pd.json_normalize(registros)
+        .assign(mes = lambda _: pd.to_datetime(_[CAMPO_DATA_RETORNOS]).dt.strftime("%Y-%m"))
+        .groupby("mes")
+        [CAMPO_VALOR_RETORNOS]
+        .last()
+        .astype(float)
+        / 100
+    )
+
+    return serie_retornos
+
+
+# Função que carrega o painel de retornos mensais (ativos x meses) mapeado em memória
+def load_returns_panel(
+    retornos_path: str = retornos_path
+):
+    """
+    Função que carrega o painel de retornos mensais (ativos x meses) mapeado em memória
+
+    Args:
+        retornos_path (str): Pasta onde o painel de retornos é armazenado
+
+    Returns:
+        retornos: np.memmap float32 (ativos x meses) somente leitura, ou None caso não exista painel (ou ele esteja vazio)
+        cnpjs: np.ndarray int64 com o CNPJ de cada linha, ordenado
+        meses: np.ndarray com o mês ("YYYY-MM") de cada coluna, ordenado
+    """
+    # Caso ainda não exista painel salvo
+    arquivo_indice = f"{retornos_path}/indice.json"
+    if os.path.exists(arquivo_indice) == False:
+        return None, None, None
+
+    # Le índice com os CNPJs, meses e o arquivo binário atual
+    with open(arquivo_indice, "r") as file:
+        indice = json.load(file)
+
+    cnpjs = np.array(indice["cnpjs"], dtype = np.int64)
+    meses = np.array(indice["meses"], dtype = str)
+    if len(cnpjs) == 0 or len(meses) == 0:
+        return None, None, None
+
+    # Mapeia o arquivo binário sem carregá-lo inteiro na memória
+    retornos = np.memmap(
+        f"{retornos_path}/{indice['arquivo']}",
+        dtype = np.float32,
+        mode = "r",
+        shape = (len(cnpjs), len(meses))
+    )
+
+    return retornos, cnpjs, meses
+
+
+# Função que junta novas séries de retornos ao painel salvo em disco
+def update_returns_panel(
+    dict_series: dict,
+    retornos_path: str = retornos_path
+):
+    """
+    Função que junta novas séries de retornos ao painel salvo em disco
+
+    Args:
+        dict_series (dict): Dicionário {cnpj: pd.Series de retornos mensais indexada por "YYYY-MM"}
+        retornos_path (str): Pasta onde o painel de retornos é armazenado
+
+    Returns:
+        retornos: np.memmap float32 (ativos x meses) atualizado
+        cnpjs: np.ndarray int64 com o CNPJ de cada linha
+        meses: np.ndarray com o mês de cada coluna
+        alteracoes: Meses já existentes que foram reescritos (mês parcial revisado, meses antigos preenchidos) e os valores
+            que eles tinham no painel antigo, para que update_return_statistics troque a contribuição deles; None caso não houvesse painel
+    """
+    os.makedirs(retornos_path, exist_ok = True)
+
+    # Painel atual e novas observações em formato longo (cnpj, mes, retorno)
+    retornos_antigos, cnpjs_antigos, meses_antigos = load_returns_panel(retornos_path)
+    df_novos = (
+        pd.concat({int(cnpj): serie for cnpj, serie in dict_series.items()}, names = ["cnpj", "mes"])
+        .rename("retorno")
+        .reset_index()
+    ) if len(dict_series) > 0 else pd.DataFrame({"cnpj": [], "mes": [], "retorno": []})
+
+    # União dos ativos e meses já salvos com os novos
+    if retornos_antigos is None:
+        cnpjs_antigos = np.array([], dtype = np.int64)
+        meses_antigos = np.array([], dtype = str)
+    cnpjs = np.union1d(cnpjs_antigos, df_novos["cnpj"].astype(np.int64).values)
+    meses = np.union1d(meses_antigos, df_novos["mes"].astype(str).values)
+
+    # Escreve o novo painel em um arquivo novo, para que leitores do painel antigo não sejam afetados
+    arquivo = f"retornos_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.f32"
+    retornos = np.memmap(f"{retornos_path}/{arquivo}", dtype = np.float32, mode = "w+", shape = (len(cnpjs), len(meses)))
+    retornos[:] = np.nan
+
+    # Meses do painel antigo que recebem novas observações, com os valores antigos desses meses (linhas na ordem de cnpjs_antigos)
+    alteracoes = None
+    if retornos_antigos is not None:
+        meses_alterados = np.intersect1d(meses_antigos, df_novos["mes"].astype(str).values)
+        alteracoes = {
+            "cnpjs_antigos": cnpjs_antigos,
+            "meses_antigos": meses_antigos,
+            "meses": meses_alterados,
+            "valores_antigos": np.array(retornos_antigos[:, np.searchsorted(meses_antigos, meses_alterados)])
+        }
+
+    # Copia o bloco antigo para a nova posição e sobrescreve com as novas observações
+    if retornos_antigos is not None:
+        retornos[np.ix_(np.searchsorted(cnpjs, cnpjs_antigos), np.searchsorted(meses, meses_antigos))] = retornos_antigos
+    retornos[
+        np.searchsorted(cnpjs, df_novos["cnpj"].astype(np.int64).values),
+        np.searchsorted(meses, df_novos["mes"].astype(str).values)
+    ] = df_novos["retorno"].astype(np.float32).values
+    retornos.flush()
+
+    # Troca o índice de forma atômica para apontar para o novo arquivo
+    arquivo_indice = f"{retornos_path}/indice.json"
+    arquivo_indice_antigo = None
+    if os.path.exists(arquivo_indice):
+        with open(arquivo_indice, "r") as file:
+            arquivo_indice_antigo = json.load(file)["arquivo"]
+    with open(f"{arquivo_indice}.tmp", "w") as file:
+        json.dump({"arquivo": arquivo, "cnpjs": cnpjs.tolist(), "meses": meses.tolist()}, file)
+    os.replace(f"{arquivo_indice}.tmp", arquivo_indice)
+
+    # Remove o arquivo antigo (pode falhar no Windows caso ainda esteja mapeado)
+    if arquivo_indice_antigo is not None:
+        try:
+            os.remove(f"{retornos_path}/{arquivo_indice_antigo}")
+        except OSError as e:
+            print(f"Erro ao remover painel antigo: {e}")
+
+    return (*load_returns_panel(retornos_path), alteracoes)
+
+
+# Função que calcula os momentos par a par (ignorando NaN) de um bloco do painel de retornos
+def compute_pairwise_moments(
+    retornos: np.ndarray
+):
+    """
+    Função que calcula os momentos par a par (ignorando NaN) de um bloco do painel de retornos
+
+    Args:
+        retornos (np.ndarray): Matriz (ativos x meses) de retornos, com NaN onde não há dado
+
+    Returns:
+        dict: Matrizes (ativos x ativos) com quantidade de meses em comum, somas, somas dos quadrados e somas dos produtos
+    """
+    # Máscara de observações válidas e retornos com NaN trocado por zero
+    retornos = np.asarray(retornos, dtype = np.float64)
+    mascara = (~np.isnan(retornos)).astype(np.float64)
+    retornos = np.nan_to_num(retornos, nan = 0.0)
+
+    # Cada momento é um produto de matrizes: o elemento [i, j] considera somente meses em que i e j têm dado
+    momentos = {
+        "n": mascara @ mascara.T,
+        "soma": retornos @ mascara.T,
+        "soma_quadrados": (retornos ** 2) @ mascara.T,
+        "soma_produtos": retornos @ retornos.T
+    }
+
+    return momentos
+
+
+# Função que atualiza a covariância e correlação dos retornos, recalculando somente os meses novos ou reescritos
+def update_return_statistics(
+    alteracoes: dict = None,
+    retornos_path: str = retornos_path
+):
+    """
+    Função que atualiza a covariância e correlação dos retornos, recalculando somente os meses novos ou reescritos
+
+    Os momentos são somas sobre os meses, então a contribuição de um mês reescrito é trocada subtraindo a dos valores
+    antigos e somando a dos novos. Caso o cache não corresponda ao painel anterior à atualização, tudo é recalculado.
+
+    Args:
+        alteracoes (dict): Meses reescritos retornados por update_returns_panel, caso None considera que o painel somente ganhou meses
+        retornos_path (str): Pasta onde o painel de retornos é armazenado
+
+    Returns:
+        dict: CNPJs, quantidade de meses em comum, covariância e correlação mensais, ou None caso não exista painel
+    """
+    retornos, cnpjs, meses = load_returns_panel(retornos_path)
+    if retornos is None:
+        return None
+
+    # Caso o cache seja do painel anterior, com os mesmos ativos, troca somente a contribuição dos meses reescritos e soma a dos meses novos
+    arquivo_momentos = f"{retornos_path}/momentos.npz"
+    momentos = None
+    if os.path.exists(arquivo_momentos):
+        cache = np.load(arquivo_momentos)
+        cache_do_painel_anterior = alteracoes is None or (
+            np.array_equal(cache["cnpjs"], alteracoes["cnpjs_antigos"]) and np.array_equal(cache["meses"], alteracoes["meses_antigos"])
+        )
+        if cache_do_painel_anterior and np.array_equal(cache["cnpjs"], cnpjs) and np.isin(cache["meses"], meses).all():
+            meses_novos = ~np.isin(meses, cache["meses"])
+            momentos = {chave: cache[chave] for chave in ["n", "soma", "soma_quadrados", "soma_produtos"]}
+            meses_alterados = alteracoes["meses"] if alteracoes is not None else []
+
+            if len(meses_alterados) > 0:
+                antigo = compute_pairwise_moments(alteracoes["valores_antigos"])
+                novo = compute_pairwise_moments(retornos[:, np.searchsorted(meses, meses_alterados)])
+                momentos = {chave: momentos[chave] - antigo[chave] + novo[chave] for chave in momentos}
+
+            if meses_novos.any():
+                incremento = compute_pairwise_moments(retornos[:, meses_novos])
+                momentos = {chave: momentos[chave] + incremento[chave] for chave in momentos}
+
+            if len(meses_alterados) == 0 and meses_novos.any() == False:
+                return load_return_statistics_file(arquivo_momentos)
+
+    # Caso contrário, calcula todos os momentos do painel
+    if momentos is None:
+        momentos = compute_pairwise_moments(retornos)
+
+    # Salva o cache de forma atômica
+    with open(f"{arquivo_momentos}.tmp", "wb") as file:
+        np.savez(file, cnpjs = cnpjs, meses = meses, **momentos)
+    os.replace(f"{arquivo_momentos}.tmp", arquivo_momentos)
+
+    return load_return_statistics_file(arquivo_momentos)
+
+
+# Função que deriva covariância e correlação a partir dos momentos salvos em cache
+def load_return_statistics_file(
+    arquivo_momentos: str
+):
+    """
+    Função que deriva covariância e correlação a partir dos momentos salvos em cache
+
+    Args:
+        arquivo_momentos (str): Arquivo .npz com os momentos par a par
+
+    Returns:
+        dict: CNPJs, quantidade de meses em comum, covariância e correlação mensais
+    """
+    cache = np.load(arquivo_momentos)
+    n = cache["n"]
+    soma = cache["soma"]
+    soma_quadrados = cache["soma_quadrados"]
+
+    # Covariância amostral par a par e variâncias de cada ativo nos meses em comum com o outro
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        covariancia = (cache["soma_produtos"] - soma * soma.T / n) / (n - 1)
+        variancia = (soma_quadrados - soma ** 2 / n) / (n - 1)
+        correlacao = np.clip(covariancia / np.sqrt(variancia * variancia.T), -1, 1)
+
+    # Pares com poucos meses em comum não têm estimativa confiável
+    covariancia[n < 2] = np.nan
+    correlacao[n < MIN_MESES_CORRELACAO] = np.nan
+    np.fill_diagonal(correlacao, 1.0)
+
+    return {"cnpjs": cache["cnpjs"], "n": n, "covariancia": covariancia, "correlacao": correlacao}
+
+
+# Carrega estatísticas dos retornos uma única vez por versão do cache
+@st.cache_resource
+def load_return_statistics(
+    versao: float
+):
+    """
+    Função que carrega estatísticas dos retornos uma única vez por versão do cache
+
+    Args:
+        versao (float): Data de modificação do cache de momentos, usada como chave do cache do Streamlit
+
+    Returns:
+        dict: CNPJs, quantidade de meses em comum, covariância e correlação mensais
+    """
+    return load_return_statistics_file(f"{retornos_path}/momentos.npz")
+
+
+# Função que monta a matriz de correlação de um conjunto de ativos a partir das estatísticas em cache
+def correlation_for_assets(
+    list_cnpj: list,
+    CORRELACAO_PADRAO: float = CORRELACAO_PADRAO
+):
+    """
+    Função que monta a matriz de correlação de um conjunto de ativos a partir das estatísticas em cache
+
+    Args:
+        list_cnpj (list): CNPJs dos ativos
+        CORRELACAO_PADRAO (float): Correlação usada quando o par não tem histórico suficiente
+
+    Returns:
+        correlacao: Matriz de correlação dos ativos, ou None caso não exista cache de estatísticas
+        cobertura: Percentual de pares com correlação histórica
+    """
+    arquivo_momentos = f"{retornos_path}/momentos.npz"
+    if os.path.exists(arquivo_momentos) == False:
+        return None, 0.0
+
+    estatisticas = load_return_statistics(os.path.getmtime(arquivo_momentos))
+
+    # Localiza cada ativo no painel
+    cnpjs = pd.to_numeric(pd.Series(list_cnpj), errors = "coerce").fillna(-1).astype(np.int64).values
+    posicao = np.clip(np.searchsorted(estatisticas["cnpjs"], cnpjs), 0, len(estatisticas["cnpjs"]) - 1)
+    encontrado = estatisticas["cnpjs"][posicao] == cnpjs
+
+    # Submatriz de correlação, completando pares sem histórico com a correlação padrão
+    correlacao = estatisticas["correlacao"][np.ix_(posicao, posicao)].copy()
+    correlacao[~(encontrado[:, None] & encontrado[None, :])] = np.nan
+    cobertura = np.mean(~np.isnan(correlacao))
+    correlacao = np.nan_to_num(correlacao, nan = CORRELACAO_PADRAO)
+    np.fill_diagonal(correlacao, 1.0)
+
+    return correlacao, cobertura
+
+
+# Função que executa o webscrapping das séries de retornos mensais e atualiza o painel e o cache de covariância
+def webscrapping_retornos_mensais(
+    list_categorias: list,
+    tab_webscrapping: st.tabs = None,
+    progress_callback = None,
+    cancel_event: threading.Event = None,
+    rate_limiter: AdaptiveRateLimiter = None
+):
+    """
+    Função que executa o webscrapping das séries de retornos mensais e atualiza o painel e o cache de covariância
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        tab_webscrapping (st.tabs): Aba de webscrapping, caso None nada é escrito na tela (execução em segundo plano)
+        progress_callback (function): Função chamada a cada ativo com (count, total, texto)
+        cancel_event (threading.Event): Quando sinalizado, interrompe o webscrapping e salva o que já foi coletado
+        rate_limiter (AdaptiveRateLimiter): Controle da taxa de requisições, caso None cria um novo a partir de SLEEP_SECONDS
+
+    Returns:
+        estatisticas: Covariância e correlação atualizadas, ou None caso nenhuma série tenha sido encontrada
+        list_not_found: Lista de ativos não encontrados
+    """
+    # Abertura de listas vazias e contadores para o Loop
+    dm_ativos = pd.DataFrame()
+    dict_series = {}
+    list_not_found = []
+    count = 0
+
+    # Caso seja executado direto na tela, cria barra de progresso com atualizações limitadas
+    if progress_callback is None and tab_webscrapping is not None:
+        progress_callback = progress_bar_callback(tab_webscrapping)
+
+    # Para cada categoria de ativos da SuperCarteira, pega cnpj de gestora de fundos de investimento desta categoria
+    for categoria in list_categorias:
+        dm_ativos = get_cnpj(dm_ativos, f"{input_path}/SuperCarteira_{categoria}.json", categoria).reset_index(drop = True)
+    list_cnpj = dm_ativos.cnpj.unique()
+
+    # Controle adaptativo da taxa de requisições
+    if rate_limiter is None:
+        rate_limiter = AdaptiveRateLimiter()
+
+    # Fila de ativos a consultar; ativos limitados pelo servidor voltam para o fim da fila
+    fila_ativos = deque(list_cnpj)
+    dict_tentativas = {}
+
+    # Para cada ativo da SuperCarteira, pega a série de retornos mensais
+    while len(fila_ativos) > 0:
+        ativo = fila_ativos.popleft()
+
+        # Interrompe caso o usuário tenha cancelado o webscrapping
+        if cancel_event is not None and cancel_event.is_set():
+            break
+
+        # try, se nao funcionar, então guarda mensagem de erro e contagem de erro
+        try:
+
+            # Executa a busca da informação, respeitando a taxa de requisições
+            serie_retornos = fetch_monthly_returns(ativo, rate_limiter)
+
+            # Caso o servidor esteja limitando as requisições, o ativo volta para a fila (até MAX_TENTATIVAS_LIMITE vezes)
+            if serie_retornos is None:
+                dict_tentativas[ativo] = dict_tentativas.get(ativo, 0) + 1
+                if dict_tentativas[ativo] < MAX_TENTATIVAS_LIMITE:
+                    fila_ativos.append(ativo)
+                    continue
+                raise Exception(f"Servidor limitou as requisições {MAX_TENTATIVAS_LIMITE} vezes")
+
+            count += 1
+            dict_series[ativo] = serie_retornos
+
+            # Publica o progresso (a tela é atualizada fora deste loop)
+            if progress_callback is not None:
+                progress_callback(count, len(list_cnpj), f"{count} dos {len(list_cnpj)} séries analisadas ({rate_limiter.taxa:.1f} req/s)")
+
+        # Caso não seja possível puxar algum dos ativos
+        except Exception as e:
+
+            # Adicionar o ativo a lista de ativos não encontrados
+            list_not_found.append(ativo)
+
+            print(f"Erro: {e}")
+            print(f"Erro no cnpj: {ativo}")
+
+    # Atualiza painel em disco e cache de covariância (somente meses novos ou reescritos são recalculados); sem nenhuma série
+    # (cancelado antes da primeira ou todas com erro) o painel salvo fica como estava
+    estatisticas = None
+    if len(dict_series) > 0:
+        *_, alteracoes = update_returns_panel(dict_series)
+        estatisticas = update_return_statistics(alteracoes)
+
+    # Retorna quantos ativos foram encontrados e quantos não foram
+    if tab_webscrapping is not None:
+        tab_webscrapping.write(f"Quantidade de séries encontradas: {len(dict_series)}")
+        tab_webscrapping.write(f"Quantidade de séries não encontradas: {len(list_not_found)}")
+
+    return estatisticas, list_not_found
+
+
+######## Métricas de Risco ########
+# Função que calcula o Sharpe em janelas móveis para todos os ativos de uma vez
+def rolling_sharpe(
+    retornos: np.ndarray,
+    janela: int,
+    taxa_livre_risco_mensal: float = 0.0
+):
+    """
+    Função que calcula o Sharpe em janelas móveis para todos os ativos de uma vez
+
+    Args:
+        retornos (np.ndarray): Matriz (ativos x meses) de retornos mensais em decimal, com NaN onde não há dado
+        janela (int): Tamanho da janela em meses
+        taxa_livre_risco_mensal (float): Taxa livre de risco mensal em decimal
+
+    Returns:
+        np.ndarray: Matriz (ativos x meses) com o Sharpe anualizado da janela terminada em cada mês, NaN onde a janela está incompleta
+    """
+    n_ativos, n_meses = retornos.shape
+    sharpe = np.full((n_ativos, n_meses), np.nan)
+    if n_meses < janela:
+        return sharpe
+
+    # Somas acumuladas permitem obter a soma de qualquer janela com uma subtração
+    excesso = retornos - taxa_livre_risco_mensal
+    mascara = ~np.isnan(excesso)
+    excesso = np.where(mascara, excesso, 0.0)
+    zeros = np.zeros((n_ativos, 1))
+    soma_acumulada = np.concatenate([zeros, np.cumsum(excesso, axis = 1)], axis = 1)
+    soma_quadrados_acumulada = np.concatenate([zeros, np.cumsum(excesso ** 2, axis = 1)], axis = 1)
+    n_acumulado = np.concatenate([zeros, np.cumsum(mascara, axis = 1)], axis = 1)
+
+    # Média e desvio padrão de cada janela
+    soma = soma_acumulada[:, janela:] - soma_acumulada[:, :-janela]
+    soma_quadrados = soma_quadrados_acumulada[:, janela:] - soma_quadrados_acumulada[:, :-janela]
+    n_janela = n_acumulado[:, janela:] - n_acumulado[:, :-janela]
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        desvio = np.sqrt(np.maximum(soma_quadrados - soma ** 2 / janela, 0) / (janela - 1))
+        sharpe_janela = (soma / janela) / desvio * np.sqrt(12)
+
+    # Somente janelas completas são válidas
+    sharpe_janela[n_janela < janela] = np.nan
+    sharpe[:, janela - 1:] = sharpe_janela
+
+    return sharpe
+
+
+# Função que calcula métricas de risco para todos os ativos do painel de uma vez
+def compute_risk_metrics(
+    retornos: np.ndarray,
+    cnpjs: np.ndarray,
+    TAXA_LIVRE_RISCO: float = TAXA_LIVRE_RISCO
+):
+    """
+    Função que calcula métricas de risco para todos os ativos do painel de uma vez
+
+    Args:
+        retornos (np.ndarray): Matriz (ativos x meses) de retornos mensais em decimal, com NaN onde não há dado
+        cnpjs (np.ndarray): CNPJ de cada linha da matriz
+        TAXA_LIVRE_RISCO (float): Taxa livre de risco em % a.a.
+
+    Returns:
+        df_metricas: DataFrame com uma linha por ativo e uma coluna por métrica de risco
+    """
+    retornos = np.asarray(retornos, dtype = np.float64)
+
+    # Painel sem meses: nenhum ativo tem métricas
+    if retornos.shape[1] == 0:
+        list_metricas = ["max_drawdown", "downside_deviation", "sortino", "calmar"] + [f"sharpe_rolling_{janela}m" for janela in JANELAS_SHARPE]
+        return pd.DataFrame({"cnpj": cnpjs, **{metrica: np.full(len(cnpjs), np.nan) for metrica in list_metricas}})
+
+    taxa_livre_risco_mensal = (1 + TAXA_LIVRE_RISCO / 100) ** (1 / 12) - 1
+    mascara = ~np.isnan(retornos)
+    n_meses = mascara.sum(axis = 1)
+
+    # Somente os meses observados de cada ativo, encostados à esquerda na ordem original (meses sem dado não entram no patrimônio)
+    ordem_observados = np.argsort(~mascara, axis = 1, kind = "stable")
+    retornos_observados = np.take_along_axis(retornos, ordem_observados, axis = 1)
+    observado = np.arange(retornos.shape[1])[None, :] < n_meses[:, None]
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+
+        # Evolução do patrimônio e drawdown em relação ao pico anterior (após o último mês observado o patrimônio não muda)
+        patrimonio = np.cumprod(1 + np.where(observado, retornos_observados, 0.0), axis = 1)
+        drawdown = patrimonio / np.maximum.accumulate(patrimonio, axis = 1) - 1
+        max_drawdown = np.where(observado, drawdown, 0.0).min(axis = 1)
+
+        # Retorno anualizado e desvio somente dos meses abaixo da taxa livre de risco
+        retorno_anual = patrimonio[:, -1] ** (12 / n_meses) - 1
+        desvio_negativo = np.where(observado, np.minimum(retornos_observados - taxa_livre_risco_mensal, 0), 0.0)
+        downside_deviation = np.sqrt((desvio_negativo ** 2).sum(axis = 1) / n_meses) * np.sqrt(12)
+
+        # Índices de retorno por risco
+        sortino = (retorno_anual - TAXA_LIVRE_RISCO / 100) / downside_deviation
+        calmar = retorno_anual / np.abs(max_drawdown)
+
+    df_metricas = pd.DataFrame({
+        "cnpj": cnpjs,
+        "max_drawdown": max_drawdown * 100,
+        "downside_deviation": downside_deviation * 100,
+        "sortino": sortino,
+        "calmar": calmar
+    })
+
+    # Sharpe da janela completa mais recente de cada ativo (ativos que ainda não reportaram o último mês usam a janela anterior)
+    for janela in JANELAS_SHARPE:
+        sharpe = rolling_sharpe(retornos, janela, taxa_livre_risco_mensal)
+        valido = np.isfinite(sharpe)
+        ultima_janela = sharpe.shape[1] - 1 - np.argmax(valido[:, ::-1], axis = 1)
+        df_metricas[f"sharpe_rolling_{janela}m"] = np.where(valido.any(axis = 1), sharpe[np.arange(len(sharpe)), ultima_janela], np.nan)
+
+    # Ativos sem observações ou com divisões por zero ficam sem métrica
+    df_metricas = df_metricas.replace([np.inf, -np.inf], np.nan)
+    df_metricas.loc[n_meses == 0, df_metricas.columns != "cnpj"] = np.nan
+
+    return df_metricas
+
+
+# Calcula métricas de risco uma única vez por versão do painel de retornos
+@st.cache_data
+def load_risk_metrics(
+    versao: float
+):
+    """
+    Função que calcula métricas de risco uma única vez por versão do painel de retornos
+
+    Args:
+        versao (float): Data de modificação do índice do painel, usada como chave do cache do Streamlit
+
+    Returns:
+        df_metricas: DataFrame com métricas de risco de cada ativo
+    """
+    retornos, cnpjs, meses = load_returns_panel()
+    if retornos is None:
+        return pd.DataFrame({"cnpj": np.array([], dtype = np.int64), **{metrica: np.array([], dtype = np.float64) for metrica in RISK_METRIC_OPTIONS}})
+
+    return compute_risk_metrics(retornos, cnpjs)
+
+
+# Função que adiciona as métricas de risco ao DataFrame de resultados
+def add_risk_metrics(
+    df_result: pd.DataFrame
+):
+    """
+    Função que adiciona as métricas de risco ao DataFrame de resultados
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com dados do webscrapping
+
+    Returns:
+        df_result: DataFrame com uma coluna por métrica de risco (NaN caso não exista painel de retornos)
+    """
+    # Caso não exista painel de retornos, cria as colunas vazias
+    arquivo_indice = f"{retornos_path}/indice.json"
+    if os.path.exists(arquivo_indice) == False:
+        return df_result.assign(**{metrica: np.nan for metrica in RISK_METRIC_OPTIONS if metrica not in df_result.columns})
+
+    # Alinha as métricas pelo cnpj e só acrescenta as colunas (ao contrário de um merge, as colunas existentes não são copiadas)
+    df_metricas = load_risk_metrics(os.path.getmtime(arquivo_indice)).astype({"cnpj": "Int64"}).set_index("cnpj")
+    df_metricas = df_metricas.reindex(pd.to_numeric(df_result["cnpj"], errors = "coerce").astype("Int64"))
+    df_result = (
+        df_result
+        .drop(columns = [metrica for metrica in RISK_METRIC_OPTIONS if metrica in df_result.columns])
+        .assign(**{metrica: df_metricas[metrica].to_numpy() for metrica in df_metricas.columns})
+    )
+
+    return df_result
+
+
+######## Histórico de Webscrappings ########
+# Função que lista os arquivos de índice do histórico de webscrappings (um por execução, dentro da partição da sua data)
+def history_index_files(
+    historico_path: str = historico_path
+):
+    """
+    Função que lista os arquivos de índice do histórico de webscrappings (um por execução, dentro da partição da sua data)
+
+    Args:
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        list: Caminhos dos arquivos de índice, do mais antigo para o mais recente (o indice.parquet único de versões
+              anteriores da ferramenta, caso exista, vem primeiro)
+    """
+    if os.path.exists(historico_path) == False:
+        return []
+
+    list_arquivos = [f"{historico_path}/indice.parquet"] if os.path.exists(f"{historico_path}/indice.parquet") else []
+    for particao in sorted(os.listdir(historico_path)):
+        if particao.startswith("run_date=") and os.path.isdir(f"{historico_path}/{particao}"):
+            list_arquivos += [
+                f"{historico_path}/{particao}/{nome}"
+                for nome in sorted(os.listdir(f"{historico_path}/{particao}"))
+                if nome.endswith(SUFIXO_INDICE_HISTORICO)
+            ]
+
+    return list_arquivos
+
+
+# Junta os índices de todas as execuções uma única vez por versão do histórico
+@st.cache_data(max_entries = 2)
+def load_history_index(
+    versao: str,
+    historico_path: str = historico_path
+):
+    """
+    Função que junta os índices de todas as execuções uma única vez por versão do histórico
+
+    Args:
+        versao (str): Retorno de history_version (chave do cache do Streamlit)
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        df_indice: DataFrame com cnpj, run_date, run_time e arquivo de cada registro, ordenado por cnpj e data
+    """
+    tabela = pa.concat_tables([pq.read_table(arquivo) for arquivo in history_index_files(historico_path)], promote_options = "default")
+
+    return tabela.to_pandas().sort_values(by = ["cnpj", "run_date", "run_time"]).reset_index(drop = True)
+
+
+# Função que le o índice (cnpj, run_date) do histórico de webscrappings
+def read_history_index(
+    historico_path: str = historico_path
+):
+    """
+    Função que le o índice (cnpj, run_date) do histórico de webscrappings
+
+    Args:
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        df_indice: DataFrame com cnpj, run_date, run_time e arquivo de cada registro, ou None caso não exista histórico
+    """
+    versao = history_version(historico_path)
+    if versao is None:
+        return None
+
+    return load_history_index(versao, historico_path)
+
+
+# Função que retorna a versão do histórico de webscrappings (usada para invalidar as análises sobre posições do histórico)
+def history_version(
+    historico_path: str = historico_path
+):
+    """
+    Função que retorna a versão do histórico de webscrappings (usada para invalidar as análises sobre posições do histórico)
+
+    Args:
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        str: Quantidade de execuções e data de modificação do índice mais recente, ou None caso não exista histórico
+    """
+    list_arquivos = history_index_files(historico_path)
+    if len(list_arquivos) == 0:
+        return None
+
+    return f"{len(list_arquivos)}:{os.path.getmtime(list_arquivos[-1])}"
+
+
+# Função que adiciona o resultado de um webscrapping ao histórico
+def history_append(
+    df_result: pd.DataFrame,
+    run_time: datetime = None,
+    historico_path: str = historico_path
+):
+    """
+    Função que adiciona o resultado de um webscrapping ao histórico
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com resultados do webscrapping
+        run_time (datetime): Momento do webscrapping, caso None usa o momento atual
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        arquivo: Caminho relativo do arquivo gravado
+    """
+    # Cada execução vira um arquivo dentro da partição da sua data
+    run_time = datetime.now() if run_time is None else run_time
+    run_date = run_time.strftime("%Y-%m-%d")
+    arquivo = f"run_date={run_date}/{run_time.strftime('%Y-%m-%d %H-%M-%S')}.parquet"
+    os.makedirs(f"{historico_path}/run_date={run_date}", exist_ok = True)
+
+    # Ordena por cnpj para que os filtros de leitura descartem row groups inteiros
+    df_historico = (
+        df_result
+        .assign(cnpj = lambda _: pd.to_numeric(_.cnpj, errors = "coerce"))
+        .dropna(subset = ["cnpj"])
+        .astype({"cnpj": np.int64})
+        .assign(run_time = pd.Timestamp(run_time))
+        .sort_values(by = "cnpj")
+    )
+    pq.write_table(pa.Table.from_pandas(df_historico, preserve_index = False), f"{historico_path}/{arquivo}.tmp")
+    os.replace(f"{historico_path}/{arquivo}.tmp", f"{historico_path}/{arquivo}")
+
+    # Grava o índice (cnpj, run_date) desta execução ao lado dos dados, de forma atômica e sem tocar nos índices anteriores
+    arquivo_indice = f"{historico_path}/{arquivo.removesuffix('.parquet')}{SUFIXO_INDICE_HISTORICO}"
+    pd.DataFrame({
+        "cnpj": df_historico["cnpj"].unique(),
+        "run_date": run_date,
+        "run_time": pd.Timestamp(run_time),
+        "arquivo": arquivo
+    }).to_parquet(f"{arquivo_indice}.tmp", index = False)
+    os.replace(f"{arquivo_indice}.tmp", arquivo_indice)
+
+    return arquivo
+
+
+# Função que le somente as colunas e ativos pedidos de um conjunto de arquivos do histórico
+def read_history_files(
+    df_indice: pd.DataFrame,
+    columns: list = None,
+    historico_path: str = historico_path
+):
+    """
+    Função que le somente as colunas e ativos pedidos de um conjunto de arquivos do histórico
+
+    Args:
+        df_indice (pd.DataFrame): Recorte do índice com os pares (cnpj, arquivo) a serem lidos
+        columns (list): Colunas a serem lidas, caso None le todas
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        pd.DataFrame: Registros do histórico
+    """
+    list_df = []
+
+    # Le cada arquivo uma única vez, filtrando os cnpjs direto no Parquet
+    for arquivo, df_indice_arquivo in df_indice.groupby("arquivo"):
+        caminho = f"{historico_path}/{arquivo}"
+        colunas_arquivo = pq.read_schema(caminho).names
+        colunas_leitura = None if columns is None else [column for column in dict.fromkeys(["cnpj", "run_time"] + list(columns)) if column in colunas_arquivo]
+        tabela = pq.read_table(caminho, columns = colunas_leitura, filters = [("cnpj", "in", df_indice_arquivo["cnpj"].tolist())])
+        list_df.append(tabela.to_pandas())
+
+    if len(list_df) == 0:
+        return pd.DataFrame(columns = ["cnpj", "run_time"] + list(columns or []))
+
+    return pd.concat(list_df, ignore_index = True)
+
+
+# Função que retorna a última posição de cada ativo conhecida até uma data
+def history_snapshot(
+    as_of: str,
+    columns: list = None,
+    list_cnpj: list = None,
+    historico_path: str = historico_path
+):
+    """
+    Função que retorna a última posição de cada ativo conhecida até uma data
+
+    Args:
+        as_of (str): Data no formato "YYYY-MM-DD" (inclusive)
+        columns (list): Colunas a serem lidas, caso None le todas
+        list_cnpj (list): Ativos de interesse, caso None considera todos
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        pd.DataFrame: Uma linha por ativo com o resultado do último webscrapping até a data
+    """
+    df_indice = read_history_index(historico_path)
+    if df_indice is None:
+        return pd.DataFrame()
+
+    # Usa o índice para decidir quais partições ler
+    as_of = pd.Timestamp(as_of).strftime("%Y-%m-%d")
+    df_indice = df_indice.query("run_date <= @as_of")
+    if list_cnpj is not None:
+        df_indice = df_indice[df_indice["cnpj"].isin(pd.to_numeric(pd.Series(list_cnpj)).astype(np.int64))]
+    df_indice = df_indice.sort_values(by = "run_time").groupby("cnpj").tail(1)
+
+    return read_history_files(df_indice, columns, historico_path).sort_values(by = "cnpj").reset_index(drop = True)
+
+
+# Função que retorna a evolução de colunas de um ou mais ativos ao longo dos webscrappings
+def history_trajectory(
+    list_cnpj: list,
+    columns: list = None,
+    historico_path: str = historico_path
+):
+    """
+    Função que retorna a evolução de colunas de um ou mais ativos ao longo dos webscrappings
+
+    Args:
+        list_cnpj (list): Ativos de interesse
+        columns (list): Colunas a serem lidas, caso None somente score_all
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        pd.DataFrame: Uma linha por ativo e webscrapping, ordenado por data
+    """
+    columns = ["score_all"] if columns is None else columns
+    df_indice = read_history_index(historico_path)
+    if df_indice is None:
+        return pd.DataFrame(columns = ["cnpj", "run_time"] + list(columns))
+
+    # Somente as partições em que os ativos aparecem são lidas
+    df_indice = df_indice[df_indice["cnpj"].isin(pd.to_numeric(pd.Series(list_cnpj)).astype(np.int64))]
+
+    return read_history_files(df_indice, columns, historico_path).sort_values(by = ["cnpj", "run_time"]).reset_index(drop = True)
+
+
+######## Resumo por Categoria ########
+# Função que calcula o resumo de cada categoria (quantidade, participação no BTG e quantis das medidas de cada horizonte)
+def summarize_categories(
+    df_result: pd.DataFrame,
+    QUANTIS_RESUMO: list = QUANTIS_RESUMO,
+    MEDIDAS_RESUMO: list = MEDIDAS_RESUMO,
+    SCORE_OPTIONS: list = SCORE_OPTIONS
+):
+    """
+    Função que calcula o resumo de cada categoria (quantidade, participação no BTG e quantis das medidas de cada horizonte)
+
+    Todas as colunas são agregadas de uma vez pelos códigos da coluna categoria; a última linha resume o universo inteiro.
+
+    Args:
+        df_result (pd.DataFrame): DataFrame de resultados
+        QUANTIS_RESUMO (list): Quantis calculados para cada medida
+        MEDIDAS_RESUMO (list): Medidas resumidas
+        SCORE_OPTIONS (list): Horizontes das medidas
+
+    Returns:
+        df_resumo: DataFrame com uma linha por categoria e colunas n_fundos, participacao_btg e {medida}_{horizonte}_p{quantil}
+    """
+    list_colunas = [f"{medida}_{score}" for medida in MEDIDAS_RESUMO for score in SCORE_OPTIONS if f"{medida}_{score}" in df_result.columns]
+    codigos = df_result["categoria"].astype("category").cat.codes.rename("codigo")
+    categorias = df_result["categoria"].astype("category").cat.categories
+    btg = df_result["disponibilidade_btg"] if "disponibilidade_btg" in df_result.columns else pd.Series(False, index = df_result.index)
+
+    # Quantidade e participação no BTG por categoria (código -1 são fundos sem categoria, que entram somente no universo inteiro)
+    agrupado = df_result[list_colunas].assign(btg = btg.astype(float)).groupby(codigos.to_numpy())
+    df_resumo = pd.DataFrame({"n_fundos": agrupado.size(), "participacao_btg": agrupado["btg"].mean()})
+
+    # Quantis de todas as colunas em uma única passada (linhas: categoria x quantil)
+    df_quantis = agrupado[list_colunas].quantile(QUANTIS_RESUMO).unstack()
+
+    # Universo inteiro, com o código seguinte ao da última categoria (fundos em mais de uma categoria contam uma única vez)
+    codigo_total = len(categorias)
+    unicos = ~df_result["cnpj"].duplicated().to_numpy()
+    df_total = pd.DataFrame({"n_fundos": [int(unicos.sum())], "participacao_btg": [btg[unicos].astype(float).mean()]}, index = [codigo_total])
+    df_quantis_total = df_result.loc[unicos, list_colunas].quantile(QUANTIS_RESUMO).unstack().to_frame().T.set_axis([codigo_total])
+
+    df_resumo = pd.concat([
+        pd.concat([df_resumo, df_quantis], axis = 1).drop(index = -1, errors = "ignore"),
+        pd.concat([df_total, df_quantis_total], axis = 1)
+    ])
+    df_resumo.columns = [coluna if isinstance(coluna, str) else f"{coluna[0]}_p{round(coluna[1] * 100)}" for coluna in df_resumo.columns]
+
+    # Códigos de volta para os nomes das categorias
+    df_resumo.index = np.array(list(categorias) + [CATEGORIA_TOTAL_RESUMO], dtype = object)[df_resumo.index]
+
+    return df_resumo.rename_axis("categoria").reset_index()
+
+
+# Função que retorna o arquivo de resumo gravado junto de uma versão do dataset compartilhado
+def category_summary_file(
+    arquivo: str,
+    dataset_path: str = dataset_path
+):
+    """
+    Função que retorna o arquivo de resumo gravado junto de uma versão do dataset compartilhado
+
+    Args:
+        arquivo (str): Nome do arquivo Arrow do dataset
+        dataset_path (str): Pasta do dataset compartilhado
+
+    Returns:
+        str: Caminho do arquivo Parquet com o resumo por categoria
+    """
+    return f"{dataset_path}/{arquivo.removesuffix('.arrow')}_resumo.parquet"
+
+
+# Resumo por categoria calculado (ou lido do disco) uma única vez por versão dos dados
+@st.cache_resource(max_entries = 8)
+def load_category_summary(
+    versao_dataset: str,
+    _df_result: pd.DataFrame
+):
+    """
+    Função que retorna o resumo por categoria, calculado (ou lido do disco) uma única vez por versão dos dados
+
+    Args:
+        versao_dataset (str): Identificador da versão dos dados (chave do cache)
+        _df_result (pd.DataFrame): DataFrame de resultados da versão (não é usado como chave)
+
+    Returns:
+        df_resumo: DataFrame compartilhado (somente leitura) com o resumo de cada categoria
+    """
+    # O dataset compartilhado já tem o resumo gravado na publicação
+    fonte = versao_dataset.split("|")[0]
+    if fonte.startswith("dataset:"):
+        arquivo_resumo = category_summary_file(fonte.removeprefix("dataset:"))
+        if os.path.exists(arquivo_resumo):
+            return pd.read_parquet(arquivo_resumo)
+
+    return summarize_categories(_df_result)
+
+
+######## Dataset Compartilhado ########
+# Função que publica a posição mais recente dos webscrappings como dataset compartilhado entre as sessões
+def publish_dataset(
+    df_result: pd.DataFrame = None,
+    dataset_path: str = dataset_path
+):
+    """
+    Função que publica a posição mais recente dos webscrappings como dataset compartilhado entre as sessões
+
+    O dataset é gravado em um novo arquivo Arrow (IPC) e só então o ponteiro atual.json é trocado, de forma atômica.
+    Sessões que já leram a versão anterior continuam com ela até o próximo rerun.
+
+    Args:
+        df_result (pd.DataFrame): Dados a publicar, caso None usa a última posição de cada ativo no histórico
+        dataset_path (str): Pasta do dataset compartilhado
+
+    Returns:
+        arquivo: Nome do arquivo publicado, ou None caso não haja dados
+    """
+    if df_result is None:
+        df_result = history_snapshot(datetime.now()).drop(columns = "run_time", errors = "ignore")
+    if df_result.empty:
+        return None
+
+    # Grava a nova versão em um arquivo próprio
+    os.makedirs(dataset_path, exist_ok = True)
+    arquivo = f"dataset_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.arrow"
+    df_result = apply_result_schema(df_result)
+    tabela = pa.Table.from_pandas(df_result, preserve_index = False)
+    with pa.OSFile(f"{dataset_path}/{arquivo}.tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, tabela.schema) as writer:
+            writer.write_table(tabela)
+    os.replace(f"{dataset_path}/{arquivo}.tmp", f"{dataset_path}/{arquivo}")
+
+    # Resumo por categoria gravado junto do dataset (calculado uma única vez por publicação)
+    summarize_categories(df_result).to_parquet(category_summary_file(arquivo, dataset_path), index = False)
+
+    # Troca o ponteiro de forma atômica
+    with open(f"{dataset_path}/atual.json.tmp", "w") as file:
+        json.dump({"arquivo": arquivo}, file)
+    os.replace(f"{dataset_path}/atual.json.tmp", f"{dataset_path}/atual.json")
+
+    # Remove versões antigas (arquivos ainda mapeados por outro processo podem não ser removidos no Windows)
+    for arquivo_antigo in sorted(nome for nome in os.listdir(dataset_path) if nome.endswith(".arrow"))[:-MAX_VERSOES_DATASET]:
+        for arquivo_remover in [f"{dataset_path}/{arquivo_antigo}", category_summary_file(arquivo_antigo, dataset_path)]:
+            try:
+                os.remove(arquivo_remover)
+            except OSError:
+                pass
+
+    return arquivo
+
+
+# Função que retorna o arquivo da versão atual do dataset compartilhado
+def current_dataset_version(
+    dataset_path: str = dataset_path
+):
+    """
+    Função que retorna o arquivo da versão atual do dataset compartilhado
+
+    Args:
+        dataset_path (str): Pasta do dataset compartilhado
+
+    Returns:
+        arquivo: Nome do arquivo Arrow atual, ou None caso nenhum dataset tenha sido publicado
+    """
+    arquivo_ponteiro = f"{dataset_path}/atual.json"
+    if os.path.exists(arquivo_ponteiro) == False:
+        return None
+
+    with open(arquivo_ponteiro, "r") as file:
+        return json.load(file)["arquivo"]
+
+
+# Função que retorna a versão do painel de retornos (usada para invalidar os datasets com métricas de risco)
+def returns_panel_version():
+    """
+    Função que retorna a versão do painel de retornos (usada para invalidar os datasets com métricas de risco)
+
+    Args:
+        None
+
+    Returns:
+        float: Data de modificação do índice do painel, ou None caso não exista painel
+    """
+    arquivo_indice = f"{retornos_path}/indice.json"
+
+    return os.path.getmtime(arquivo_indice) if os.path.exists(arquivo_indice) else None
+
+
+# Função que carrega uma versão do dataset compartilhado uma única vez por processo
+@st.cache_resource(max_entries = MAX_VERSOES_DATASET)
+def load_shared_dataset(
+    arquivo: str,
+    versao_retornos: float = None,
+    dataset_path: str = dataset_path
+):
+    """
+    Função que carrega uma versão do dataset compartilhado uma única vez por processo
+
+    O arquivo Arrow é lido por memory map e já foi gravado com o schema compacto, que o to_pandas restaura. Colunas
+    numéricas sem nulos continuam apontando para o memory map; as demais (texto, category, inteiros com nulos) são
+    convertidas uma única vez, liberando os buffers Arrow à medida que cada coluna é convertida. O DataFrame resultante
+    (com métricas de risco) é o mesmo objeto para todas as sessões, por isso nunca deve ser alterado no lugar.
+
+    Args:
+        arquivo (str): Nome do arquivo Arrow (chave da versão)
+        versao_retornos (float): Versão do painel de retornos, somente para invalidar o cache
+        dataset_path (str): Pasta do dataset compartilhado
+
+    Returns:
+        df_result: DataFrame compartilhado (somente leitura)
+    """
+    tabela = pa.ipc.open_file(pa.memory_map(f"{dataset_path}/{arquivo}", "r")).read_all()
+    df_result = tabela.to_pandas(self_destruct = True, split_blocks = True)
+    del tabela
+
+    return add_risk_metrics(df_result)
+
+
+# Função que carrega o template de resultados uma única vez por processo
+@st.cache_resource(max_entries = 2)
+def load_template_result(
+    versao: float,
+    versao_retornos: float = None,
+    preparar: bool = True
+):
+    """
+    Função que carrega o template de resultados uma única vez por processo
+
+    Args:
+        versao (float): Data de modificação do arquivo template, somente para invalidar o cache
+        versao_retornos (float): Versão do painel de retornos, somente para invalidar o cache
+        preparar (bool): Aplica schema compacto e métricas de risco; caso False retorna o arquivo como está
+
+    Returns:
+        df_template: DataFrame compartilhado (somente leitura)
+    """
+    df_template = pd.read_excel("Template_SuperCarteira_Result.xlsx", engine = "openpyxl")
+    if preparar == False:
+        return df_template
+
+    return add_risk_metrics(apply_result_schema(df_template))
+
+
+######## Upload de Arquivos ########
+# Função que retorna as colunas do template de resultados (referência para validar uploads)
+@st.cache_resource
+def template_result_columns(
+    versao: float
+):
+    """
+    Função que retorna as colunas do template de resultados (referência para validar uploads)
+
+    Args:
+        versao (float): Data de modificação do arquivo template, somente para invalidar o cache
+
+    Returns:
+        list: Colunas do Template_SuperCarteira_Result.xlsx
+    """
+    return list(pd.read_excel("Template_SuperCarteira_Result.xlsx", engine = "openpyxl", nrows = 0).columns)
+
+
+# Função que define o tipo de leitura de cada coluna conhecida (evita inferência de tipos em arquivos grandes)
+def upload_dtype_hints(
+    colunas: list
+):
+    """
+    Função que define o tipo de leitura de cada coluna conhecida (evita inferência de tipos em arquivos grandes)
+
+    Args:
+        colunas (list): Colunas que serão lidas
+
+    Returns:
+        dict: Tipo de leitura de cada coluna (o schema compacto é aplicado depois da leitura)
+    """
+    dict_dtypes = {}
+    for coluna in colunas:
+        if coluna in ["cnpj", "CNPJ", "name"]:
+            dict_dtypes[coluna] = str
+        elif coluna.startswith(("profitability_", "volatility_", "score_", "sharpe_", "perc_")):
+            dict_dtypes[coluna] = np.float32
+
+    return dict_dtypes
+
+
+# Função que le um arquivo carregado pelo usuário (cache pelo hash do conteúdo)
+@st.cache_data(max_entries = 8, show_spinner = False)
+def parse_upload(
+    hash_upload: str,
+    nome_arquivo: str,
+    _bytes_data: bytes,
+    colunas_uso: tuple = None,
+    colunas_obrigatorias: tuple = (),
+    renomear: dict = None
+):
+    """
+    Função que le um arquivo carregado pelo usuário (cache pelo hash do conteúdo)
+
+    Args:
+        hash_upload (str): Hash SHA-256 do conteúdo (chave do cache; o conteúdo em si não é hasheado pelo Streamlit)
+        nome_arquivo (str): Nome do arquivo, usado para identificar o formato (xlsx, csv ou parquet)
+        _bytes_data (bytes): Conteúdo do arquivo
+        colunas_uso (tuple): Colunas lidas do arquivo, caso None le todas
+        colunas_obrigatorias (tuple): Colunas que precisam existir (após renomear)
+        renomear (dict): Colunas renomeadas logo após a leitura
+
+    Returns:
+        df_upload: DataFrame com o schema compacto aplicado
+
+    Raises:
+        ValueError: Formato não suportado ou colunas obrigatórias ausentes
+    """
+    formato = nome_arquivo.rsplit(".", 1)[-1].lower()
+    renomear = renomear or {}
+
+    # Colunas lidas, considerando também o nome original das colunas renomeadas
+    set_uso = None
+    if colunas_uso is not None:
+        set_uso = set(colunas_uso) | {original for original, novo in renomear.items() if novo in colunas_uso}
+
+    # Lê somente as colunas usadas, com os tipos já definidos
+    if formato == "parquet":
+        colunas_arquivo = pq.read_schema(BytesIO(_bytes_data)).names
+        colunas_leitura = colunas_arquivo if set_uso is None else [coluna for coluna in colunas_arquivo if coluna in set_uso]
+        df_upload = pd.read_parquet(BytesIO(_bytes_data), columns = colunas_leitura)
+    elif formato in ["csv", "xlsx"]:
+        leitor = pd.read_csv if formato == "csv" else pd.read_excel
+        df_upload = leitor(
+            BytesIO(_bytes_data),
+            usecols = None if set_uso is None else (lambda coluna: coluna in set_uso),
+            dtype = upload_dtype_hints(set_uso or [])
+            )
+    else:
+        raise ValueError(f"Formato '{formato}' não suportado. Use um destes: {', '.join(FORMATOS_UPLOAD)}")
+
+    # Valida as colunas antes de qualquer processamento
+    df_upload = df_upload.rename(columns = renomear)
+    list_ausentes = [coluna for coluna in colunas_obrigatorias if coluna not in df_upload.columns]
+    if len(list_ausentes) > 0:
+        raise ValueError(f"O arquivo '{nome_arquivo}' não tem as colunas obrigatórias: {', '.join(list_ausentes)}")
+
+    return apply_result_schema(df_upload)
+
+
+# Função que le um arquivo carregado pelo usuário, mostrando um erro claro caso ele seja inválido
+def read_upload(
+    uploaded_file,
+    container,
+    colunas_uso: list = None,
+    colunas_obrigatorias: list = (),
+    renomear: dict = None
+):
+    """
+    Função que le um arquivo carregado pelo usuário, mostrando um erro claro caso ele seja inválido
+
+    Args:
+        uploaded_file (UploadedFile): Arquivo retornado pelo st.file_uploader
+        container (st.container): Onde mensagens de erro e avisos são exibidos
+        colunas_uso (list): Colunas lidas do arquivo, caso None le todas
+        colunas_obrigatorias (list): Colunas que precisam existir
+        renomear (dict): Colunas renomeadas logo após a leitura
+
+    Returns:
+        df_upload: DataFrame lido, ou None caso o arquivo seja inválido
+    """
+    bytes_data = uploaded_file.getvalue()
+    hash_upload = hashlib.sha256(bytes_data).hexdigest()
+
+    try:
+        df_upload = parse_upload(
+            hash_upload,
+            uploaded_file.name,
+            bytes_data,
+            None if colunas_uso is None else tuple(colunas_uso),
+            tuple(colunas_obrigatorias),
+            renomear
+        )
+    except ValueError as e:
+        container.error(f"{e}. Usando os dados padrão.")
+        return None
+
+    # Arquivos corrompidos ou com extensão trocada falham dentro dos leitores (zip inválido, encoding, parquet inválido...)
+    except Exception as e:
+        container.error(f"Não foi possível ler o arquivo {uploaded_file.name} ({type(e).__name__}: {e}). Usando os dados padrão.")
+        return None
+
+    # Colunas opcionais do template que não vieram no arquivo
+    if colunas_uso is not None:
+        list_ausentes = [coluna for coluna in colunas_uso if coluna not in df_upload.columns]
+        if len(list_ausentes) > 0:
+            container.warning(f"Colunas do template ausentes no arquivo (funcionalidades que dependem delas ficam indisponíveis): {', '.join(list_ausentes)}")
+
+    return df_upload
+
+
+######## Clusterização ########
+# Função que monta a matriz de características usada para agrupar os fundos
+def cluster_features(
+    df_ativos: pd.DataFrame,
+    retornos_path: str = retornos_path
+):
+    """
+    Função que monta a matriz de características usada para agrupar os fundos
+
+    As métricas (rentabilidade e volatilidade de cada horizonte) são padronizadas. Quando há painel de retornos, cada série mensal
+    padronizada e dividida pela raiz da quantidade de meses é adicionada: a distância euclidiana ao quadrado entre duas séries fica
+    2 * (1 - correlação), então fundos muito correlacionados ficam próximos mesmo com métricas diferentes.
+
+    Args:
+        df_ativos (pd.DataFrame): Um fundo por linha, com cnpj e as colunas de métricas
+        retornos_path (str): Pasta onde o painel de retornos é armazenado
+
+    Returns:
+        np.ndarray: Matriz (fundos x características) sem NaN
+    """
+    # Métricas padronizadas; valores ausentes ficam na média (zero)
+    colunas_metricas = [f"{medida}_{score}" for score in SCORE_OPTIONS for medida in ["profitability", "volatility"] if f"{medida}_{score}" in df_ativos.columns]
+    metricas = df_ativos[colunas_metricas].to_numpy(dtype = np.float64, na_value = np.nan)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        metricas = (metricas - np.nanmean(metricas, axis = 0)) / np.nanstd(metricas, axis = 0)
+    metricas = np.nan_to_num(metricas, nan = 0.0, posinf = 0.0, neginf = 0.0)
+
+    # Sem painel de retornos, somente as métricas
+    retornos, cnpjs_painel, _ = load_returns_panel(retornos_path)
+    if retornos is None or len(cnpjs_painel) == 0:
+        return metricas
+
+    # Localiza cada fundo no painel e pega os meses mais recentes
+    cnpjs = df_ativos["cnpj"].to_numpy(dtype = np.int64)
+    posicao = np.clip(np.searchsorted(cnpjs_painel, cnpjs), 0, len(cnpjs_painel) - 1)
+    encontrado = cnpjs_painel[posicao] == cnpjs
+    series = np.asarray(retornos[posicao, -MESES_CLUSTER:], dtype = np.float64)
+    series[~encontrado] = np.nan
+
+    # Padroniza cada série nos seus meses válidos; séries curtas demais não entram na correlação
+    n_meses = (~np.isnan(series)).sum(axis = 1, keepdims = True)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        series = (series - np.nanmean(series, axis = 1, keepdims = True)) / np.nanstd(series, axis = 1, keepdims = True) / np.sqrt(n_meses)
+    series[n_meses[:, 0] < MIN_MESES_CORRELACAO] = np.nan
+    series = np.nan_to_num(series, nan = 0.0, posinf = 0.0, neginf = 0.0)
+
+    # Cada série tem norma 1 e as métricas somam uma variância por coluna: os blocos são equilibrados antes de aplicar o peso
+    return np.hstack([metricas, PESO_CORRELACAO_CLUSTER * np.sqrt(len(colunas_metricas)) * series])
+
+
+# Função que calcula as distâncias euclidianas ao quadrado entre duas matrizes de pontos
+def squared_distances(
+    pontos: np.ndarray,
+    centros: np.ndarray
+):
+    """
+    Função que calcula as distâncias euclidianas ao quadrado entre duas matrizes de pontos
+
+    Args:
+        pontos (np.ndarray): Matriz (n x características)
+        centros (np.ndarray): Matriz (k x características)
+
+    Returns:
+        np.ndarray: Matriz (n x k) de distâncias ao quadrado
+    """
+    # |p - c|^2 = |p|^2 + |c|^2 - 2 p.c, com um único produto de matrizes
+    distancias = (pontos ** 2).sum(axis = 1)[:, None] + (centros ** 2).sum(axis = 1)[None, :] - 2 * pontos @ centros.T
+
+    return np.maximum(distancias, 0.0)
+
+
+# Função que agrupa pontos com k-means (inicialização k-means++)
+def kmeans(
+    pontos: np.ndarray,
+    n_clusters: int,
+    seed: int = SEED_CLUSTER,
+    MAX_ITERACOES_KMEANS: int = MAX_ITERACOES_KMEANS
+):
+    """
+    Função que agrupa pontos com k-means (inicialização k-means++)
+
+    Args:
+        pontos (np.ndarray): Matriz (n x características)
+        n_clusters (int): Quantidade de clusters (limitada à quantidade de pontos)
+        seed (int): Semente da inicialização
+        MAX_ITERACOES_KMEANS (int): Iterações máximas
+
+    Returns:
+        rotulos: Cluster de cada ponto (0 a n_clusters - 1)
+        centros: Matriz (n_clusters x características) com o centro de cada cluster
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, min(n_clusters, len(pontos)))
+
+    # k-means++: cada novo centro é sorteado com probabilidade proporcional à distância ao centro mais próximo
+    centros = pontos[[rng.integers(len(pontos))]]
+    distancia_minima = squared_distances(pontos, centros)[:, 0]
+    for _ in range(1, n_clusters):
+        probabilidade = distancia_minima / distancia_minima.sum() if distancia_minima.sum() > 0 else None
+        novo_centro = pontos[[rng.choice(len(pontos), p = probabilidade)]]
+        centros = np.vstack([centros, novo_centro])
+        distancia_minima = np.minimum(distancia_minima, squared_distances(pontos, novo_centro)[:, 0])
+
+    # Iterações de Lloyd: atribui cada ponto ao centro mais próximo e recalcula os centros
+    rotulos = squared_distances(pontos, centros).argmin(axis = 1)
+    for _ in range(MAX_ITERACOES_KMEANS):
+        contagem = np.bincount(rotulos, minlength = n_clusters)
+        somas = np.zeros_like(centros)
+        np.add.at(somas, rotulos, pontos)
+        centros = np.where(contagem[:, None] > 0, somas / np.maximum(contagem, 1)[:, None], centros)
+
+        novos_rotulos = squared_distances(pontos, centros).argmin(axis = 1)
+        if np.array_equal(novos_rotulos, rotulos):
+            break
+        rotulos = novos_rotulos
+
+    return rotulos, centros
+
+
+# Agrupa os fundos uma única vez por versão do dataset e quantidade de clusters
+@st.cache_data(max_entries = 8, show_spinner = False)
+def compute_clusters(
+    versao_dataset: str,
+    n_clusters: int,
+    _df_result: pd.DataFrame
+):
+    """
+    Função que agrupa os fundos uma única vez por versão do dataset e quantidade de clusters
+
+    Args:
+        versao_dataset (str): Identificador da versão dos dados (chave do cache do Streamlit)
+        n_clusters (int): Quantidade de clusters
+        _df_result (pd.DataFrame): DataFrame de resultados (não entra na chave do cache)
+
+    Returns:
+        df_clusters: DataFrame com um fundo por linha: cnpj, cluster, distancia_centro e representante (fundo mais próximo do centro)
+    """
+    # Um fundo pode aparecer em mais de uma categoria, mas é agrupado uma única vez; fundos sem CNPJ válido ficam sem cluster
+    df_ativos = _df_result.dropna(subset = ["cnpj"]).drop_duplicates(subset = "cnpj").reset_index(drop = True)
+    if df_ativos.empty:
+        return pd.DataFrame({
+            "cnpj": df_ativos["cnpj"].to_numpy(),
+            "cluster": pd.Categorical([], categories = []),
+            "distancia_centro": np.array([], dtype = np.float32),
+            "representante": np.array([], dtype = bool)
+        })
+    pontos = cluster_features(df_ativos)
+    rotulos, centros = kmeans(pontos, n_clusters)
+
+    # Distância de cada fundo ao centro do seu cluster
+    distancia_centro = np.sqrt(((pontos - centros[rotulos]) ** 2).sum(axis = 1))
+
+    # Clusters numerados por tamanho (C01 é o maior)
+    ordem = np.argsort(-np.bincount(rotulos, minlength = len(centros)), kind = "stable")
+    numero = np.empty_like(ordem)
+    numero[ordem] = np.arange(len(ordem))
+    nomes_clusters = [f"C{indice + 1:02d}" for indice in range(len(centros))]
+
+    df_clusters = (
+        pd.DataFrame({
+            "cnpj": df_ativos["cnpj"].to_numpy(),
+            "cluster": pd.Categorical.from_codes(numero[rotulos], categories = nomes_clusters),
+            "distancia_centro": distancia_centro.astype(np.float32)
+        })
+        .assign(representante = lambda _: _.index.isin(_.groupby("cluster", observed = True)["distancia_centro"].idxmin()))
+    )
+
+    return df_clusters
+
+
+# Função que adiciona o cluster de cada fundo ao DataFrame de resultados
+def add_clusters(
+    df_result: pd.DataFrame,
+    df_clusters: pd.DataFrame
+):
+    """
+    Função que adiciona o cluster de cada fundo ao DataFrame de resultados
+
+    Args:
+        df_result (pd.DataFrame): DataFrame de resultados (não é alterado)
+        df_clusters (pd.DataFrame): Retorno de compute_clusters
+
+    Returns:
+        df_result: Cópia com as colunas cluster e distancia_centro
+    """
+    df_clusters = df_clusters.set_index("cnpj")
+
+    return df_result.assign(
+        cluster = lambda _: pd.Categorical(_["cnpj"].map(df_clusters["cluster"]), categories = df_clusters["cluster"].cat.categories),
+        distancia_centro = lambda _: _["cnpj"].map(df_clusters["distancia_centro"])
+    )
+
+
+######## Ranking ########
+# Monta os arrays usados no ranking uma única vez por versão do dataset
+@st.cache_resource(max_entries = 8)
+def build_ranking_index(
+    versao_dataset: str,
+    _df_result: pd.DataFrame
+):
+    """
+    Função que monta os arrays usados no ranking uma única vez por versão do dataset
+
+    Os valores de todas as colunas de RANKING_OPTIONS ficam em uma matriz por categoria, já com o sinal ajustado (maior é melhor)
+    e com -inf no lugar de valores ausentes, então trocar a coluna ou o K não reprocessa o DataFrame.
+
+    Args:
+        versao_dataset (str): Identificador da versão dos dados (chave do cache do Streamlit)
+        _df_result (pd.DataFrame): DataFrame de resultados (não entra na chave do cache)
+
+    Returns:
+        dict: {categoria: {"cnpjs": CNPJ de cada linha, "valores": matriz (linhas x colunas), "btg": disponibilidade no BTG}}
+    """
+    colunas = [coluna for coluna in RANKING_OPTIONS if coluna in _df_result.columns]
+    sinais = np.array([-1.0 if coluna in RANKING_MENOR_MELHOR else 1.0 for coluna in colunas])
+
+    # Matriz de valores com sinal ajustado; ausentes nunca entram no ranking
+    valores = _df_result[colunas].to_numpy(dtype = np.float64, na_value = np.nan) * sinais
+    valores = np.where(np.isnan(valores), -np.inf, valores)
+    if "disponibilidade_btg" in _df_result.columns:
+        btg = _df_result["disponibilidade_btg"].fillna(False).to_numpy(dtype = bool)
+    else:
+        btg = np.zeros(len(_df_result), dtype = bool)
+
+    # Fundos de cada categoria, identificados pelo cnpj (e não pela posição, que muda entre versões do DataFrame)
+    codigos, categorias = pd.factorize(_df_result["categoria"], sort = True)
+    cnpjs = _df_result["cnpj"].to_numpy()
+    indice = {"colunas": colunas}
+    for codigo, categoria in enumerate(categorias):
+        linhas = np.flatnonzero(codigos == codigo)
+        indice[categoria] = {"cnpjs": cnpjs[linhas], "valores": valores[linhas], "btg": btg[linhas]}
+
+    return indice
+
+
+# Função que retorna os K melhores fundos de cada categoria
+def top_k_per_category(
+    df_result: pd.DataFrame,
+    indice: dict,
+    coluna: str = "score_all",
+    k: int = TOP_K_PADRAO,
+    BTG_AVAILABLE: bool = False
+):
+    """
+    Função que retorna os K melhores fundos de cada categoria
+
+    Args:
+        df_result (pd.DataFrame): O mesmo DataFrame usado em build_ranking_index
+        indice (dict): Retorno de build_ranking_index
+        coluna (str): Coluna de RANKING_OPTIONS usada para ordenar
+        k (int): Quantidade de fundos por categoria
+        BTG_AVAILABLE (bool): Considera somente produtos disponíveis no BTG
+
+    Returns:
+        df_ranking: DataFrame com os K melhores de cada categoria, ordenado por categoria e posição (coluna ranking)
+    """
+    posicao_coluna = indice["colunas"].index(coluna)
+    list_chaves = []
+
+    for categoria, dados in indice.items():
+        if categoria == "colunas":
+            continue
+
+        valores = dados["valores"][:, posicao_coluna]
+        if BTG_AVAILABLE == True:
+            valores = np.where(dados["btg"], valores, -np.inf)
+
+        # Seleção parcial dos K maiores (O(n)) e ordenação somente deles
+        k_categoria = min(k, len(valores))
+        if k_categoria == 0:
+            continue
+        melhores = np.argpartition(-valores, k_categoria - 1)[:k_categoria]
+        melhores = melhores[np.argsort(-valores[melhores], kind = "stable")]
+        melhores = melhores[np.isfinite(valores[melhores])]
+
+        list_chaves.append(pd.DataFrame({
+            "cnpj": dados["cnpjs"][melhores],
+            "categoria": categoria,
+            "ranking": np.arange(1, len(melhores) + 1, dtype = np.int16)
+        }))
+
+    if len(list_chaves) == 0:
+        return df_result.iloc[[]].assign(ranking = pd.Series(dtype = "Int16"))
+
+    # Busca as linhas dos escolhidos pelo par (cnpj, categoria), mantendo a ordem do ranking
+    df_chaves = pd.concat(list_chaves, ignore_index = True)
+    df_candidatos = df_result[df_result["cnpj"].isin(df_chaves["cnpj"])].astype({"categoria": str})
+    df_ranking = (
+        df_chaves
+        .merge(df_candidatos.drop_duplicates(subset = ["cnpj", "categoria"]), on = ["cnpj", "categoria"], how = "inner")
+        .filter(list(df_result.columns) + ["ranking"])
+        .astype({"categoria": df_result["categoria"].dtype})
+    )
+
+    return df_ranking
+
+
+######## Busca de Fundos ########
+# Função que normaliza textos para a busca (sem acentos, maiúsculos, somente letras, números e espaços)
+def normalize_search_text(
+    textos: pd.Series
+):
+    """
+    Função que normaliza textos para a busca (sem acentos, maiúsculos, somente letras, números e espaços)
+
+    Args:
+        textos (pd.Series): Textos originais
+
+    Returns:
+        pd.Series: Textos normalizados
+    """
+    return (
+        textos.astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.upper()
+        .str.replace(r"[^A-Z0-9]+", " ", regex = True)
+        .str.strip()
+    )
+
+
+# Função que calcula os n-gramas de vários textos normalizados de uma vez
+def text_ngrams(
+    textos: np.ndarray,
+    N_GRAMA_BUSCA: int = N_GRAMA_BUSCA
+):
+    """
+    Função que calcula os n-gramas de vários textos normalizados de uma vez
+
+    Cada texto recebe um espaço no início, então os n-gramas do começo das palavras (prefixos) também são indexados. Cada n-grama
+    vira um inteiro (bytes ASCII em base 256), calculado com janelas deslizantes sobre uma matriz de bytes (textos x caracteres).
+
+    Args:
+        textos (np.ndarray): Textos normalizados por normalize_search_text
+        N_GRAMA_BUSCA (int): Tamanho dos n-gramas
+
+    Returns:
+        linhas: Índice do texto de cada n-grama (sem repetições dentro do mesmo texto)
+        codigos: Código inteiro de cada n-grama
+    """
+    textos = np.char.add(" ", np.asarray(textos, dtype = str))
+    largura = max(int(np.char.str_len(textos).max()) if len(textos) > 0 else 0, N_GRAMA_BUSCA)
+
+    # Matriz de bytes; posições depois do fim de cada texto ficam com zero
+    caracteres = np.frombuffer(textos.astype(f"S{largura}").tobytes(), dtype = np.uint8).reshape(len(textos), largura).astype(np.int64)
+
+    # Código de cada janela de N_GRAMA_BUSCA caracteres e descarte das janelas que passam do fim do texto
+    codigos = np.zeros((len(textos), largura - N_GRAMA_BUSCA + 1), dtype = np.int64)
+    for deslocamento in range(N_GRAMA_BUSCA):
+        codigos = codigos * 256 + caracteres[:, deslocamento:largura - N_GRAMA_BUSCA + 1 + deslocamento]
+    validos = caracteres[:, N_GRAMA_BUSCA - 1:] > 0
+
+    # Pares (texto, n-grama) únicos (ordenação + diferença, mais rápido que np.unique para milhões de chaves)
+    chaves = np.sort(np.nonzero(validos)[0] * 256 ** N_GRAMA_BUSCA + codigos[validos])
+    chaves = chaves[np.r_[True, chaves[1:] != chaves[:-1]]]
+
+    return chaves // 256 ** N_GRAMA_BUSCA, chaves % 256 ** N_GRAMA_BUSCA
+
+
+# Função que le nome, gestora e ISIN dos fundos nos arquivos da SuperCarteira
+@st.cache_data(show_spinner = False)
+def load_supercarteira_metadata(
+    list_categorias: list,
+    versao: float = None,
+    input_path: str = input_path
+):
+    """
+    Função que le nome, gestora e ISIN dos fundos nos arquivos da SuperCarteira
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        versao (float): Data de modificação da pasta de inputs, somente para invalidar o cache
+        input_path (str): Pasta de inputs
+
+    Returns:
+        df_metadados: DataFrame com cnpj (inteiro), label, managementCompany e isin, um fundo por linha
+    """
+    list_metadados = []
+    for categoria in list_categorias:
+        arquivo = f"{input_path}/SuperCarteira_{categoria}.json"
+        if os.path.exists(arquivo):
+            list_metadados.append(json_normalize(pd.read_json(arquivo)[categoria]))
+
+    if len(list_metadados) == 0:
+        return pd.DataFrame(columns = ["cnpj", "label", "managementCompany", "isin"])
+
+    return (
+        pd.concat(list_metadados, ignore_index = True)
+        .filter(["cnpj", "label", "managementCompany", "isin"])
+        .assign(cnpj = lambda _: cnpj_to_int(_.cnpj.str.replace(r"\D", "", regex = True)))
+        .drop_duplicates(subset = "cnpj")
+        .reset_index(drop = True)
+    )
+
+
+# Monta o índice de busca uma única vez por versão do dataset
+@st.cache_resource(max_entries = 4)
+def build_search_index(
+    versao_dataset: str,
+    _df_result: pd.DataFrame,
+    list_categorias: list = list_categorias
+):
+    """
+    Função que monta o índice de busca uma única vez por versão do dataset
+
+    Cada fundo vira um texto com nome, gestora, ISIN e CNPJ (dos resultados e dos arquivos da SuperCarteira) e uma linha de uma
+    matriz esparsa binária (fundos x n-gramas).
+
+    Args:
+        versao_dataset (str): Identificador da versão dos dados (chave do cache do Streamlit)
+        _df_result (pd.DataFrame): DataFrame de resultados (não entra na chave do cache)
+        list_categorias (list): Lista de categorias de ativos
+
+    Returns:
+        dict: cnpjs, nomes, textos normalizados, vocabulário (códigos dos n-gramas, ordenados) e matriz esparsa (CSR)
+    """
+    # Um documento por fundo, completando os dados dos resultados com os arquivos da SuperCarteira
+    df_metadados = load_supercarteira_metadata(list_categorias, os.path.getmtime(input_path) if os.path.exists(input_path) else None)
+    df_fundos = (
+        _df_result
+        .drop_duplicates(subset = "cnpj")
+        .filter(["cnpj", "name", "managementCompany"])
+        .merge(df_metadados, on = "cnpj", how = "left", suffixes = ("", "_supercarteira"))
+        .reset_index(drop = True)
+    )
+    colunas_texto = [coluna for coluna in ["name", "label", "managementCompany", "managementCompany_supercarteira", "isin"] if coluna in df_fundos.columns]
+    textos = df_fundos["cnpj"].astype(str).str.zfill(14)
+    for coluna in colunas_texto:
+        textos = df_fundos[coluna].astype(object).fillna("").astype(str) + " " + textos
+    textos = normalize_search_text(textos).to_numpy(dtype = str)
+
+    # Matriz esparsa binária: linha = fundo, coluna = n-grama (vocabulário ordenado para busca binária)
+    linhas, codigos = text_ngrams(textos)
+    vocabulario = np.sort(codigos)
+    vocabulario = vocabulario[np.r_[True, vocabulario[1:] != vocabulario[:-1]]]
+    colunas = np.searchsorted(vocabulario, codigos)
+    matriz = sparse.csr_matrix(
+        (np.ones(len(linhas), dtype = np.float32), (linhas, colunas)),
+        shape = (len(textos), len(vocabulario))
+    )
+
+    return {
+        "cnpjs": df_fundos["cnpj"].to_numpy(),
+        "nomes": df_fundos["name"].astype(str).to_numpy(),
+        "textos": textos,
+        "vocabulario": vocabulario,
+        "matriz": matriz
+    }
+
+
+# Função que busca fundos no índice e retorna os mais relevantes
+def search_funds(
+    indice: dict,
+    consulta: str,
+    MAX_RESULTADOS_BUSCA: int = MAX_RESULTADOS_BUSCA
+):
+    """
+    Função que busca fundos no índice e retorna os mais relevantes
+
+    A relevância é a fração dos n-gramas da busca presentes no fundo (tolera erros de digitação e palavras fora de ordem),
+    com bônus quando alguma palavra do fundo começa com alguma palavra da busca.
+
+    Args:
+        indice (dict): Retorno de build_search_index
+        consulta (str): Texto digitado pelo usuário
+        MAX_RESULTADOS_BUSCA (int): Quantidade máxima de fundos retornados
+
+    Returns:
+        df_busca: DataFrame com cnpj, name e relevancia, do mais para o menos relevante
+    """
+    consulta = normalize_search_text(pd.Series([consulta])).iloc[0]
+    if len(consulta) == 0 or indice["matriz"].shape[1] == 0:
+        return pd.DataFrame(columns = ["cnpj", "name", "relevancia"])
+
+    # N-gramas da busca presentes no vocabulário do índice
+    _, codigos = text_ngrams(np.array([consulta]))
+    posicao = np.clip(np.searchsorted(indice["vocabulario"], codigos), 0, len(indice["vocabulario"]) - 1)
+    ngramas = posicao[indice["vocabulario"][posicao] == codigos]
+    if len(ngramas) == 0:
+        return pd.DataFrame(columns = ["cnpj", "name", "relevancia"])
+
+    # Quantidade de n-gramas em comum com cada fundo: um único produto matriz esparsa x vetor
+    vetor_consulta = np.zeros(indice["matriz"].shape[1], dtype = np.float32)
+    vetor_consulta[ngramas] = 1.0
+    relevancia = indice["matriz"] @ vetor_consulta / len(codigos)
+
+    # Seleção parcial dos candidatos e bônus de prefixo somente para eles
+    n_candidatos = min(len(relevancia), MAX_RESULTADOS_BUSCA * 5)
+    candidatos = np.argpartition(-relevancia, n_candidatos - 1)[:n_candidatos]
+    candidatos = candidatos[relevancia[candidatos] >= RELEVANCIA_MINIMA_BUSCA]
+    palavras_consulta = consulta.split()
+    bonus = np.array([
+        BONUS_PREFIXO_BUSCA if any((" " + indice["textos"][candidato]).find(" " + palavra) >= 0 for palavra in palavras_consulta) else 0.0
+        for candidato in candidatos
+    ])
+    relevancia_final = relevancia[candidatos] + bonus
+    ordem = np.argsort(-relevancia_final, kind = "stable")[:MAX_RESULTADOS_BUSCA]
+
+    df_busca = pd.DataFrame({
+        "cnpj": indice["cnpjs"][candidatos[ordem]],
+        "name": indice["nomes"][candidatos[ordem]],
+        "relevancia": relevancia_final[ordem]
+    })
+
+    return df_busca
+
+
+######## Data Analysis ########
+# Função que prepara os dados para criar os gráficos
+def clean_to_chart(
+    df_result: pd.DataFrame,
+    SCORE_TYPE: str = "60m",
+    MAX_PROFITABILITY: float = 999999,
+    MAX_VOLATILITY: float = 100,
     MIN_PROFITABILITY: float = 0,
     MIN_VOLATILITY: float = 0,
     BTG_AVAILABLE: bool = False,
+    RISK_METRIC: str = "sortino",
+):
+    """
+    Função que prepara os dados para criar os gráficos
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+
+    Returns:
+        df_result_chart: DataFrame com dados limpos para criar gráficos
+    """
+    # Filtra somente produtos do BTG caso BTG_AVAILABLE seja True
+    if BTG_AVAILABLE == True:
+        df_result = df_result.query("disponibilidade_btg == True")
+
+    # Config Gráfico
+    PROFITABILITY = f"profitability_{SCORE_TYPE}"
+    VOLATILITY = f"volatility_{SCORE_TYPE}"
+
+    # Filtra produtos com volatilidade menor que MAX_VOLATILITY e cria um score para ordenar
+    df_result_chart = (
+        df_result
+        .assign(categoria = lambda _: pd.Categorical(_["categoria"]))                                                                       # Nova coluna: o DataFrame recebido pode ser compartilhado entre sessões
+        .assign(profitability = lambda _: _[PROFITABILITY].round(2))
+        .assign(volatility = lambda _: _[VOLATILITY].round(2))
+        .assign(risk_metric = lambda _: _[RISK_METRIC] if RISK_METRIC in _.columns else np.nan)
+        .query(f"profitability < {MAX_PROFITABILITY}")
+        .query(f"volatility < {MAX_VOLATILITY}")
+        .query(f"profitability > {MIN_PROFITABILITY}")
+        .query(f"volatility > {MIN_VOLATILITY}")
+    )
+
+    return df_result_chart
+
+
+# Cria gráfico interativo
+def chart_interactive(
+    df_result_chart: pd.DataFrame,
+    TOOTLIP_SIMPLE: bool,
+    TOOLTIP_SIMPLE_COLUMNS: list,
+    COLOR_BY: str = "categoria",
+    list_destaque: list = None
+):
+    """
+    Função que cria gráfico interativo
+
+    Args:
+        df_result_chart (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        COLOR_BY (str): Coluna usada para colorir os pontos
+        list_destaque (list): CNPJs dos fundos destacados no gráfico (por exemplo, encontrados na busca)
+
+    Returns:
+        fig: Gráfico interativo
+    """
+    if TOOTLIP_SIMPLE == True:
+        tooltip_columns = TOOLTIP_SIMPLE_COLUMNS
+
+    else:
+        tooltip_columns = list(df_result_chart.columns)
+
+    # Caso a coluna escolhida não tenha valores, colore por categoria
+    if COLOR_BY not in df_result_chart.columns or df_result_chart[COLOR_BY].isnull().all():
+        COLOR_BY = "categoria"
+
+    # Create an interactive scatter plot
+    fig = px.scatter(df_result_chart, 
+                    x = "volatility", 
+                    y = "profitability", 
+                    color = COLOR_BY,
+                    hover_data = [column for column in tooltip_columns if column in df_result_chart.columns],
+                    custom_data = ["cnpj"] if "cnpj" in df_result_chart.columns else None
+                    )
+    
+    # Destaca os fundos escolhidos com um marcador maior e o nome ao lado
+    if list_destaque is not None and len(list_destaque) > 0:
+        df_destaque = df_result_chart[df_result_chart["cnpj"].isin(list_destaque)].drop_duplicates(subset = "cnpj")
+        fig.add_trace(go.Scatter(
+            x = df_destaque["volatility"],
+            y = df_destaque["profitability"],
+            mode = "markers+text",
+            text = df_destaque["name"],
+            textposition = "top center",
+            marker = dict(symbol = "star", size = 16, color = "black"),
+            name = "Busca"
+        ))
+
+    # Layout do gráfico
+    fig.update_layout(title = f"SuperCarteira: Rentabilidade x Volatilidade (filtrado < {MAX_VOLATILITY})",
+                        xaxis_title = f"Volatilidade_{SCORE_TYPE}",
+                        yaxis_title = f"Rentabilidade_{SCORE_TYPE}",
+                        legend_title = COLOR_BY.capitalize())
+
+    return fig
+
+
+# Transformar o DataFrame em um arquivo Excel na memória
+@st.cache_data
+def convert_df_to_excel(df):
+    """
+    Função que converte um DataFrame em um arquivo Excel na memória
+
+    Args:
+        df (pd.DataFrame): DataFrame com dados
+
+    Returns:
+        processed_data: Arquivo Excel na memória
+    """
+    # Usando um buffer para armazenar o arquivo Excel
+    from io import BytesIO
+
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Sheet1')
+        # writer.save()  # A chamada a `save()` pode ser omitida, pois `close()` automaticamente salva
+    output.seek(0)
+
+    return output
+
+
+######## Otimização de Carteira ########
+# Função que prepara retorno esperado, volatilidade e categoria de cada ativo para a otimização
+def prepare_optimization_inputs(
+    df_result: pd.DataFrame,
+    SCORE_TYPE: str = "60m",
+    BTG_AVAILABLE: bool = False,
+    MAX_ATIVOS_POR_CATEGORIA: int = MAX_ATIVOS_POR_CATEGORIA_OTIMIZACAO
+):
+    """
+    Função que prepara retorno esperado, volatilidade e categoria de cada ativo para a otimização
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com dados do webscrapping
+        SCORE_TYPE (str): Horizonte dos dados usado como estimativa de retorno e volatilidade
+        BTG_AVAILABLE (bool): Considera somente ativos disponíveis no BTG
+        MAX_ATIVOS_POR_CATEGORIA (int): Quantidade de ativos com melhor score mantidos por categoria
+
+    Returns:
+        df_otimizacao: DataFrame com retorno e volatilidade anualizados (em decimal) de cada ativo
+    """
+    # Filtra somente produtos do BTG caso BTG_AVAILABLE seja True
+    if BTG_AVAILABLE == True and "disponibilidade_btg" in df_result.columns:
+        df_result = df_result.query("disponibilidade_btg == True")
+
+    # Config colunas do horizonte escolhido
+    PROFITABILITY = f"profitability_{SCORE_TYPE}"
+    VOLATILITY = f"volatility_{SCORE_TYPE}"
+
+    # Quantidade de meses do horizonte, no caso de "begin" usa o histórico de cada ativo
+    if SCORE_TYPE in MESES_HORIZONTE:
+        meses = MESES_HORIZONTE[SCORE_TYPE]
+    elif "total_months" in df_result.columns:
+        meses = df_result["total_months"].astype(float)
+    else:
+        meses = np.nan
+
+    # Anualiza rentabilidade e volatilidade, mantém somente ativos com dados válidos e os melhores scores por categoria
+    # (um fundo em mais de uma categoria entra uma única vez, sempre na primeira das suas categorias, para as restrições por categoria)
+    df_otimizacao = (
+        df_result
+        .assign(meses = meses)
+        .assign(retorno_anual = lambda _: (1 + _[PROFITABILITY] / 100) ** (12 / _.meses) - 1)
+        .assign(volatilidade_anual = lambda _: _[VOLATILITY] / 100)
+        .assign(score = lambda _: _.retorno_anual / _.volatilidade_anual)
+        .replace([np.inf, -np.inf], np.nan)
+        .dropna(subset = ["retorno_anual", "volatilidade_anual", "score"])
+        .query("volatilidade_anual > 0")
+        .sort_values(by = ["categoria", "cnpj"], kind = "stable")
+        .drop_duplicates(subset = "cnpj")
+        .sort_values(by = "score", ascending = False, kind = "stable")
+        .groupby("categoria", observed = True)
+        .head(MAX_ATIVOS_POR_CATEGORIA)
+        .filter(["cnpj", "name", "categoria", "retorno_anual", "volatilidade_anual"])
+        .reset_index(drop = True)
+    )
+
+    return df_otimizacao
+
+
+# Função que monta a matriz de covariância a partir das volatilidades e de uma matriz de correlação
+def build_covariance(
+    volatilidades: np.ndarray,
+    correlacao: np.ndarray = None,
+    CORRELACAO_PADRAO: float = CORRELACAO_PADRAO
+):
+    """
+    Função que monta a matriz de covariância a partir das volatilidades e de uma matriz de correlação
+
+    Args:
+        volatilidades (np.ndarray): Volatilidade anualizada de cada ativo
+        correlacao (np.ndarray): Matriz de correlação entre os ativos, caso None usa correlação constante
+        CORRELACAO_PADRAO (float): Correlação constante entre ativos quando não há matriz de correlação
+
+    Returns:
+        np.ndarray: Matriz de covariância
+    """
+    # Caso não exista matriz de correlação, assume correlação constante entre os ativos
+    if correlacao is None:
+        correlacao = np.full((len(volatilidades), len(volatilidades)), CORRELACAO_PADRAO)
+        np.fill_diagonal(correlacao, 1.0)
+
+    return correlacao * np.outer(volatilidades, volatilidades)
+
+
+# Função que otimiza uma carteira com restrições de peso por ativo e por categoria
+def optimize_portfolio(
+    retornos: np.ndarray,
+    covariancia: np.ndarray,
+    matriz_categorias: np.ndarray,
+    limites_categorias: np.ndarray,
+    objetivo: str = "min_vol",
+    MAX_PESO_ATIVO: float = MAX_PESO_ATIVO,
+    taxa_livre_risco: float = 0.0,
+    retorno_alvo: float = None,
+    pesos_iniciais: np.ndarray = None
+):
+    """
+    Função que otimiza uma carteira com restrições de peso por ativo e por categoria
+
+    Args:
+        retornos (np.ndarray): Retorno esperado anualizado de cada ativo
+        covariancia (np.ndarray): Matriz de covariância anualizada
+        matriz_categorias (np.ndarray): Matriz (categorias x ativos) com 1 quando o ativo pertence à categoria
+        limites_categorias (np.ndarray): Matriz (categorias x 2) com peso mínimo e máximo de cada categoria
+        objetivo (str): "min_vol", "max_sharpe", "max_retorno" ou "retorno_alvo"
+        MAX_PESO_ATIVO (float): Peso máximo de um único ativo
+        taxa_livre_risco (float): Taxa livre de risco anual (em decimal) usada no Sharpe
+        retorno_alvo (float): Retorno anual exigido quando objetivo é "retorno_alvo"
+        pesos_iniciais (np.ndarray): Ponto de partida do solver
+
+    Returns:
+        pesos: Pesos ótimos de cada ativo, ou None caso o solver não encontre solução
+    """
+    n_ativos = len(retornos)
+
+    # Funções objetivo e gradientes
+    def variancia(w):
+        return w @ covariancia @ w
+
+    def variancia_grad(w):
+        return 2 * covariancia @ w
+
+    def sharpe_negativo(w):
+        return -(w @ retornos - taxa_livre_risco) / np.sqrt(w @ covariancia @ w)
+
+    def sharpe_negativo_grad(w):
+        sigma = np.sqrt(w @ covariancia @ w)
+        excesso = w @ retornos - taxa_livre_risco
+        return -(retornos * sigma - excesso * (covariancia @ w) / sigma) / sigma ** 2
+
+    def retorno_negativo(w):
+        return -(w @ retornos)
+
+    def retorno_negativo_grad(w):
+        return -retornos
+
+    dict_objetivos = {
+        "min_vol": (variancia, variancia_grad),
+        "retorno_alvo": (variancia, variancia_grad),
+        "max_sharpe": (sharpe_negativo, sharpe_negativo_grad),
+        "max_retorno": (retorno_negativo, retorno_negativo_grad)
+    }
+    funcao, gradiente = dict_objetivos[objetivo]
+
+    # Restrições: carteira totalmente investida e peso de cada categoria entre o mínimo e o máximo
+    restricoes = [
+        {"type": "eq", "fun": lambda w: w.sum() - 1, "jac": lambda w: np.ones(n_ativos)},
+        {"type": "ineq", "fun": lambda w: matriz_categorias @ w - limites_categorias[:, 0], "jac": lambda w: matriz_categorias},
+        {"type": "ineq", "fun": lambda w: limites_categorias[:, 1] - matriz_categorias @ w, "jac": lambda w: -matriz_categorias}
+    ]
+    if objetivo == "retorno_alvo":
+        restricoes.append({"type": "eq", "fun": lambda w: w @ retornos - retorno_alvo, "jac": lambda w: retornos})
+
+    # Ponto de partida: carteira igualmente ponderada
+    if pesos_iniciais is None:
+        pesos_iniciais = np.full(n_ativos, 1 / n_ativos)
+
+    resultado = minimize(
+        funcao,
+        pesos_iniciais,
+        jac = gradiente,
+        method = "SLSQP",
+        bounds = [(0, MAX_PESO_ATIVO)] * n_ativos,
+        constraints = restricoes,
+        options = {"maxiter": 500, "ftol": 1e-10}
+    )
+
+    if resultado.success == False:
+        print(f"Otimização ({objetivo}) não convergiu: {resultado.message}")
+        return None
+
+    # Remove resíduos numéricos do solver
+    pesos = np.clip(resultado.x, 0, None)
+
+    return pesos / pesos.sum()
+
+
+# Função que calcula a fronteira eficiente e as carteiras de máximo Sharpe e mínima volatilidade
+@st.cache_data
+def compute_efficient_frontier(
+    retornos: np.ndarray,
+    covariancia: np.ndarray,
+    categorias: np.ndarray,
+    limites_categorias: dict,
+    MAX_PESO_ATIVO: float = MAX_PESO_ATIVO,
+    taxa_livre_risco: float = 0.0,
+    N_PONTOS_FRONTEIRA: int = N_PONTOS_FRONTEIRA
+):
+    """
+    Função que calcula a fronteira eficiente e as carteiras de máximo Sharpe e mínima volatilidade
+
+    Args:
+        retornos (np.ndarray): Retorno esperado anualizado de cada ativo
+        covariancia (np.ndarray): Matriz de covariância anualizada
+        categorias (np.ndarray): Categoria de cada ativo
+        limites_categorias (dict): Peso mínimo e máximo (em decimal) de cada categoria
+        MAX_PESO_ATIVO (float): Peso máximo de um único ativo
+        taxa_livre_risco (float): Taxa livre de risco anual (em decimal)
+        N_PONTOS_FRONTEIRA (int): Quantidade de pontos da fronteira eficiente
+
+    Returns:
+        dict: Pesos, retorno e volatilidade da fronteira e das carteiras ótimas, ou None caso as restrições sejam inviáveis
+    """
+    # Monta matriz de pertencimento (categorias x ativos) e limites de cada categoria
+    lista_categorias = list(limites_categorias.keys())
+    matriz_categorias = (categorias[None, :] == np.array(lista_categorias)[:, None]).astype(float)
+    limites = np.array([limites_categorias[categoria] for categoria in lista_categorias], dtype = float)
+
+    # Verifica se as restrições são viáveis antes de chamar o solver
+    capacidade = np.minimum(limites[:, 1], matriz_categorias.sum(axis = 1) * MAX_PESO_ATIVO)
+    if limites[:, 0].sum() > 1 or capacidade.sum() < 1 or np.any(limites[:, 0] > capacidade):
+        return None
+
+    parametros = dict(
+        retornos = retornos,
+        covariancia = covariancia,
+        matriz_categorias = matriz_categorias,
+        limites_categorias = limites,
+        MAX_PESO_ATIVO = MAX_PESO_ATIVO,
+        taxa_livre_risco = taxa_livre_risco
+    )
+
+    # Carteiras extremas da fronteira
+    pesos_min_vol = optimize_portfolio(objetivo = "min_vol", **parametros)
+    pesos_max_retorno = optimize_portfolio(objetivo = "max_retorno", **parametros)
+    if pesos_min_vol is None or pesos_max_retorno is None:
+        return None
+
+    # Calcula pontos intermediários da fronteira partindo sempre da solução anterior
+    lista_pesos = [pesos_min_vol]
+    for retorno_alvo in np.linspace(pesos_min_vol @ retornos, pesos_max_retorno @ retornos, N_PONTOS_FRONTEIRA)[1:-1]:
+        pesos = optimize_portfolio(objetivo = "retorno_alvo", retorno_alvo = retorno_alvo, pesos_iniciais = lista_pesos[-1], **parametros)
+        if pesos is not None:
+            lista_pesos.append(pesos)
+    lista_pesos.append(pesos_max_retorno)
+
+    # Retorno e volatilidade de todas as carteiras da fronteira de uma vez
+    pesos_fronteira = np.vstack(lista_pesos)
+    retorno_fronteira = pesos_fronteira @ retornos
+    volatilidade_fronteira = np.sqrt(np.einsum("ij,jk,ik->i", pesos_fronteira, covariancia, pesos_fronteira))
+
+    # Refina a carteira de máximo Sharpe partindo do melhor ponto da fronteira, mantendo esse ponto caso o solver falhe
+    pesos_melhor_ponto = pesos_fronteira[np.argmax((retorno_fronteira - taxa_livre_risco) / volatilidade_fronteira)]
+    pesos_max_sharpe = optimize_portfolio(objetivo = "max_sharpe", pesos_iniciais = pesos_melhor_ponto, **parametros)
+    if pesos_max_sharpe is None:
+        pesos_max_sharpe = pesos_melhor_ponto
+
+    return {
+        "pesos_fronteira": pesos_fronteira,
+        "retorno_fronteira": retorno_fronteira,
+        "volatilidade_fronteira": volatilidade_fronteira,
+        "pesos_min_vol": pesos_min_vol,
+        "pesos_max_sharpe": pesos_max_sharpe
+    }
+
+
+# Cria gráfico da fronteira eficiente sobre os ativos considerados
+def chart_efficient_frontier(
+    df_otimizacao: pd.DataFrame,
+    fronteira: dict,
+    covariancia: np.ndarray
+):
+    """
+    Função que cria gráfico da fronteira eficiente sobre os ativos considerados
+
+    Args:
+        df_otimizacao (pd.DataFrame): DataFrame com retorno e volatilidade anualizados de cada ativo
+        fronteira (dict): Resultado de compute_efficient_frontier
+        covariancia (np.ndarray): Matriz de covariância anualizada
+
+    Returns:
+        fig: Gráfico interativo
+    """
+    # Ativos considerados na otimização
+    fig = px.scatter(
+        df_otimizacao.assign(volatilidade = lambda _: _.volatilidade_anual * 100, retorno = lambda _: _.retorno_anual * 100),
+        x = "volatilidade",
+        y = "retorno",
+        color = "categoria",
+        hover_data = ["name", "cnpj"]
+    )
+
+    # Fronteira eficiente
+    fig.add_trace(go.Scatter(
+        x = fronteira["volatilidade_fronteira"] * 100,
+        y = fronteira["retorno_fronteira"] * 100,
+        mode = "lines",
+        name = "Fronteira Eficiente",
+        line = dict(color = "black")
+    ))
+
+    # Carteiras de mínima volatilidade e máximo Sharpe
+    retornos = df_otimizacao["retorno_anual"].values
+    for nome_carteira, chave, simbolo in [("Mínima Volatilidade", "pesos_min_vol", "diamond"), ("Máximo Sharpe", "pesos_max_sharpe", "star")]:
+        pesos = fronteira[chave]
+        fig.add_trace(go.Scatter(
+            x = [np.sqrt(pesos @ covariancia @ pesos) * 100],
+            y = [pesos @ retornos * 100],
+            mode = "markers",
+            name = nome_carteira,
+            marker = dict(symbol = simbolo, size = 16, color = "black")
+        ))
+
+    # Layout do gráfico
+    fig.update_layout(title = "Fronteira Eficiente (% a.a.)",
+                        xaxis_title = "Volatilidade anualizada",
+                        yaxis_title = "Retorno anualizado",
+                        legend_title = "Categoria")
+
+    return fig
+
+
+######## Simulação de Monte Carlo ########
+# Função que calcula o fator de Cholesky de uma matriz de correlação, corrigindo matrizes que não são positivas definidas
+def cholesky_correlation(
+    correlacao: np.ndarray
+):
+    """
+    Função que calcula o fator de Cholesky de uma matriz de correlação, corrigindo matrizes que não são positivas definidas
+
+    Correlações calculadas par a par (com meses em comum diferentes) ou completadas com CORRELACAO_PADRAO podem não formar uma
+    matriz válida; nesse caso os autovalores negativos são zerados e a diagonal volta a ser 1.
+
+    Args:
+        correlacao (np.ndarray): Matriz de correlação
+
+    Returns:
+        np.ndarray: Matriz triangular inferior L tal que L @ L.T é (aproximadamente) a correlação
+    """
+    try:
+        return np.linalg.cholesky(correlacao)
+    except np.linalg.LinAlgError:
+        autovalores, autovetores = np.linalg.eigh(correlacao)
+        correlacao = (autovetores * np.maximum(autovalores, 1e-8)) @ autovetores.T
+        desvios = np.sqrt(np.diag(correlacao))
+        correlacao = correlacao / np.outer(desvios, desvios)
+        return np.linalg.cholesky(correlacao + np.eye(len(correlacao)) * 1e-10)
+
+
+# Função que simula a evolução do valor de uma carteira com Monte Carlo, entregando os caminhos em blocos
+def iter_simulation_blocks(
+    retornos_anuais: np.ndarray,
+    volatilidades_anuais: np.ndarray,
+    pesos: np.ndarray,
+    correlacao: np.ndarray = None,
+    n_simulacoes: int = N_SIMULACOES_PADRAO,
+    meses: int = MESES_SIMULACAO_PADRAO,
+    seed: int = SEED_SIMULACAO,
+    rebalancear: bool = False,
+    MAX_MEMORIA_BLOCO_SIMULACAO_MB: float = MAX_MEMORIA_BLOCO_SIMULACAO_MB
+):
+    """
+    Função que simula a evolução do valor de uma carteira com Monte Carlo, entregando os caminhos em blocos
+
+    Os retornos mensais de cada ativo são log-normais, com média e volatilidade anualizadas convertidas para o mês, e correlacionados
+    pelo fator de Cholesky da matriz de correlação. Os caminhos são sorteados em blocos (limitando a memória) com um único gerador,
+    então o resultado não depende do tamanho do bloco.
+
+    Args:
+        retornos_anuais (np.ndarray): Retorno esperado anualizado de cada ativo (em decimal)
+        volatilidades_anuais (np.ndarray): Volatilidade anualizada de cada ativo (em decimal)
+        pesos (np.ndarray): Peso inicial de cada ativo (soma 1)
+        correlacao (np.ndarray): Matriz de correlação entre os ativos, caso None usa CORRELACAO_PADRAO
+        n_simulacoes (int): Quantidade de caminhos
+        meses (int): Horizonte em meses
+        seed (int): Semente do gerador
+        rebalancear (bool): Volta aos pesos iniciais todo mês; caso False a carteira é mantida (buy and hold)
+        MAX_MEMORIA_BLOCO_SIMULACAO_MB (float): Memória máxima dos sorteios de cada bloco
+
+    Yields:
+        np.ndarray: Matriz float32 (caminhos do bloco x meses + 1) com o valor da carteira, começando em 1
+    """
+    retornos_anuais = np.asarray(retornos_anuais, dtype = np.float64)
+    volatilidades_anuais = np.asarray(volatilidades_anuais, dtype = np.float64)
+    pesos = np.asarray(pesos, dtype = np.float64)
+    n_ativos = len(pesos)
+
+    # Parâmetros mensais da distribuição log-normal com a mesma média e volatilidade
+    media_mensal = (1 + retornos_anuais) ** (1 / 12) - 1
+    volatilidade_mensal = volatilidades_anuais / np.sqrt(12)
+    desvio_log = np.sqrt(np.log1p((volatilidade_mensal / (1 + media_mensal)) ** 2))
+    media_log = np.log1p(media_mensal) - desvio_log ** 2 / 2
+
+    # Fator de Cholesky da correlação, já multiplicado pelo desvio de cada ativo
+    if correlacao is None:
+        correlacao = np.full((n_ativos, n_ativos), CORRELACAO_PADRAO)
+        np.fill_diagonal(correlacao, 1.0)
+    fator = (cholesky_correlation(correlacao) * desvio_log[:, None]).T.astype(np.float32)
+
+    # Quantidade de caminhos por bloco para não passar do limite de memória (sorteios float32)
+    tamanho_bloco = max(1, int(MAX_MEMORIA_BLOCO_SIMULACAO_MB * 1024 ** 2 // (meses * n_ativos * 4 * 3)))
+
+    rng = np.random.default_rng(seed)
+
+    for inicio in range(0, n_simulacoes, tamanho_bloco):
+        fim = min(inicio + tamanho_bloco, n_simulacoes)
+        valores = np.empty((fim - inicio, meses + 1), dtype = np.float32)
+        valores[:, 0] = 1.0
+
+        # Log-retornos correlacionados de todos os ativos do bloco em uma única multiplicação de matrizes
+        log_retornos = rng.standard_normal((fim - inicio, meses, n_ativos), dtype = np.float32) @ fator
+        log_retornos += media_log.astype(np.float32)
+
+        if rebalancear == True:
+            # Retorno da carteira em cada mês com os pesos iniciais
+            valores[:, 1:] = np.cumprod(np.exp(log_retornos) @ pesos.astype(np.float32), axis = 1)
+        else:
+            # Cada ativo evolui sozinho a partir do peso inicial
+            valores[:, 1:] = np.exp(np.cumsum(log_retornos, axis = 1)) @ pesos.astype(np.float32)
+
+        yield valores
+
+
+# Calcula as bandas de percentis da simulação uma única vez por conjunto de parâmetros
+@st.cache_data(max_entries = 8, show_spinner = False)
+def compute_simulation_bands(
+    retornos_anuais: np.ndarray,
+    volatilidades_anuais: np.ndarray,
+    pesos: np.ndarray,
+    correlacao: np.ndarray = None,
+    n_simulacoes: int = N_SIMULACOES_PADRAO,
+    meses: int = MESES_SIMULACAO_PADRAO,
+    seed: int = SEED_SIMULACAO,
+    rebalancear: bool = False,
+    PERCENTIS_SIMULACAO: list = PERCENTIS_SIMULACAO,
+    N_FAIXAS_HISTOGRAMA_SIMULACAO: int = N_FAIXAS_HISTOGRAMA_SIMULACAO
+):
+    """
+    Função que calcula as bandas de percentis da simulação uma única vez por conjunto de parâmetros
+
+    Os caminhos nunca ficam todos na memória: cada bloco é somado a um histograma (em log do valor) de cada mês, e os percentis
+    das bandas são interpolados dentro das faixas. Média, probabilidade de perda e percentis do valor final são exatos.
+
+    Args:
+        retornos_anuais (np.ndarray): Retorno esperado anualizado de cada ativo (em decimal)
+        volatilidades_anuais (np.ndarray): Volatilidade anualizada de cada ativo (em decimal)
+        pesos (np.ndarray): Peso inicial de cada ativo (soma 1)
+        correlacao (np.ndarray): Matriz de correlação entre os ativos
+        n_simulacoes (int): Quantidade de caminhos
+        meses (int): Horizonte em meses
+        seed (int): Semente do gerador
+        rebalancear (bool): Volta aos pesos iniciais todo mês
+        PERCENTIS_SIMULACAO (list): Percentis calculados em cada mês
+        N_FAIXAS_HISTOGRAMA_SIMULACAO (int): Faixas do histograma de cada mês
+
+    Returns:
+        df_bandas: DataFrame com o mês e o valor da carteira em cada percentil (coluna p5, p25, ...)
+        resumo: Dicionário com média, probabilidade de perda e percentis do valor final
+    """
+    contagens = np.zeros((meses + 1) * N_FAIXAS_HISTOGRAMA_SIMULACAO, dtype = np.int64)
+    valor_final = np.empty(n_simulacoes, dtype = np.float32)
+    deslocamento_mes = np.arange(meses + 1) * N_FAIXAS_HISTOGRAMA_SIMULACAO
+    inicio = 0
+
+    for valores in iter_simulation_blocks(retornos_anuais, volatilidades_anuais, pesos, correlacao, n_simulacoes, meses, seed, rebalancear):
+        log_valores = np.log(np.maximum(valores, np.finfo(np.float32).tiny))
+
+        # Faixas do histograma definidas pelo primeiro bloco, com folga; valores fora delas caem nas faixas das pontas
+        if inicio == 0:
+            folga = max(float(log_valores.max() - log_valores.min()), 0.1)
+            limite_inferior = float(log_valores.min()) - folga
+            largura = (float(log_valores.max()) + folga - limite_inferior) / N_FAIXAS_HISTOGRAMA_SIMULACAO
+
+        faixas = np.clip(((log_valores - limite_inferior) / largura).astype(np.int64), 0, N_FAIXAS_HISTOGRAMA_SIMULACAO - 1)
+        contagens += np.bincount((faixas + deslocamento_mes).ravel(), minlength = len(contagens))
+
+        valor_final[inicio:inicio + len(valores)] = valores[:, -1]
+        inicio += len(valores)
+
+    # Percentis de todos os meses de uma vez, interpolando dentro da faixa que contém cada percentil
+    contagens = contagens.reshape(meses + 1, N_FAIXAS_HISTOGRAMA_SIMULACAO)
+    acumulado = np.cumsum(contagens, axis = 1)
+    linhas = np.arange(meses + 1)
+    list_bandas = []
+    for percentil in PERCENTIS_SIMULACAO:
+        alvo = percentil / 100 * n_simulacoes
+        faixa = np.minimum((acumulado < alvo).sum(axis = 1), N_FAIXAS_HISTOGRAMA_SIMULACAO - 1)
+        anterior = np.where(faixa > 0, acumulado[linhas, np.maximum(faixa - 1, 0)], 0)
+        fracao = np.clip((alvo - anterior) / np.maximum(contagens[linhas, faixa], 1), 0, 1)
+        list_bandas.append(np.exp(limite_inferior + (faixa + fracao) * largura))
+    bandas = np.array(list_bandas)
+
+    # O mês inicial vale exatamente 1 em todos os caminhos
+    bandas[:, 0] = 1.0
+    df_bandas = pd.DataFrame(bandas.T, columns = [f"p{percentil}" for percentil in PERCENTIS_SIMULACAO]).assign(mes = np.arange(meses + 1))
+
+    resumo = {
+        "media_final": float(valor_final.mean(dtype = np.float64)),
+        "probabilidade_perda": float((valor_final < 1).mean()),
+        **{f"p{percentil}_final": float(banda) for percentil, banda in zip(PERCENTIS_SIMULACAO, np.percentile(valor_final, PERCENTIS_SIMULACAO))}
+    }
+
+    return df_bandas, resumo
+
+
+# Cria gráfico com as bandas de percentis da simulação
+def chart_simulation_bands(
+    df_bandas: pd.DataFrame
+):
+    """
+    Função que cria gráfico com as bandas de percentis da simulação
+
+    Args:
+        df_bandas (pd.DataFrame): Retorno de compute_simulation_bands
+
+    Returns:
+        fig: Gráfico interativo
+    """
+    colunas = [coluna for coluna in df_bandas.columns if coluna != "mes"]
+    fig = go.Figure()
+
+    # Bandas simétricas em volta da mediana (percentis externos com preenchimento mais claro)
+    for indice in range(len(colunas) // 2):
+        inferior, superior = colunas[indice], colunas[-1 - indice]
+        fig.add_trace(go.Scatter(x = df_bandas["mes"], y = df_bandas[superior] * 100, mode = "lines", line = dict(width = 0), showlegend = False, hoverinfo = "skip"))
+        fig.add_trace(go.Scatter(
+            x = df_bandas["mes"],
+            y = df_bandas[inferior] * 100,
+            mode = "lines",
+            line = dict(width = 0),
+            fill = "tonexty",
+            fillcolor = f"rgba(31, 119, 180, {0.15 + 0.15 * indice})",
+            name = f"{inferior} - {superior}"
+        ))
+
+    # Mediana
+    if len(colunas) % 2 == 1:
+        mediana = colunas[len(colunas) // 2]
+        fig.add_trace(go.Scatter(x = df_bandas["mes"], y = df_bandas[mediana] * 100, mode = "lines", line = dict(color = "rgb(31, 119, 180)"), name = mediana))
+
+    # Layout do gráfico
+    fig.update_layout(title = "Simulação da Carteira (valor inicial = 100)",
+                        xaxis_title = "Meses",
+                        yaxis_title = "Valor da carteira",
+                        legend_title = "Percentis")
+
+    return fig
+
+
+
+######## Backtest da SuperCarteira ########
+# Função que lista as datas dos snapshots da SuperCarteira
+def list_snapshot_dates(
+    input_path: str = input_path
+):
+    """
+    Função que lista as datas dos snapshots da SuperCarteira
+
+    Args:
+        input_path (str): Pasta de inputs, com uma subpasta "YYYY-MM" por snapshot
+
+    Returns:
+        list: Datas ("YYYY-MM") em ordem crescente
+    """
+    if os.path.exists(input_path) == False:
+        return []
+
+    return sorted(nome for nome in os.listdir(input_path) if re.match(PADRAO_PASTA_SNAPSHOT, nome) and os.path.isdir(f"{input_path}/{nome}"))
+
+
+# Função que retorna a versão dos dados usados no backtest (snapshots, painel de retornos e histórico de scores)
+def backtest_inputs_version(
+    input_path: str = input_path,
+    historico_path: str = historico_path
+):
+    """
+    Função que retorna a versão dos dados usados no backtest (snapshots, painel de retornos e histórico de scores)
+
+    Args:
+        input_path (str): Pasta de inputs
+        historico_path (str): Pasta onde o histórico é armazenado
+
+    Returns:
+        str: Identificador que muda quando algum dos dados muda
+    """
+    # Data de modificação de cada arquivo da SuperCarteira (a da pasta não muda quando um arquivo é sobrescrito no lugar)
+    versoes_snapshots = [
+        f"{data}/{arquivo}:{os.path.getmtime(f'{input_path}/{data}/{arquivo}')}"
+        for data in list_snapshot_dates(input_path)
+        for arquivo in sorted(os.listdir(f"{input_path}/{data}"))
+        if arquivo.startswith("SuperCarteira_") and arquivo.endswith(".json")
+    ]
+
+    return f"{','.join(versoes_snapshots)}|retornos:{returns_panel_version()}|historico:{history_version(historico_path)}"
+
+
+# Função que monta as matrizes do backtest: ativos de cada snapshot, scores na data e início de cada janela no painel
+def prepare_backtest_inputs(
+    list_categorias: list,
+    input_path: str = input_path,
+    retornos_path: str = retornos_path
+):
+    """
+    Função que monta as matrizes do backtest: ativos de cada snapshot, scores na data e início de cada janela no painel
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+        input_path (str): Pasta de inputs, com uma subpasta "YYYY-MM" por snapshot
+        retornos_path (str): Pasta onde o painel de retornos é armazenado
+
+    Returns:
+        dict: datas, categorias, cnpjs, membros (datas x categorias x ativos), n_listados (datas x categorias),
+              scores (datas x ativos), retornos (ativos x meses), meses e colunas_inicio; ou None sem snapshots ou painel
+    """
+    list_datas = list_snapshot_dates(input_path)
+    retornos, cnpjs_painel, meses = load_returns_panel(retornos_path)
+    if len(list_datas) == 0 or retornos is None or len(meses) == 0:
+        return None
+
+    # Ativos de cada categoria em cada snapshot (pastas de data sem nenhum arquivo da SuperCarteira não têm carteiras)
+    list_membros = [
+        get_cnpj(pd.DataFrame(), f"{input_path}/{data}/SuperCarteira_{categoria}.json", categoria).assign(data = data)
+        for data in list_datas
+        for categoria in list_categorias
+        if os.path.exists(f"{input_path}/{data}/SuperCarteira_{categoria}.json")
+    ]
+    if len(list_membros) == 0:
+        return None
+    df_membros = pd.concat(list_membros, ignore_index = True).assign(cnpj = lambda _: cnpj_to_int(_.cnpj))
+
+    # Somente ativos do painel que aparecem em algum snapshot (eixo de ativos menor)
+    linhas_painel = np.flatnonzero(np.isin(cnpjs_painel, df_membros["cnpj"].to_numpy()))
+    cnpjs = cnpjs_painel[linhas_painel]
+    posicao_data = pd.Index(list_datas).get_indexer(df_membros["data"])
+    posicao_categoria = pd.Index(list_categorias).get_indexer(df_membros["categoria"])
+    posicao_ativo = pd.Index(cnpjs).get_indexer(df_membros["cnpj"])
+
+    # Contagem de ativos listados (inclusive os que não estão no painel) e matriz de pertencimento
+    n_listados = np.zeros((len(list_datas), len(list_categorias)), dtype = np.int32)
+    np.add.at(n_listados, (posicao_data, posicao_categoria), 1)
+    membros = np.zeros((len(list_datas), len(list_categorias), len(cnpjs)), dtype = bool)
+    no_painel = posicao_ativo >= 0
+    membros[posicao_data[no_painel], posicao_categoria[no_painel], posicao_ativo[no_painel]] = True
+
+    # Score de cada ativo conhecido até o fim do mês do snapshot (sem olhar o futuro)
+    scores = np.full((len(list_datas), len(cnpjs)), np.nan, dtype = np.float32)
+    for indice, data in enumerate(list_datas):
+        df_scores = history_snapshot(pd.Period(data).end_time, ["cnpj", "score_all"], cnpjs)
+        if df_scores.empty == False:
+            posicao = pd.Index(cnpjs).get_indexer(df_scores["cnpj"])
+            scores[indice, posicao[posicao >= 0]] = df_scores["score_all"].to_numpy(dtype = np.float32)[posicao >= 0]
+
+    # Coluna do painel com o primeiro mês após cada snapshot; snapshots anteriores ao painel começam em colunas negativas,
+    # então os meses antes do início do painel ficam sem dados (NaN) em vez de a janela começar no primeiro mês do painel
+    meses_seguintes = (pd.PeriodIndex(list_datas, freq = "M") + 1).strftime("%Y-%m").to_numpy()
+    colunas_inicio = np.searchsorted(meses, meses_seguintes, side = "left")
+    antes_do_painel = meses_seguintes < meses[0]
+    colunas_inicio[antes_do_painel] = (
+        pd.PeriodIndex(meses_seguintes[antes_do_painel], freq = "M").asi8 - pd.Period(meses[0], freq = "M").ordinal
+    )
+
+    return {
+        "datas": list_datas,
+        "categorias": list(list_categorias),
+        "cnpjs": cnpjs,
+        "membros": membros,
+        "n_listados": n_listados,
+        "scores": scores,
+        "retornos": np.asarray(retornos[linhas_painel], dtype = np.float32),
+        "meses": meses,
+        "colunas_inicio": colunas_inicio
+    }
+
+
+# Função que resume o backtest com uma linha por data e categoria
+def summarize_backtest(
+    entradas: dict,
+    pesos: np.ndarray,
+    retornos_carteira: np.ndarray,
+    acumulado: np.ndarray
+):
+    """
+    Função que resume o backtest com uma linha por data e categoria
+
+    Args:
+        entradas (dict): Retorno de prepare_backtest_inputs
+        pesos (np.ndarray): Pesos (datas x categorias x ativos) usados no backtest
+        retornos_carteira (np.ndarray): Retornos mensais (datas x categorias x horizonte)
+        acumulado (np.ndarray): Retornos acumulados (datas x categorias x horizonte)
+
+    Returns:
+        df_resumo: DataFrame com data, categoria, ativos listados, ativos na carteira, meses com dados, retorno total,
+                   retorno anualizado e volatilidade anualizada (em %)
+    """
+    # Retorno acumulado no último mês com dados de cada carteira
+    validos = ~np.isnan(retornos_carteira)
+    meses_validos = validos.sum(axis = 2)
+    ultimo_mes = acumulado.shape[2] - 1 - np.argmax(validos[..., ::-1], axis = 2)
+    retorno_total = np.where(meses_validos > 0, np.take_along_axis(acumulado, ultimo_mes[..., None], axis = 2)[..., 0], np.nan)
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        retorno_anual = (1 + retorno_total) ** (12 / meses_validos) - 1
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category = RuntimeWarning)
+        volatilidade_anual = np.nanstd(retornos_carteira, axis = 2, ddof = 1) * np.sqrt(12)
+
+    df_resumo = pd.DataFrame({
+        "data": np.repeat(entradas["datas"], len(entradas["categorias"])),
+        "categoria": np.tile(entradas["categorias"], len(entradas["datas"])),
+        "ativos_listados": entradas["n_listados"].ravel(),
+        "ativos_carteira": (pesos > 0).sum(axis = 2).ravel(),
+        "meses": meses_validos.ravel(),
+        "retorno_total": retorno_total.ravel() * 100,
+        "retorno_anual": retorno_anual.ravel() * 100,
+        "volatilidade_anual": volatilidade_anual.ravel() * 100
+    })
+
+    return df_resumo
+
+
+# Executa o backtest de uma combinação de parâmetros uma única vez por versão dos dados
+@st.cache_data(max_entries = 16, show_spinner = False)
+def compute_backtest(
+    versao: str,
+    list_categorias: list,
+    esquema: str = "igual",
+    top_n: int = None,
+    horizonte: int = 12
+):
+    """
+    Função que executa o backtest de uma combinação de parâmetros uma única vez por versão dos dados
+
+    Args:
+        versao (str): Retorno de backtest_inputs_version (chave do cache do Streamlit)
+        list_categorias (list): Lista de categorias de ativos
+        esquema (str): "igual" ou "score"
+        top_n (int): Quantidade de ativos de maior score por categoria, caso None usa todos
+        horizonte (int): Meses acompanhados após cada snapshot
+
+    Returns:
+        df_resumo: Resumo por data e categoria (ver summarize_backtest), ou None sem snapshots ou painel
+        df_acumulado: Retorno acumulado (em %) por data, categoria e mês após o snapshot
+    """
+    entradas = prepare_backtest_inputs(list_categorias)
+    if entradas is None:
+        return None, None
+
+    pesos = build_backtest_weights(entradas["membros"], entradas["scores"], esquema, top_n)
+    retornos_carteira, acumulado = backtest_portfolios(pesos, entradas["retornos"], entradas["colunas_inicio"], horizonte)
+
+    # Formato longo para o gráfico
+    n_datas, n_categorias, n_meses = acumulado.shape
+    df_acumulado = pd.DataFrame({
+        "data": np.repeat(entradas["datas"], n_categorias * n_meses),
+        "categoria": np.tile(np.repeat(entradas["categorias"], n_meses), n_datas),
+        "mes": np.tile(np.arange(1, n_meses + 1), n_datas * n_categorias),
+        "retorno_acumulado": acumulado.ravel() * 100
+    }).dropna(subset = ["retorno_acumulado"])
+
+    return summarize_backtest(entradas, pesos, retornos_carteira, acumulado), df_acumulado
+
+
+# Executa o backtest para várias combinações de parâmetros em um pool de processos
+@st.cache_data(max_entries = 4, show_spinner = False)
+def run_backtest_sweep(
+    versao: str,
+    list_categorias: list,
+    list_parametros: list,
+    N_PROCESSOS: int = N_PROCESSOS_DECODIFICACAO
+):
+    """
+    Função que executa o backtest para várias combinações de parâmetros em um pool de processos
+
+    As matrizes são enviadas uma única vez para cada processo (initializer) e cada tarefa recebe somente os parâmetros.
+
+    Args:
+        versao (str): Retorno de backtest_inputs_version (chave do cache do Streamlit)
+        list_categorias (list): Lista de categorias de ativos
+        list_parametros (list): Tuplas (esquema, top_n, horizonte)
+        N_PROCESSOS (int): Quantidade de processos do pool
+
+    Returns:
+        df_varredura: DataFrame com esquema, top_n, horizonte, categoria e médias entre as datas do retorno anualizado,
+                      da volatilidade anualizada e do retorno total; ou None sem snapshots ou painel
+    """
+    entradas = prepare_backtest_inputs(list_categorias)
+    if entradas is None:
+        return None
+
+    # Poucas combinações são executadas no próprio processo (criar o pool custaria mais do que o backtest)
+    argumentos = (entradas["membros"], entradas["scores"], entradas["retornos"], entradas["colunas_inicio"])
+    if len(list_parametros) <= 1 or N_PROCESSOS <= 1:
+        init_backtest_worker(*argumentos)
+        list_resultados = [backtest_worker(parametros) for parametros in list_parametros]
+    else:
+        with ProcessPoolExecutor(max_workers = N_PROCESSOS, mp_context = multiprocessing.get_context("spawn"), initializer = init_backtest_worker, initargs = argumentos) as executor:
+            list_resultados = list(executor.map(backtest_worker, list_parametros))
+
+    list_resumos = []
+    for (esquema, top_n, horizonte), retornos_carteira, acumulado in list_resultados:
+        pesos = build_backtest_weights(entradas["membros"], entradas["scores"], esquema, top_n)
+        list_resumos.append(
+            summarize_backtest(entradas, pesos, retornos_carteira, acumulado)
+            .assign(esquema = esquema, top_n = "todos" if top_n is None else str(top_n), horizonte = horizonte)
+        )
+
+    df_varredura = (
+        pd.concat(list_resumos, ignore_index = True)
+        .groupby(["esquema", "top_n", "horizonte", "categoria"], as_index = False)
+        [["retorno_anual", "volatilidade_anual", "retorno_total"]]
+        .mean()
+    )
+
+    return df_varredura
+
+
+
+
+# ---------------------------------------------------------- 04. DATA MANIPULATION ---------------------------------------------------------
+
+
+
+# Le arquivo com dados template (uma única vez por processo, compartilhado entre sessões)
+df_template = load_template_result(os.path.getmtime("Template_SuperCarteira_Result.xlsx"), preparar = False)
+
+
+
+# -------------------------------------------------------- 05. STREAMLIT COMPONENTS --------------------------------------------------------
+
+
+
+# Função que cria os componentes principais da aplicação
+def main_components():
+    """
+    Função que cria os componentes principais da aplicação
+
+    Args:
+        None
+
+    Returns:
+        tab_webscrapping: Aba de webscrapping
+        tab_data_analysis: Aba de data analysis
+        tab_otimizacao: Aba de otimização de carteira
+        tab_simulacao: Aba de simulação de carteira
+        tab_backtest: Aba de backtest da SuperCarteira
+    """
+    # Título da aplicação
+    st.title("Ferramenta de Investimento")
+
+    # Cria abas de navegação
+    tab_webscrapping, tab_data_analysis, tab_otimizacao, tab_simulacao, tab_backtest = st.tabs(["Webscrapping", "Data_Analysis", "Otimizacao_Carteira", "Simulacao_Carteira", "Backtest_SuperCarteira"])
+
+    # Botão para download
+    df_template_converted = convert_df_to_excel(df_template)
+
+    return tab_webscrapping, tab_data_analysis, tab_otimizacao, tab_simulacao, tab_backtest, df_template_converted
+
+
+# Função que cria a primeira parte da sidebar
+def sidebar_part1(
+    SCORE_OPTIONS: list
 ):
     """
-    Função que prepara os dados para criar os gráficos
+    Função que cria a primeira parte da sidebar
 
     Args:
-        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        SCORE_OPTIONS (list): Lista com opções de score
 
     Returns:
-        df_result_chart: DataFrame com dados limpos para criar gráficos
+        SCORE_TYPE: Tipo de score escolhido pelo usuário
+        RISK_METRIC: Métrica de risco escolhida pelo usuário
     """
-    # Filtra somente produtos do BTG caso BTG_AVAILABLE seja True
-    if BTG_AVAILABLE == True:
-        df_result = (df_result.copy().query("disponibilidade_btg == True"))
+    # Filtros da Tabela
+    st.sidebar.header("Configurações")  
 
-    # Convert "categoria" column to categorical data type
-    df_result["categoria"] = pd.Categorical(df_result["categoria"])
+    # Componente de seleção para o usuário escolher SCORE_TYPE
+    expander_data = st.sidebar.expander(label = "Filtros dos Dados")
+    SCORE_TYPE = expander_data.selectbox(f"Escolha o horizonte dos dados", SCORE_OPTIONS)
+
+    # Componente de seleção para o usuário escolher a métrica de risco (calculada a partir dos retornos mensais)
+    RISK_METRIC = expander_data.selectbox("Escolha a métrica de risco", RISK_METRIC_OPTIONS)
 
     # Config Gráfico
     PROFITABILITY = f"profitability_{SCORE_TYPE}"
     VOLATILITY = f"volatility_{SCORE_TYPE}"
 
-    # Filtra produtos com volatilidade menor que MAX_VOLATILITY e cria um score para ordenar
-    df_result_chart = (
-        df_result
-        .copy()
-        .assign(profitability = lambda _: _[PROFITABILITY].round(2))
-        .assign(volatility = lambda _: _[VOLATILITY].round(2))
-        .query(f"profitability < {MAX_PROFITABILITY}")
-        .query(f"volatility < {MAX_VOLATILITY}")
-        .query(f"profitability > {MIN_PROFITABILITY}")
-        .query(f"volatility > {MIN_VOLATILITY}")
+    return PROFITABILITY, VOLATILITY, SCORE_TYPE, RISK_METRIC
+
+
+# Função que cria a segunda parte da sidebar
+def sidebar_part2(
+    df_result: pd.DataFrame,
+    versao_dataset: str
+):
+    """
+    Função que cria a segunda parte da sidebar
+
+    Args:
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        versao_dataset (str): Identificador da versão dos dados, chave do resumo por categoria
+
+    Returns:
+        MAX_PROFITABILITY: Máxima rentabilidade
+        MAX_VOLATILITY: Máxima volatilidade
+        MIN_PROFITABILITY: Mínima rentabilidade
+        MIN_VOLATILITY: Mínima volatilidade
+        TOOLIP_SIMPLE: Usa tooltip simples
+        BTG_AVAILABLE: Mostra somente produtos disponíveis no BTG
+        COLOR_BY: Coluna usada para colorir os pontos
+    """
+    # Filtros do gráfico
+    expander_chart = st.sidebar.expander(label = "Filtros do Gráfico")
+    expander_chart.write('''
+        Modifique o gráfico de acordo com suas preferências
+    ''')
+
+    # Sidebar checkboxes para sugestões de filtros do gráfico
+    USE_SUGESTION = expander_chart.checkbox(
+        "Usar Sugestões de Eixos", 
+        value = False, 
+        help = "Ao clicar no botão 'Aceitar sugestões', você aceita os valores sugeridos para os filtros"
+        )
+
+    # Caso o usuário queira usar sugestões de filtros
+    if USE_SUGESTION == True:
+
+        # Cria sugestões de valores para os limites de filtro
+        min_profitability = 0
+        max_profitability = 999999
+        min_volatility = 0
+        max_volatility = 100
+
+    # Caso o usuário não queira usar sugestões de filtros
+    else:
+
+        # Cria deafult values para os limites de filtro (mínimo e máximo do universo, já calculados no resumo por categoria)
+        resumo_total = load_category_summary(versao_dataset, df_result).set_index("categoria").loc[CATEGORIA_TOTAL_RESUMO]
+        min_profitability = float(resumo_total[f"{PROFITABILITY}_p0"])
+        max_profitability = float(resumo_total[f"{PROFITABILITY}_p100"])
+        min_volatility = float(resumo_total[f"{VOLATILITY}_p0"])
+        max_volatility = float(resumo_total[f"{VOLATILITY}_p100"])
+
+    # Recebe valores que definem os limites de filtro
+    MIN_PROFITABILITY, MAX_PROFITABILITY = expander_chart.slider(
+        "Profitability", value = (min_profitability, max_profitability)
+        )
+
+    MIN_VOLATILITY, MAX_VOLATILITY = expander_chart.slider(
+        "Volatility", value = (min_volatility, max_volatility)
+        )
+
+    # Sidebar checkboxes para sugestões de filtros do gráfico
+    TOOLIP_SIMPLE = expander_chart.checkbox(
+        "Usar Tootltip Simples", 
+        value = False, 
+        help = "Ao clicar no botão 'Usar Tootltip Simples', o tooltip usará somente mostrará colunas chaves ao invés de todas as colunas"
+        )
+
+    # Sidebar checkboxes para sugestões de filtros do gráfico
+    BTG_AVAILABLE = expander_chart.checkbox(
+        "Mostrar somente produtos disponíveis no BTG", 
+        value = False, 
+        help = "Ao clicar no botão 'Mostrar somente produtos disponíveis no BTG', os ativos que aparecererão no gráfico serão somente os disponíveis no BTG"
+        )
+
+    # Componente de seleção da coluna usada para colorir os pontos do gráfico
+    COLOR_BY = expander_chart.selectbox(
+        "Colorir pontos por",
+        COLOR_OPTIONS,
+        help = "'risk_metric' usa a métrica de risco escolhida nos filtros dos dados; 'cluster' agrupa fundos parecidos (métricas e correlação dos retornos)"
+        )
+
+    return MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOLIP_SIMPLE, BTG_AVAILABLE, COLOR_BY
+
+
+# Função que cria a terceira parte da sidebar, com as restrições da otimização de carteira
+def sidebar_part3(
+    list_categorias: list
+):
+    """
+    Função que cria a terceira parte da sidebar, com as restrições da otimização de carteira
+
+    Args:
+        list_categorias (list): Lista de categorias de ativos
+
+    Returns:
+        restricoes: Dicionário com as restrições escolhidas pelo usuário
+    """
+    # Restrições da carteira
+    expander_carteira = st.sidebar.expander(label = "Restrições da Carteira")
+    expander_carteira.write('''
+        Defina os limites usados na otimização da carteira
+    ''')
+
+    # Considera somente produtos do BTG na otimização
+    BTG_AVAILABLE_OTIMIZACAO = expander_carteira.checkbox(
+        "Otimizar somente produtos disponíveis no BTG",
+        value = False,
+        help = "Caso marcado, a carteira será montada somente com ativos disponíveis no BTG"
+        )
+
+    # Taxa livre de risco e peso máximo por ativo
+    taxa_livre_risco = expander_carteira.number_input("Taxa livre de risco (% a.a.)", value = TAXA_LIVRE_RISCO, step = 0.25)
+    max_peso_ativo = expander_carteira.slider("Peso máximo por ativo (%)", min_value = 1, max_value = 100, value = int(MAX_PESO_ATIVO * 100))
+
+    # Peso mínimo e máximo de cada categoria da SuperCarteira
+    limites_categorias = {}
+    for categoria in list_categorias:
+        peso_min, peso_max = expander_carteira.slider(f"Peso {categoria} (%)", min_value = 0, max_value = 100, value = (0, 100))
+        limites_categorias[categoria] = (peso_min / 100, peso_max / 100)
+
+    restricoes = {
+        "BTG_AVAILABLE": BTG_AVAILABLE_OTIMIZACAO,
+        "taxa_livre_risco": taxa_livre_risco / 100,
+        "MAX_PESO_ATIVO": max_peso_ativo / 100,
+        "limites_categorias": limites_categorias
+    }
+
+    return restricoes
+
+
+# Função que cria a aba de otimização de carteira
+def tab_portfolio_optimization(
+    tab_otimizacao: st.tabs,
+    df_result: pd.DataFrame,
+    SCORE_TYPE: str,
+    restricoes: dict
+):
+    """
+    Função que cria a aba de otimização de carteira
+
+    Args:
+        tab_otimizacao (st.tabs): Aba de otimização de carteira
+        df_result (pd.DataFrame): DataFrame com dados do webscrapping
+        SCORE_TYPE (str): Tipo de score escolhido pelo usuário
+        restricoes (dict): Restrições escolhidas na sidebar
+
+    Returns:
+        None
+    """
+    # Prepara retorno e volatilidade de cada ativo
+    df_otimizacao = prepare_optimization_inputs(df_result, SCORE_TYPE, restricoes["BTG_AVAILABLE"])
+
+    if df_otimizacao.empty:
+        tab_otimizacao.warning(f"Não há ativos com dados suficientes para o horizonte {SCORE_TYPE}")
+        return None
+
+    # Calcula fronteira eficiente, usando a correlação histórica dos retornos mensais quando disponível
+    correlacao, cobertura = correlation_for_assets(df_otimizacao["cnpj"].values)
+    covariancia = build_covariance(df_otimizacao["volatilidade_anual"].values, correlacao)
+    fronteira = compute_efficient_frontier(
+        df_otimizacao["retorno_anual"].values,
+        covariancia,
+        df_otimizacao["categoria"].to_numpy(dtype = str),
+        restricoes["limites_categorias"],
+        restricoes["MAX_PESO_ATIVO"],
+        restricoes["taxa_livre_risco"]
     )
 
-    return df_result_chart
+    if fronteira is None:
+        tab_otimizacao.error("As restrições de peso por categoria e por ativo não permitem montar uma carteira")
+        return None
+
+    tab_otimizacao.write(f"Ativos considerados: {len(df_otimizacao)} (até {MAX_ATIVOS_POR_CATEGORIA_OTIMIZACAO} melhores por categoria, {cobertura:.0%} dos pares com correlação histórica, demais com {CORRELACAO_PADRAO})")
+
+    # Exibe gráfico da fronteira eficiente
+    fig = chart_efficient_frontier(df_otimizacao, fronteira, covariancia)
+    tab_otimizacao.plotly_chart(fig, use_container_width=True)
+
+    # Exibe pesos das carteiras de máximo Sharpe e mínima volatilidade
+    col_sharpe, col_min_vol = tab_otimizacao.columns(2)
+    for coluna, titulo, chave in [(col_sharpe, "Máximo Sharpe", "pesos_max_sharpe"), (col_min_vol, "Mínima Volatilidade", "pesos_min_vol")]:
+        pesos = fronteira[chave]
+        coluna.subheader(titulo)
+        coluna.write(f"Retorno: {pesos @ df_otimizacao['retorno_anual'].values:.2%} | Volatilidade: {np.sqrt(pesos @ covariancia @ pesos):.2%}")
+        coluna.dataframe(
+            df_otimizacao
+            .assign(peso = pesos * 100)
+            .query("peso > 0.01")
+            .sort_values(by = "peso", ascending = False)
+            .filter(["name", "categoria", "peso"]),
+            hide_index = True
+        )
 
+    return None
 
-# Cria gráfico interativo
-def chart_interactive(
-    df_result_chart: pd.DataFrame,
-    TOOTLIP_SIMPLE: bool,
-    TOOLTIP_SIMPLE_COLUMNS: list
+
+
+# Função que retorna os CNPJs dos pontos selecionados no gráfico de dispersão
+def selected_cnpjs_from_chart():
+    """
+    Função que retorna os CNPJs dos pontos selecionados no gráfico de dispersão
+
+    Args:
+        None
+
+    Returns:
+        list: CNPJs selecionados (vazia caso não haja seleção)
+    """
+    grafico = st.session_state.get("grafico_dispersao")
+    if grafico is None:
+        return []
+
+    return [ponto["customdata"][0] for ponto in grafico["selection"]["points"] if "customdata" in ponto]
+
+
+# Função que cria a aba de simulação de carteira
+def tab_portfolio_simulation(
+    tab_simulacao: st.tabs,
+    df_result: pd.DataFrame,
+    SCORE_TYPE: str
 ):
     """
-    Função que cria gráfico interativo
+    Função que cria a aba de simulação de carteira
 
     Args:
-        df_result_chart (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        tab_simulacao (st.tabs): Aba de simulação de carteira
+        df_result (pd.DataFrame): DataFrame com dados do webscrapping
+        SCORE_TYPE (str): Tipo de score escolhido pelo usuário (horizonte de retorno e volatilidade)
 
     Returns:
-        fig: Gráfico interativo
+        None
     """
-    if TOOTLIP_SIMPLE == True:
-        tooltip_columns = TOOLTIP_SIMPLE_COLUMNS
+    tab_simulacao.write('''
+        Simule a evolução de uma carteira com os ativos selecionados no gráfico da aba Data_Analysis (ou escolhidos abaixo)
+    ''')
 
-    else:
-        tooltip_columns = list(df_result_chart.columns)
+    # Retorno e volatilidade anualizados de todos os ativos com dados no horizonte escolhido
+    df_ativos = prepare_optimization_inputs(df_result, SCORE_TYPE, MAX_ATIVOS_POR_CATEGORIA = len(df_result))
+    if df_ativos.empty:
+        tab_simulacao.warning(f"Não há ativos com dados suficientes para o horizonte {SCORE_TYPE}")
+        return None
+
+    # Ativos da carteira: começa com a seleção do gráfico
+    dict_cnpj_name = dict(zip(df_ativos["cnpj"], df_ativos["name"]))
+    list_selecionados = [dict_cnpj_name[cnpj] for cnpj in dict.fromkeys(selected_cnpjs_from_chart()) if cnpj in dict_cnpj_name]
+    list_name = tab_simulacao.multiselect("Ativos da carteira", list(dict_cnpj_name.values()), default = list_selecionados)
+    if len(list_name) == 0:
+        tab_simulacao.info("Selecione ativos no gráfico (caixa ou laço) ou na lista acima")
+        return None
+
+    # Pesos editáveis (iguais por padrão), normalizados para somar 100%
+    df_carteira = tab_simulacao.data_editor(
+        df_ativos[df_ativos["name"].isin(list_name)]
+        .assign(peso = 100 / len(list_name))
+        .filter(["name", "categoria", "retorno_anual", "volatilidade_anual", "peso", "cnpj"]),
+        disabled = ["name", "categoria", "retorno_anual", "volatilidade_anual", "cnpj"],
+        hide_index = True,
+        key = "pesos_simulacao"
+    )
+    pesos = df_carteira["peso"].clip(lower = 0).to_numpy(dtype = np.float64)
+    if pesos.sum() <= 0:
+        tab_simulacao.error("A soma dos pesos precisa ser maior que zero")
+        return None
+    pesos = pesos / pesos.sum()
+
+    # Parâmetros da simulação
+    col_simulacoes, col_meses, col_seed = tab_simulacao.columns(3)
+    n_simulacoes = col_simulacoes.number_input("Caminhos simulados", min_value = 1000, max_value = 1000000, value = N_SIMULACOES_PADRAO, step = 10000)
+    meses = col_meses.slider("Horizonte (meses)", min_value = 1, max_value = 240, value = MESES_SIMULACAO_PADRAO)
+    seed = col_seed.number_input("Semente", min_value = 0, value = SEED_SIMULACAO, step = 1)
+    rebalancear = tab_simulacao.checkbox("Rebalancear mensalmente para os pesos iniciais", value = False)
+
+    # Correlação histórica quando disponível
+    correlacao, cobertura = correlation_for_assets(df_carteira["cnpj"].values)
+
+    df_bandas, resumo = compute_simulation_bands(
+        df_carteira["retorno_anual"].to_numpy(dtype = np.float64),
+        df_carteira["volatilidade_anual"].to_numpy(dtype = np.float64),
+        pesos,
+        correlacao,
+        int(n_simulacoes),
+        int(meses),
+        int(seed),
+        rebalancear
+    )
 
-    # Create an interactive scatter plot
-    fig = px.scatter(df_result_chart, 
-                    x = "volatility", 
-                    y = "profitability", 
-                    color = "categoria",
-                    hover_data = tooltip_columns
-                    )
-    
-    # Layout do gráfico
-    fig.update_layout(title = f"SuperCarteira: Rentabilidade x Volatilidade (filtrado < {MAX_VOLATILITY})",
-                        xaxis_title = f"Volatilidade_{SCORE_TYPE}",
-                        yaxis_title = f"Rentabilidade_{SCORE_TYPE}",
+    # Exibe resumo e gráfico das bandas
+    tab_simulacao.write(f"{cobertura:.0%} dos pares com correlação histórica, demais com {CORRELACAO_PADRAO}")
+    col_media, col_perda, col_mediana = tab_simulacao.columns(3)
+    col_media.metric("Valor final médio", f"{resumo['media_final'] * 100:.1f}")
+    col_perda.metric("Probabilidade de perda", f"{resumo['probabilidade_perda']:.1%}")
+    col_mediana.metric("Mediana do valor final", f"{resumo['p50_final'] * 100:.1f}")
+    tab_simulacao.plotly_chart(chart_simulation_bands(df_bandas), use_container_width=True)
+
+    return None
+
+
+# Função que cria a aba de backtest da SuperCarteira
+def tab_supercarteira_backtest(
+    tab_backtest: st.tabs,
+    list_categorias: list
+):
+    """
+    Função que cria a aba de backtest da SuperCarteira
+
+    Args:
+        tab_backtest (st.tabs): Aba de backtest
+        list_categorias (list): Lista de categorias de ativos
+
+    Returns:
+        None
+    """
+    tab_backtest.write('''
+        Desempenho de carteiras montadas com os ativos de cada categoria em cada snapshot da SuperCarteira ("01. Input/YYYY-MM")
+    ''')
+
+    # Precisa de snapshots datados e do painel de retornos mensais
+    if len(list_snapshot_dates()) == 0:
+        tab_backtest.info("Nenhum snapshot datado encontrado em '01. Input/YYYY-MM'")
+        return None
+    if returns_panel_version() is None:
+        tab_backtest.info("Painel de retornos indisponível: execute 'Webscrapping Retornos Mensais' para rodar o backtest")
+        return None
+
+    # Parâmetros do backtest
+    col_esquema, col_top_n, col_horizonte = tab_backtest.columns(3)
+    esquema = col_esquema.selectbox("Pesos", ESQUEMAS_PESOS_BACKTEST)
+    top_n = col_top_n.selectbox("Ativos por categoria", TOP_N_BACKTEST, format_func = lambda _: "todos" if _ is None else f"top {_} por score")
+    horizonte = col_horizonte.selectbox("Horizonte (meses)", HORIZONTES_BACKTEST)
+
+    versao = backtest_inputs_version()
+    df_resumo, df_acumulado = compute_backtest(versao, list_categorias, esquema, top_n, horizonte)
+
+    # Pesos por score dependem do histórico de webscrappings até cada snapshot
+    if (esquema == "score" or top_n is not None) and read_history_index() is None:
+        tab_backtest.warning("Sem histórico de webscrappings não há score nas datas dos snapshots: as carteiras ficam vazias")
+
+    if df_resumo is None:
+        tab_backtest.info("Os snapshots datados não têm arquivos SuperCarteira_*.json das categorias selecionadas")
+        return None
+    if df_acumulado.empty:
+        tab_backtest.info("O painel de retornos não tem meses posteriores aos snapshots")
+        return None
+
+    # Retorno acumulado médio entre os snapshots, por categoria
+    fig = px.line(
+        df_acumulado.groupby(["categoria", "mes"], as_index = False)["retorno_acumulado"].mean(),
+        x = "mes",
+        y = "retorno_acumulado",
+        color = "categoria"
+    )
+    fig.update_layout(title = "Retorno acumulado médio após cada snapshot (%)",
+                        xaxis_title = "Meses após o snapshot",
+                        yaxis_title = "Retorno acumulado (%)",
                         legend_title = "Categoria")
+    tab_backtest.plotly_chart(fig, use_container_width=True)
+    tab_backtest.dataframe(df_resumo, hide_index = True)
+
+    # Varredura de todas as combinações de parâmetros em um pool de processos
+    if tab_backtest.button("Comparar todas as combinações de parâmetros"):
+        list_parametros = [(esquema, top_n, horizonte) for esquema in ESQUEMAS_PESOS_BACKTEST for top_n in TOP_N_BACKTEST for horizonte in HORIZONTES_BACKTEST]
+        with tab_backtest.spinner(f"Executando {len(list_parametros)} backtests..."):
+            df_varredura = run_backtest_sweep(versao, list_categorias, list_parametros)
+        tab_backtest.dataframe(
+            df_varredura.pivot_table(index = ["esquema", "top_n", "horizonte"], columns = "categoria", values = "retorno_anual", observed = True),
+            use_container_width=True
+        )
 
-    return fig
+    return None
 
 
-# Transformar o DataFrame em um arquivo Excel na memória
-@st.cache_data
-def convert_df_to_excel(df):
+# Função que cria a primeira parte da aba de data analysis
+def tab_data_analysis_part1(
+    tab_data_analysis: st.tabs,
+    df_template_converted: pd.DataFrame
+):
     """
-    Função que converte um DataFrame em um arquivo Excel na memória
+    Função que cria a primeira parte da aba de data analysis
 
     Args:
-        df (pd.DataFrame): DataFrame com dados
+        tab_data_analysis (st.tabs): Aba de data analysis
+        df_template_converted (pd.DataFrame): DataFrame com dados convertidos
+
+    Returns:
+        df_result: DataFrame com dados limpos para criar gráficos
+        versao_dataset: Identificador da versão dos dados (chave dos caches de análises sobre df_result)
+    """
+    # Colapsa as funcionalidades de upload e download de arquivos
+    expander_data_analisys = tab_data_analysis.expander(label = "Uploads/Downloads")
+
+    # Caso o usuário clique no botão, o arquivo template será baixado
+    expander_data_analisys.download_button(
+        label = "Download Template",
+        data = df_template_converted,
+        file_name = "Template_SuperCarteira.xlsx",
+        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+    # Permite usuário dar upload de arquivo com dados no formato para construir os gráficos
+    Upload_Data = expander_data_analisys.file_uploader("Upload Arquivo (no formato do template)", type = FORMATOS_UPLOAD)
+
+    if Upload_Data is not None:
+
+        # Le somente as colunas do template, validando as obrigatórias (arquivo inválido volta para os dados padrão)
+        dataframe = read_upload(
+            Upload_Data,
+            expander_data_analisys,
+            template_result_columns(os.path.getmtime("Template_SuperCarteira_Result.xlsx")),
+            COLUNAS_OBRIGATORIAS_RESULTADO
+        )
+
+        # Adiciona métricas de risco calculadas a partir do painel de retornos mensais
+        if dataframe is None:
+            Upload_Data = None
+        else:
+            df_result = add_risk_metrics(dataframe)
+            versao_dataset = f"upload:{Upload_Data.file_id}"
+
+    # Caso não haja upload, permite usar o último webscrapping publicado ou a posição do histórico em uma data
+    df_indice = read_history_index()
+    arquivo_dataset = current_dataset_version()
+    versao_retornos = returns_panel_version()
+    list_fontes = (["Último webscrapping"] if arquivo_dataset is not None else []) + ["Template"]
+    fonte_dados = list_fontes[0]
+    if Upload_Data is None and df_indice is not None:
+        fonte_dados = expander_data_analisys.selectbox(
+            "Dados do histórico de webscrappings (posição até a data)",
+            list_fontes + sorted(df_indice["run_date"].unique(), reverse = True)
+            )
+
+    if Upload_Data is None and fonte_dados == "Último webscrapping":
+
+        # Dataset compartilhado entre todas as sessões (carregado uma vez por versão publicada)
+        df_result = load_shared_dataset(arquivo_dataset, versao_retornos)
+        versao_dataset = f"dataset:{arquivo_dataset}"
+
+    if Upload_Data is None and fonte_dados not in ["Último webscrapping", "Template"]:
+
+        # Le a última posição de cada ativo até a data escolhida
+        df_result = add_risk_metrics(apply_result_schema(history_snapshot(fonte_dados).drop(columns = "run_time")))
+        # A posição de uma data muda quando um novo webscrapping é feito no mesmo dia, por isso a versão do histórico entra na chave
+        versao_dataset = f"historico:{fonte_dados}:{history_version()}"
+
+    # Caso não haja upload, usa dados dos default
+    if Upload_Data is None and fonte_dados == "Template":
+
+        # Template compartilhado entre todas as sessões
+        df_result = load_template_result(os.path.getmtime("Template_SuperCarteira_Result.xlsx"), versao_retornos)
+        versao_dataset = f"template:{os.path.getmtime('Template_SuperCarteira_Result.xlsx')}"
+
+    # As análises dependem também das séries de retornos
+    versao_dataset = f"{versao_dataset}|retornos:{versao_retornos}"
+
+    return df_result, versao_dataset
+
+
+# Função que cria a segunda parte da aba de data analysis
+def tab_data_analysis_part2(
+    tab_data_analysis: st.tabs,
+    df_result: pd.DataFrame,
+    SCORE_TYPE: str,
+    MAX_PROFITABILITY: float,
+    MAX_VOLATILITY: float,
+    MIN_PROFITABILITY: float,
+    MIN_VOLATILITY: float,
+    TOOTLIP_SIMPLE: bool,
+    TOOLTIP_SIMPLE_COLUMNS: list,
+    BTG_AVAILABLE: bool,
+    RISK_METRIC: str = "sortino",
+    COLOR_BY: str = "categoria",
+    versao_dataset: str = None
+):
+    """
+    Função que cria a segunda parte da aba de data analysis
+
+    Args:
+        tab_data_analysis (st.tabs): Aba de data analysis
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        SCORE_TYPE (str): Tipo de score escolhido pelo usuário
+        MAX_PROFITABILITY (float): Máxima rentabilidade
+        MAX_VOLATILITY (float): Máxima volatilidade
+        MIN_PROFITABILITY (float): Mínima rentabilidade
+        MIN_VOLATILITY (float): Mínima volatilidade
+        RISK_METRIC (str): Métrica de risco escolhida pelo usuário
+        COLOR_BY (str): Coluna usada para colorir os pontos
+        versao_dataset (str): Identificador da versão dos dados, usado como chave do cache dos clusters
 
     Returns:
-        processed_data: Arquivo Excel na memória
+        None
     """
-    # Usando um buffer para armazenar o arquivo Excel
-    from io import BytesIO
+    # Busca de fundos por nome, gestora, ISIN ou CNPJ
+    list_destaque = tab_fund_search(tab_data_analysis, df_result, versao_dataset)
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-        # writer.save()  # A chamada a `save()` pode ser omitida, pois `close()` automaticamente salva
-    output.seek(0)
-
-    return output
+    # Resumo de cada categoria (calculado uma vez por versão dos dados)
+    tab_category_summary(tab_data_analysis, df_result, versao_dataset, SCORE_TYPE)
 
+    # Ranking dos melhores fundos de cada categoria (sobre o DataFrame completo, antes de qualquer filtro)
+    tab_ranking(tab_data_analysis, df_result, versao_dataset, SCORE_TYPE, BTG_AVAILABLE)
 
+    # Agrupa os fundos em clusters (somente quando o gráfico é colorido por cluster)
+    if COLOR_BY == "cluster":
+        df_result = tab_clusters(tab_data_analysis, df_result, versao_dataset)
 
-# ---------------------------------------------------------- 04. DATA MANIPULATION ---------------------------------------------------------
+    # Prepara os dados para criar os gráficos
+    df_result_chart_clean = clean_to_chart(df_result, SCORE_TYPE, MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, BTG_AVAILABLE, RISK_METRIC)
 
+    # Avisa caso as métricas de risco ainda não tenham sido calculadas
+    if df_result_chart_clean["risk_metric"].isnull().all():
+        tab_data_analysis.info("Métricas de risco indisponíveis: execute 'Webscrapping Retornos Mensais' para calculá-las")
 
+    # Cria gráfico interativo, destacando os fundos escolhidos na busca
+    fig = chart_interactive(df_result_chart_clean, TOOTLIP_SIMPLE, TOOLTIP_SIMPLE_COLUMNS, COLOR_BY, list_destaque)
 
-# Le arquivo com dados template
-df_template = pd.read_excel("Template_SuperCarteira_Result.xlsx", engine = "openpyxl")
+    # Exibir o gráfico Plotly no aplicativo Streamlit (pontos selecionados com caixa ou laço são usados na simulação de carteira)
+    tab_data_analysis.plotly_chart(fig, use_container_width=True, on_select = "rerun", selection_mode = ["box", "lasso", "points"], key = "grafico_dispersao")
 
+    # Converter o gráfico Plotly em HTML
+    html_str = pio.to_html(fig, full_html=False)
 
+    # Evolução do score dos ativos escolhidos ao longo dos webscrappings salvos no histórico
+    if read_history_index() is not None:
+        expander_historico = tab_data_analysis.expander(label = "Histórico de Score")
+        dict_name_cnpj = dict(zip(df_result["name"], df_result["cnpj"]))
+        list_name_historico = expander_historico.multiselect("Ativos", list(dict_name_cnpj.keys()), max_selections = 10)
 
-# -------------------------------------------------------- 05. STREAMLIT COMPONENTS --------------------------------------------------------
+        if len(list_name_historico) > 0:
+            df_trajetoria = (
+                history_trajectory([dict_name_cnpj[name] for name in list_name_historico], ["name", "score_all"])
+                .assign(name = lambda _: _.groupby("cnpj")["name"].transform("last"))
+            )
+            fig_historico = px.line(df_trajetoria, x = "run_time", y = "score_all", color = "name", markers = True)
+            expander_historico.plotly_chart(fig_historico, use_container_width=True)
 
+    return None
 
 
-# Função que cria os componentes principais da aplicação
-def main_components():
+# Função que cria o painel com o resumo de cada categoria na aba de data analysis
+def tab_category_summary(
+    tab_data_analysis: st.tabs,
+    df_result: pd.DataFrame,
+    versao_dataset: str,
+    SCORE_TYPE: str
+):
     """
-    Função que cria os componentes principais da aplicação
+    Função que cria o painel com o resumo de cada categoria na aba de data analysis
 
     Args:
-        None
+        tab_data_analysis (st.tabs): Aba de data analysis
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        versao_dataset (str): Identificador da versão dos dados, chave do resumo
+        SCORE_TYPE (str): Horizonte mostrado
 
     Returns:
-        tab_webscrapping: Aba de webscrapping
-        tab_data_analysis: Aba de data analysis
+        None
     """
-    # Título da aplicação
-    st.title("Ferramenta de Investimento")
-
-    # Cria abas de navegação
-    tab_webscrapping, tab_data_analysis = st.tabs(["Webscrapping", "Data_Analysis"])
+    expander_resumo = tab_data_analysis.expander(label = "Resumo por Categoria")
+    df_resumo = load_category_summary(versao_dataset, df_result)
+
+    # Tabela com a quantidade, participação no BTG e mediana das medidas do horizonte escolhido
+    list_colunas_mediana = [f"{medida}_{SCORE_TYPE}_p50" for medida in MEDIDAS_RESUMO if f"{medida}_{SCORE_TYPE}_p50" in df_resumo.columns]
+    expander_resumo.dataframe(
+        df_resumo[["categoria", "n_fundos", "participacao_btg"] + list_colunas_mediana],
+        hide_index = True,
+        column_config = {"participacao_btg": st.column_config.ProgressColumn(min_value = 0, max_value = 1, format = "percent")}
+    )
 
-    # Botão para download
-    df_template_converted = convert_df_to_excel(df_template)
+    # Distribuição de uma medida em cada categoria, desenhada direto dos quantis do resumo (sem reler os fundos)
+    medida = expander_resumo.radio("Medida", [medida for medida in MEDIDAS_RESUMO if f"{medida}_{SCORE_TYPE}_p50" in df_resumo.columns], horizontal = True, key = "medida_resumo")
+    if medida is None:
+        return None
+
+    coluna = f"{medida}_{SCORE_TYPE}"
+    fig = go.Figure(go.Box(
+        x = df_resumo["categoria"],
+        lowerfence = df_resumo[f"{coluna}_p0"],
+        q1 = df_resumo[f"{coluna}_p25"],
+        median = df_resumo[f"{coluna}_p50"],
+        q3 = df_resumo[f"{coluna}_p75"],
+        upperfence = df_resumo[f"{coluna}_p100"],
+        name = coluna
+    ))
+    fig.update_layout(yaxis_title = coluna, showlegend = False)
+    expander_resumo.plotly_chart(fig, use_container_width = True, key = "grafico_resumo_categorias")
 
-    return tab_webscrapping, tab_data_analysis, df_template_converted
+    return None
 
 
-# Função que cria a primeira parte da sidebar
-def sidebar_part1(
-    SCORE_OPTIONS: list
+# Função que cria a busca de fundos na aba de data analysis
+def tab_fund_search(
+    tab_data_analysis: st.tabs,
+    df_result: pd.DataFrame,
+    versao_dataset: str
 ):
     """
-    Função que cria a primeira parte da sidebar
+    Função que cria a busca de fundos na aba de data analysis
 
     Args:
-        SCORE_OPTIONS (list): Lista com opções de score
+        tab_data_analysis (st.tabs): Aba de data analysis
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        versao_dataset (str): Identificador da versão dos dados, usado como chave do cache do índice
 
     Returns:
-        SCORE_TYPE: Tipo de score escolhido pelo usuário
+        list: CNPJs dos fundos escolhidos, destacados no gráfico
     """
-    # Filtros da Tabela
-    st.sidebar.header("Configurações")  
-
-    # Componente de seleção para o usuário escolher SCORE_TYPE
-    expander_data = st.sidebar.expander(label = "Filtros dos Dados")
-    SCORE_TYPE = expander_data.selectbox(f"Escolha o horizonte dos dados", SCORE_OPTIONS)
+    expander_busca = tab_data_analysis.expander(label = "Buscar Fundos")
+    consulta = expander_busca.text_input("Nome, gestora, ISIN ou CNPJ", key = "busca_fundos")
+
+    # Índice montado uma única vez por versão dos dados
+    indice = build_search_index(versao_dataset, df_result)
+    df_busca = search_funds(indice, consulta) if len(consulta.strip()) > 0 else pd.DataFrame(columns = ["cnpj", "name", "relevancia"])
+
+    # Opções: fundos já escolhidos (mantidos entre buscas) seguidos dos resultados da busca atual
+    dict_opcoes = {cnpj: name for cnpj, name in zip(indice["cnpjs"], indice["nomes"]) if cnpj in st.session_state.get("fundos_destacados", [])}
+    dict_opcoes.update(zip(df_busca["cnpj"], df_busca["name"]))
+    list_destaque = expander_busca.multiselect(
+        "Fundos destacados no gráfico",
+        list(dict_opcoes.keys()),
+        format_func = lambda cnpj: f"{dict_opcoes[cnpj]} ({cnpj})",
+        key = "fundos_destacados"
+    )
 
-    # Config Gráfico
-    PROFITABILITY = f"profitability_{SCORE_TYPE}"
-    VOLATILITY = f"volatility_{SCORE_TYPE}"
+    if len(consulta.strip()) > 0 and df_busca.empty:
+        expander_busca.info("Nenhum fundo encontrado")
 
-    return PROFITABILITY, VOLATILITY, SCORE_TYPE
+    return list_destaque
 
 
-# Função que cria a segunda parte da sidebar
-def sidebar_part2(
+# Função que cria a tabela com os melhores fundos de cada categoria na aba de data analysis
+def tab_ranking(
+    tab_data_analysis: st.tabs,
     df_result: pd.DataFrame,
+    versao_dataset: str,
+    SCORE_TYPE: str,
+    BTG_AVAILABLE: bool
 ):
     """
-    Função que cria a segunda parte da sidebar
+    Função que cria a tabela com os melhores fundos de cada categoria na aba de data analysis
 
     Args:
+        tab_data_analysis (st.tabs): Aba de data analysis
         df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        versao_dataset (str): Identificador da versão dos dados, usado como chave do cache do ranking
+        SCORE_TYPE (str): Horizonte escolhido pelo usuário (colunas de rentabilidade e volatilidade mostradas)
+        BTG_AVAILABLE (bool): Valor inicial do filtro de produtos disponíveis no BTG
 
     Returns:
-        MAX_PROFITABILITY: Máxima rentabilidade
-        MAX_VOLATILITY: Máxima volatilidade
-        MIN_PROFITABILITY: Mínima rentabilidade
-        MIN_VOLATILITY: Mínima volatilidade
+        None
     """
-    # Filtros do gráfico
-    expander_chart = st.sidebar.expander(label = "Filtros do Gráfico")
-    expander_chart.write('''
-        Modifique o gráfico de acordo com suas preferências
-    ''')
-
-    # Sidebar checkboxes para sugestões de filtros do gráfico
-    USE_SUGESTION = expander_chart.checkbox(
-        "Usar Sugestões de Eixos", 
-        value = False, 
-        help = "Ao clicar no botão 'Aceitar sugestões', você aceita os valores sugeridos para os filtros"
-        )
+    expander_ranking = tab_data_analysis.expander(label = "Ranking por Categoria")
+    colunas_ranking = expander_ranking.columns(3)
 
-    # Caso o usuário queira usar sugestões de filtros
-    if USE_SUGESTION == True:
+    # Arrays do ranking (montados uma única vez por versão dos dados)
+    indice = build_ranking_index(versao_dataset, df_result)
 
-        # Cria sugestões de valores para os limites de filtro
-        min_profitability = 0
-        max_profitability = 999999
-        min_volatility = 0
-        max_volatility = 100
+    # Coluna de ordenação, quantidade por categoria e filtro do BTG
+    coluna = colunas_ranking[0].selectbox("Ordenar por", indice["colunas"], index = indice["colunas"].index("score_all") if "score_all" in indice["colunas"] else 0)
+    k = colunas_ranking[1].number_input("Fundos por categoria", min_value = 1, max_value = 1000, value = TOP_K_PADRAO, step = 1)
+    BTG_AVAILABLE_RANKING = colunas_ranking[2].checkbox("Somente disponíveis no BTG", value = BTG_AVAILABLE, key = "ranking_btg")
 
-    # Caso o usuário não queira usar sugestões de filtros
+    df_ranking = (
+        top_k_per_category(df_result, indice, coluna, int(k), BTG_AVAILABLE_RANKING)
+        .filter(["categoria", "ranking", "name", "cnpj", "managementCompany", coluna, f"profitability_{SCORE_TYPE}", f"volatility_{SCORE_TYPE}", "disponibilidade_btg"])
+    )
+    if df_ranking.empty:
+        expander_ranking.info(f"Nenhum fundo com valor de '{coluna}' (métricas de risco dependem do 'Webscrapping Retornos Mensais')")
     else:
+        expander_ranking.dataframe(df_ranking, hide_index = True)
 
-        # Cria deafult values para os limites de filtro
-        min_profitability = df_result[PROFITABILITY].min()
-        max_profitability = df_result[PROFITABILITY].max()
-        min_volatility = df_result[VOLATILITY].min()
-        max_volatility = df_result[VOLATILITY].max()
+    return None
 
-    # Recebe valores que definem os limites de filtro
-    MIN_PROFITABILITY, MAX_PROFITABILITY = expander_chart.slider(
-        "Profitability", value = (min_profitability, max_profitability)
-        )
 
-    MIN_VOLATILITY, MAX_VOLATILITY = expander_chart.slider(
-        "Volatility", value = (min_volatility, max_volatility)
-        )
+# Função que cria a análise de clusters na aba de data analysis
+def tab_clusters(
+    tab_data_analysis: st.tabs,
+    df_result: pd.DataFrame,
+    versao_dataset: str
+):
+    """
+    Função que cria a análise de clusters na aba de data analysis
 
-    # Sidebar checkboxes para sugestões de filtros do gráfico
-    TOOLIP_SIMPLE = expander_chart.checkbox(
-        "Usar Tootltip Simples", 
-        value = False, 
-        help = "Ao clicar no botão 'Usar Tootltip Simples', o tooltip usará somente mostrará colunas chaves ao invés de todas as colunas"
-        )
+    Args:
+        tab_data_analysis (st.tabs): Aba de data analysis
+        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
+        versao_dataset (str): Identificador da versão dos dados, usado como chave do cache dos clusters
 
-    # Sidebar checkboxes para sugestões de filtros do gráfico
-    BTG_AVAILABLE = expander_chart.checkbox(
-        "Mostrar somente produtos disponíveis no BTG", 
-        value = False, 
-        help = "Ao clicar no botão 'Mostrar somente produtos disponíveis no BTG', os ativos que aparecererão no gráfico serão somente os disponíveis no BTG"
-        )
+    Returns:
+        df_result: Cópia de df_result com o cluster de cada fundo (somente os representantes, caso o usuário escolha)
+    """
+    expander_clusters = tab_data_analysis.expander(label = "Clusters e Diversificação", expanded = True)
+    n_clusters = expander_clusters.slider("Quantidade de clusters", min_value = 2, max_value = MAX_CLUSTERS, value = N_CLUSTERS_PADRAO)
+
+    # Agrupa os fundos (calculado uma única vez por versão dos dados e quantidade de clusters)
+    df_clusters = compute_clusters(versao_dataset, n_clusters, df_result)
+    df_result = add_clusters(df_result, df_clusters)
+
+    # Um representante por cluster: por padrão o fundo mais próximo do centro, podendo ser trocado pelo usuário
+    dict_representantes = {}
+    df_ordenado = df_result.drop_duplicates(subset = "cnpj").sort_values("distancia_centro")
+    colunas_picker = expander_clusters.columns(3)
+    for indice, (cluster, df_cluster) in enumerate(df_ordenado.groupby("cluster", observed = True)):
+        dict_name_cnpj = dict(zip(df_cluster["name"], df_cluster["cnpj"]))
+        name_representante = colunas_picker[indice % 3].selectbox(f"{cluster} ({len(df_cluster)} fundos)", list(dict_name_cnpj.keys()), key = f"representante_{cluster}")
+        dict_representantes[cluster] = dict_name_cnpj[name_representante]
+
+    # Resumo dos representantes escolhidos
+    df_representantes = (
+        df_result[df_result["cnpj"].isin(dict_representantes.values())]
+        .drop_duplicates(subset = "cnpj")
+        .filter(["cluster", "name", "cnpj", "categoria", "managementCompany", "profitability_60m", "volatility_60m", "score_all"])
+        .sort_values("cluster")
+    )
+    expander_clusters.dataframe(df_representantes, hide_index = True)
 
-    return MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOLIP_SIMPLE, BTG_AVAILABLE
+    # Permite mostrar no gráfico somente os representantes (uma carteira diversificada entre os clusters)
+    if expander_clusters.checkbox("Mostrar somente os representantes no gráfico", value = False):
+        df_result = df_result[df_result["cnpj"].isin(dict_representantes.values())]
 
+    return df_result
 
-# Função que cria a primeira parte da aba de data analysis
-def tab_data_analysis_part1(
-    tab_data_analysis: st.tabs,
-    df_template_converted: pd.DataFrame
+
+# Função que inscreve esta sessão em um webscrapping em segundo plano, iniciando-o somente se nenhuma sessão já tiver pedido o mesmo
+def start_scrape_job(
+    tab_webscrapping: st.tabs,
+    job: ScrapeJob
 ):
     """
-    Função que cria a primeira parte da aba de data analysis
+    Função que inscreve esta sessão em um webscrapping em segundo plano, iniciando-o somente se nenhuma sessão já tiver pedido o mesmo
 
     Args:
-        tab_data_analysis (st.tabs): Aba de data analysis
-        df_template_converted (pd.DataFrame): DataFrame com dados convertidos
+        tab_webscrapping (st.tabs): Aba de webscrapping
+        job (ScrapeJob): Webscrapping pedido (não iniciado)
 
     Returns:
-        df_result: DataFrame com dados limpos para criar gráficos
+        None
     """
-    # Colapsa as funcionalidades de upload e download de arquivos
-    expander_data_analisys = tab_data_analysis.expander(label = "Uploads/Downloads")
+    scrape_jobs = st.session_state.setdefault("scrape_jobs", {})
+    id_sessao = st.session_state.setdefault("id_sessao", uuid.uuid4().hex)
 
-    # Caso o usuário clique no botão, o arquivo template será baixado
-    expander_data_analisys.download_button(
-        label = "Download Template",
-        data = df_template_converted,
-        file_name = "Template_SuperCarteira.xlsx",
-        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # Não inicia o mesmo webscrapping duas vezes ao mesmo tempo
+    if job.nome in scrape_jobs and scrape_jobs[job.nome].executando:
+        tab_webscrapping.warning(f"Webscrapping {job.nome} já está em execução")
+        return None
 
-    # Permite usuário dar upload de arquivo com dados no formato para construir os gráficos
-    Upload_Data = expander_data_analisys.file_uploader("Upload Arquivo Excel (no formato do template)", type = ["xlsx"])
+    # Pedidos iguais de outras sessões são compartilhados pelo registro do servidor
+    job, origem = scrape_job_registry().get_or_start(job, id_sessao)
+    if origem == "em_execucao":
+        tab_webscrapping.info(f"Webscrapping {job.nome} já foi iniciado por outra sessão às {job.inicio:%H:%M:%S}: acompanhando o mesmo progresso")
+    elif origem == "recente":
+        tab_webscrapping.info(f"Webscrapping {job.nome} concluído às {job.fim:%H:%M:%S} (menos de {JANELA_VALIDADE_WEBSCRAPPING_MIN} minutos): reaproveitando o resultado")
 
-    if Upload_Data is not None:
+    scrape_jobs[job.nome] = job
 
-        # Pega valor de bytes do arquivo
-        bytes_data = Upload_Data.getvalue()
+    return None
 
-        # Le arquivo excel
-        dataframe = pd.read_excel(BytesIO(bytes_data))  
-        df_result = dataframe
 
-    # Caso não haja upload, usa dados dos default
-    if Upload_Data is None:
+# Função que mostra o estado de um webscrapping em segundo plano (somente os em execução são atualizados periodicamente)
+def scrape_job_status(
+    nome_job: str
+):
+    """
+    Função que mostra o estado de um webscrapping em segundo plano (somente os em execução são atualizados periodicamente)
 
-        # Le arquivo com dados template
-        df_result = pd.read_excel("Template_SuperCarteira_Result.xlsx", engine = "openpyxl")
+    Args:
+        nome_job (str): Nome do webscrapping
 
-    return df_result
+    Returns:
+        None
+    """
+    if st.session_state["scrape_jobs"][nome_job].executando:
+        scrape_job_progress(nome_job)
+    else:
+        scrape_job_result(nome_job)
 
+    return None
 
-# Função que cria a segunda parte da aba de data analysis
-def tab_data_analysis_part2(
-    tab_data_analysis: st.tabs,
-    df_result: pd.DataFrame,
-    SCORE_TYPE: str,
-    MAX_PROFITABILITY: float,
-    MAX_VOLATILITY: float,
-    MIN_PROFITABILITY: float,
-    MIN_VOLATILITY: float,
-    TOOTLIP_SIMPLE: bool,
-    TOOLTIP_SIMPLE_COLUMNS: list,
-    BTG_AVAILABLE: bool
+
+# Mostra o progresso de um webscrapping em execução, atualizando somente este trecho da tela
+@st.fragment(run_every = INTERVALO_ATUALIZACAO_UI)
+def scrape_job_progress(
+    nome_job: str
 ):
     """
-    Função que cria a segunda parte da aba de data analysis
+    Função que mostra o progresso de um webscrapping em execução, atualizando somente este trecho da tela
 
     Args:
-        tab_data_analysis (st.tabs): Aba de data analysis
-        df_result (pd.DataFrame): DataFrame com dados limpos para criar gráficos
-        SCORE_TYPE (str): Tipo de score escolhido pelo usuário
-        MAX_PROFITABILITY (float): Máxima rentabilidade
-        MAX_VOLATILITY (float): Máxima volatilidade
-        MIN_PROFITABILITY (float): Mínima rentabilidade
-        MIN_VOLATILITY (float): Mínima volatilidade
+        nome_job (str): Nome do webscrapping
 
     Returns:
         None
     """
-    # Prepara os dados para criar os gráficos
-    df_result_chart_clean = clean_to_chart(df_result, SCORE_TYPE, MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, BTG_AVAILABLE)
+    # Ao terminar (ou caso a sessão tenha deixado o webscrapping), a página é refeita uma vez e o trecho deixa de ser atualizado
+    job = st.session_state["scrape_jobs"].get(nome_job)
+    if job is None or job.executando == False:
+        st.rerun(scope = "app")
+
+    job.heartbeat(st.session_state.get("id_sessao"))
+    count, total, texto = job.poll()
+
+    # Barra de progresso e botão de cancelar
+    st.progress(value = min(count / total, 1.0) if total > 0 else 0.0, text = f"Webscrapping {nome_job}: {texto}")
+    if st.button(f"Cancelar Webscrapping {nome_job}", key = f"cancelar_{nome_job}"):
+
+        # Caso outras sessões acompanhem o mesmo webscrapping, somente esta sessão deixa de acompanhá-lo
+        if job.cancel(st.session_state.get("id_sessao")) == False:
+            del st.session_state["scrape_jobs"][nome_job]
+            st.rerun(scope = "app")
+
+    # Resultados parciais: os fundos já processados aparecem no gráfico enquanto o webscrapping continua
+    df_parcial = job.partial_result() if job.transmitir_lotes else None
+    if df_parcial is not None:
+        st.write(f"Resultados parciais: {len(df_parcial)} ativos")
+        st.plotly_chart(
+            px.scatter(
+                df_parcial,
+                x = "volatility_60m",
+                y = "profitability_60m",
+                color = "categoria",
+                hover_name = "name"
+            ),
+            key = f"parcial_{nome_job}"
+        )
 
-    # Cria gráfico interativo
-    fig = chart_interactive(df_result_chart_clean, TOOTLIP_SIMPLE, TOOLTIP_SIMPLE_COLUMNS)
+    return None
 
-    # Exibir o gráfico Plotly no aplicativo Streamlit
-    tab_data_analysis.plotly_chart(fig, use_container_width=True)
 
-    # Converter o gráfico Plotly em HTML
-    html_str = pio.to_html(fig, full_html=False)
+# Função que mostra o resultado de um webscrapping que já terminou (sem atualizações periódicas)
+def scrape_job_result(
+    nome_job: str
+):
+    """
+    Função que mostra o resultado de um webscrapping que já terminou (sem atualizações periódicas)
+
+    Args:
+        nome_job (str): Nome do webscrapping
+
+    Returns:
+        None
+    """
+    job = st.session_state["scrape_jobs"][nome_job]
+    count, total, texto = job.poll()
+
+    # Com erro: mostra a mensagem
+    if job.status == "erro":
+        st.error(f"Erro no webscrapping {nome_job}: {job.erro}")
+        return None
+
+    # Concluído ou cancelado: mostra resumo e botão de download
+    st.write(f"Webscrapping {nome_job} {job.status} em {job.fim - job.inicio} ({texto})")
+    if job.df_resultado is not None:
+        st.write(f"Quantidade de ativos encontrados: {len(job.df_resultado)}")
+
+        # Preview: estatísticas aproximadas de cada categoria e gráfico da amostra
+        if job.mostrar_resumo == True and len(job.df_resultado) > 0:
+            st.dataframe(summarize_categories(job.df_resultado).filter(regex = "^(categoria|n_fundos|.*_60m_p(25|50|75))$"), hide_index = True)
+            st.plotly_chart(
+                px.scatter(job.df_resultado, x = "volatility_60m", y = "profitability_60m", color = "categoria", hover_name = "name"),
+                key = f"resumo_{nome_job}"
+            )
+        st.download_button(
+            label = f"Download Webscrapping {nome_job}",
+            data = job.excel_resultado,
+            file_name = job.arquivo_resultado,
+            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key = f"download_{nome_job}"
+        )
 
     return None
 
@@ -1041,94 +5469,93 @@ def tab_web_scraping(
     expander_data_analisys = tab_webscrapping.expander(label = "Uploads/Downloads")
 
     # Permite usuário dar upload de arquivo com dados no formato para construir os gráficos
-    Upload_Data_MaisRetorno = expander_data_analisys.file_uploader("Upload Webscrapping MaisRetorno", type = ["xlsx"])
+    Upload_Data_MaisRetorno = expander_data_analisys.file_uploader("Upload Webscrapping MaisRetorno", type = FORMATOS_UPLOAD)
 
     ##########
     # Caso o usuário clique no botão, o arquivo template será baixado
     if Upload_Data_MaisRetorno is not None:
 
-        # Pega valor de bytes do arquivo
-        bytes_data = Upload_Data_MaisRetorno.getvalue()
-
-        # Le arquivo excel
-        dataframe = pd.read_excel(BytesIO(bytes_data))  
-        webscrapping_maisretorno_result = dataframe
+        # Le arquivo (o cnpj é necessário para o join com o BTG)
+        webscrapping_maisretorno_result = read_upload(Upload_Data_MaisRetorno, expander_data_analisys, colunas_obrigatorias = ["cnpj"])
+        if webscrapping_maisretorno_result is None:
+            Upload_Data_MaisRetorno = None
 
     # Caso não haja upload, usa dados dos default
     if Upload_Data_MaisRetorno is None:
 
         # Le arquivo com dados template
-        webscrapping_maisretorno_result = pd.read_excel("Template_Webscrapping_MaisRetorno.xlsx", engine = "openpyxl")
+        webscrapping_maisretorno_result = apply_result_schema(pd.read_excel("Template_Webscrapping_MaisRetorno.xlsx", engine = "openpyxl"))
 
     # Permite usuário dar upload de arquivo com dados no formato para construir os gráficos
-    Upload_Data_BTG = expander_data_analisys.file_uploader("Upload Webscrapping BTG", type = ["xlsx"])
+    Upload_Data_BTG = expander_data_analisys.file_uploader("Upload Webscrapping BTG", type = FORMATOS_UPLOAD)
 
     ##########
     # Caso o usuário clique no botão, o arquivo template será baixado
     if Upload_Data_BTG is not None:
 
-        # Pega valor de bytes do arquivo
-        bytes_data = Upload_Data_BTG.getvalue()
-
-        # Le arquivo excel
-        dataframe = pd.read_excel(BytesIO(bytes_data))  
-        webscrapping_btg_result = dataframe
+        # Le arquivo (aceita tanto o CNPJ original do BTG quanto o cnpj já renomeado)
+        webscrapping_btg_result = read_upload(Upload_Data_BTG, expander_data_analisys, colunas_obrigatorias = ["cnpj"], renomear = {"CNPJ": "cnpj"})
+        if webscrapping_btg_result is None:
+            Upload_Data_BTG = None
 
     # Caso não haja upload, usa dados dos default
     if Upload_Data_BTG is None:
 
         # Le arquivo com dados template
-        webscrapping_btg_result = pd.read_excel("Template_Webscrapping_BTG.xlsx", engine = "openpyxl")
+        webscrapping_btg_result = apply_result_schema(pd.read_excel("Template_Webscrapping_BTG.xlsx", engine = "openpyxl"))
 
     ##########
-    # Caso seja clicado o botão de webscrapping do MaisRetorno
+    # Caso seja clicado o botão de webscrapping do MaisRetorno, executa em segundo plano
     if tab_webscrapping.button("Webscrapping MaisRetorno"):
+        start_scrape_job(tab_webscrapping, ScrapeJob(
+            "MaisRetorno",
+            webscrapping_maisretorno,
+            {"list_categorias": list_categorias, "cache_respostas": scrape_response_cache()},
+            extrair_resultado = lambda _: _[0],
+            salvar_historico = True,
+            prefixo_arquivo = "Investimento_Webscrapping_MaisRetorno",
+            transmitir_lotes = True
+        ))
 
-        # Executa o webscrapping
-        webscrapping_maisretorno_result, dm_ativos, dm_ativos_not_found, list_not_found = webscrapping_maisretorno(list_categorias, tab_webscrapping)    
-
-        print(f"webscrapping_maisretorno_result = {webscrapping_maisretorno_result}")
-
-        # Nome do arquivo com resultados do webscrapping
-        time_now = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-        result_file_name = f"Investimento_Webscrapping_MaisRetorno_{time_now}.xlsx"
-
-        # Assuming webscrapping_maisretorno_result is your DataFrame
-        excel_buffer = io.BytesIO()
-        webscrapping_maisretorno_result.to_excel(excel_buffer, index=False)
-        excel_buffer.seek(0)  # Rewind the buffer
-
-        # Caso o usuário clique no botão, o arquivo template será baixado
-        tab_webscrapping.download_button(
-            label = "Download Webscrapping MaisRetorno",
-            data = excel_buffer,
-            file_name = result_file_name,
-            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )    
+    ##########
+    # Preview: webscrapping do Mais Retorno em uma amostra estratificada de cada categoria (respostas reaproveitadas pelo webscrapping completo)
+    expander_preview = tab_webscrapping.expander(label = "Preview MaisRetorno (amostra por categoria)")
+    tipo_amostra = expander_preview.radio("Amostra por", ["Tamanho", "Fração"], horizontal = True, key = "tipo_amostra_preview")
+    if tipo_amostra == "Tamanho":
+        tamanho_amostra = int(expander_preview.number_input("Fundos por categoria", min_value = 1, value = TAMANHO_AMOSTRA_PREVIEW, step = 1))
+        fracao_amostra = None
+    else:
+        tamanho_amostra = None
+        fracao_amostra = expander_preview.slider("Fração de cada categoria", min_value = 0.01, max_value = 1.0, value = FRACAO_AMOSTRA_PREVIEW)
+    seed_amostra = int(expander_preview.number_input("Semente", min_value = 0, value = SEED_AMOSTRA_PREVIEW, step = 1))
+
+    if expander_preview.button("Webscrapping Preview"):
+        start_scrape_job(tab_webscrapping, ScrapeJob(
+            "Preview",
+            webscrapping_preview_maisretorno,
+            {
+                "list_categorias": list_categorias,
+                "tamanho_amostra": tamanho_amostra,
+                "fracao_amostra": fracao_amostra,
+                "seed": seed_amostra,
+                "cache_respostas": scrape_response_cache()
+            },
+            extrair_resultado = lambda _: _[0],
+            prefixo_arquivo = "Investimento_Webscrapping_Preview",
+            transmitir_lotes = True,
+            mostrar_resumo = True
+        ))
 
     ##########
-    # Caso seja clicado o botão de webscrapping do BTG
+    # Caso seja clicado o botão de webscrapping do BTG, executa em segundo plano
     if tab_webscrapping.button("Webscrapping BTG"):
-
-        # Executa o webscrapping
-        webscrapping_btg_result = webscrapping_btg(MAX_PRODUCTS_BTG, SIZE_PER_PAGE_BTG)    
-
-        # Nome do arquivo com resultados do webscrapping
-        time_now = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-        result_file_name_btg = f"Investimento_Webscrapping_BTG_{time_now}.xlsx"
-
-        # Assuming df_result is your DataFrame
-        excel_buffer_btg = io.BytesIO()
-        webscrapping_btg_result.to_excel(excel_buffer_btg, index=False)
-        excel_buffer_btg.seek(0)  # Rewind the buffer
-
-        # Caso o usuário clique no botão, o arquivo template será baixado
-        tab_webscrapping.download_button(
-            label = "Download Webscrapping BTG",
-            data = excel_buffer_btg,
-            file_name = result_file_name_btg,
-            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )    
+        start_scrape_job(tab_webscrapping, ScrapeJob(
+            "BTG",
+            webscrapping_btg,
+            {"MAX_PRODUCTS_BTG": MAX_PRODUCTS_BTG, "SIZE_PER_PAGE_BTG": SIZE_PER_PAGE_BTG},
+            extrair_resultado = lambda _: _,
+            prefixo_arquivo = "Investimento_Webscrapping_BTG"
+        ))
 
     # ##########
     # Caso seja clicado o botão de join webscrappings
@@ -1155,36 +5582,73 @@ def tab_web_scraping(
         )
     
     ##########
-    # Caso seja clicado o botão de join webscrappings
+    # Caso seja clicado o botão de webscrapping completo, executa em segundo plano
     if tab_webscrapping.button("Webscrapping All"):
+        start_scrape_job(tab_webscrapping, ScrapeJob(
+            "All",
+            webscrapping_all,
+            {"list_categorias": list_categorias, "tab_webscrapping": None, "MAX_PRODUCTS_BTG": MAX_PRODUCTS_BTG, "SIZE_PER_PAGE_BTG": SIZE_PER_PAGE_BTG, "cache_respostas": scrape_response_cache()},
+            extrair_resultado = lambda _: _[0],
+            salvar_historico = True,
+            prefixo_arquivo = "Investimento_Webscrapping_Join",
+            transmitir_lotes = True
+        ))
 
-        # Executa o webscrapping
-        webscrapping_join_result, webscrapping_btg_result, webscrapping_maisretorno_result, dm_ativos, dm_ativos_not_found, list_not_found  = webscrapping_all(
-              list_categorias, 
-              tab_webscrapping,
-              MAX_PRODUCTS_BTG, 
-              SIZE_PER_PAGE_BTG
-        )
+    ##########
+    # Caso seja clicado o botão de webscrapping das séries de retornos mensais, executa em segundo plano
+    if tab_webscrapping.button("Webscrapping Retornos Mensais", help = "Atualiza o histórico de retornos mensais e a matriz de correlação entre os ativos"):
+        start_scrape_job(tab_webscrapping, ScrapeJob(
+            "Retornos Mensais",
+            webscrapping_retornos_mensais,
+            {"list_categorias": list_categorias}
+        ))
+
+    # Mostra progresso e resultado dos webscrappings em segundo plano desta sessão
+    with tab_webscrapping:
+        for nome_job in list(st.session_state.get("scrape_jobs", {})):
+            scrape_job_status(nome_job)
 
-        # Nome do arquivo com resultados do webscrapping
-        time_now = datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-        result_file_name_join = f"Investimento_Webscrapping_Join_{time_now}.xlsx"
+    return None
 
-        # Assuming df_result is your DataFrame
-        excel_buffer_all = io.BytesIO()
-        webscrapping_join_result.to_excel(excel_buffer_all, index=False)
-        excel_buffer_all.seek(0)  # Rewind the buffer
 
-        # Caso o usuário clique no botão, o arquivo template será baixado
-        tab_webscrapping.download_button(
-            label = "Download Webscrapping All",
-            data = excel_buffer_all,
-            file_name = result_file_name_join,
-            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )  
-    
 
-    return None
+# Função que cria o botão do modo de profiling e mostra os tempos do rerun medido
+def sidebar_profiling(
+    profiler: RerunProfiler
+):
+    """
+    Função que cria o botão do modo de profiling e mostra os tempos do rerun medido
+
+    Args:
+        profiler (RerunProfiler): Profiler do rerun atual
+
+    Returns:
+        None
+    """
+    st.sidebar.divider()
+    st.sidebar.toggle("Modo profiling", key = "modo_profiling", help = f"Mede cada etapa dos reruns com cProfile e salva os perfis em {profiles_path} (também ativado com {VARIAVEL_AMBIENTE_PROFILING}=1)")
+
+    if profiler.ativo == False:
+        return
+
+    pasta = profiler.save()
+    with st.sidebar.expander("Profiling do rerun", expanded = True):
+        df_resumo = profiler.summary()
+        st.metric("Tempo total", f"{df_resumo['tempo_s'].sum():.3f} s")
+        st.dataframe(df_resumo, hide_index = True, column_config = {
+            "tempo_s": st.column_config.NumberColumn(format = "%.4f"),
+            "percentual": st.column_config.NumberColumn(format = "%.1f%%")
+        })
+
+        st.caption("Funções da ferramenta com maior tempo acumulado")
+        st.dataframe(profiler.hotspots(), hide_index = True, column_config = {
+            "tempo_proprio_s": st.column_config.NumberColumn(format = "%.4f"),
+            "tempo_total_s": st.column_config.NumberColumn(format = "%.4f")
+        })
+        if len(profiler.ignoradas) > 0:
+            st.caption(f"Etapas sem medição (profiler ocupado por outra sessão ou ferramenta): {', '.join(profiler.ignoradas)}")
+        if pasta is not None:
+            st.caption(f"Perfis salvos em {pasta}")
 
 
 
@@ -1192,20 +5656,51 @@ def tab_web_scraping(
 
 
 
-# Cria os componentes principais da aplicação
-tab_webscrapping, tab_data_analysis, df_template_converted = main_components()
+# Executa a aplicação somente quando o arquivo é rodado pelo Streamlit (permite importar as funções, por exemplo, nos benchmarks)
+if __name__ == "__main__":
+
+    # Profiler do rerun (não mede nada caso o modo de profiling esteja desligado)
+    profiler = RerunProfiler(profiling_enabled())
+
+    # Cria os componentes principais da aplicação
+    with profiler.etapa("main_components"):
+        tab_webscrapping, tab_data_analysis, tab_otimizacao, tab_simulacao, tab_backtest, df_template_converted = main_components()
+
+    # Cria a aba de webscrapping
+    with profiler.etapa("tab_web_scraping"):
+        tab_web_scraping(tab_webscrapping)
+
+    # Cria a primeira parte da sidebar
+    with profiler.etapa("sidebar_part1"):
+        PROFITABILITY, VOLATILITY, SCORE_TYPE, RISK_METRIC = sidebar_part1(SCORE_OPTIONS)
+
+    # Cria a aba de data analysis
+    with profiler.etapa("tab_data_analysis_part1"):
+        df_result, versao_dataset = tab_data_analysis_part1(tab_data_analysis, df_template_converted)
+
+    # Cria a segunda parte da sidebar
+    with profiler.etapa("sidebar_part2"):
+        MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOTLIP_SIMPLE, BTG_AVAILABLE, COLOR_BY = sidebar_part2(df_result, versao_dataset)
+
+    # Cria a segunda parte da aba de data analysis
+    with profiler.etapa("tab_data_analysis_part2"):
+        tab_data_analysis_part2(tab_data_analysis, df_result, SCORE_TYPE, MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOTLIP_SIMPLE, TOOLTIP_SIMPLE_COLUMNS, BTG_AVAILABLE, RISK_METRIC, COLOR_BY, versao_dataset)
 
-# Cria a aba de webscrapping
-tab_web_scraping(tab_webscrapping)
+    # Cria a terceira parte da sidebar
+    with profiler.etapa("sidebar_part3"):
+        restricoes = sidebar_part3(list_categorias)
 
-# Cria a primeira parte da sidebar
-PROFITABILITY, VOLATILITY, SCORE_TYPE = sidebar_part1(SCORE_OPTIONS)
+    # Cria a aba de otimização de carteira
+    with profiler.etapa("tab_portfolio_optimization"):
+        tab_portfolio_optimization(tab_otimizacao, df_result, SCORE_TYPE, restricoes)
 
-# Cria a aba de data analysis
-df_result = tab_data_analysis_part1(tab_data_analysis, df_template_converted)
+    # Cria a aba de simulação de carteira
+    with profiler.etapa("tab_portfolio_simulation"):
+        tab_portfolio_simulation(tab_simulacao, df_result, SCORE_TYPE)
 
-# Cria a segunda parte da sidebar
-MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOTLIP_SIMPLE, BTG_AVAILABLE = sidebar_part2(df_result)
+    # Cria a aba de backtest da SuperCarteira
+    with profiler.etapa("tab_supercarteira_backtest"):
+        tab_supercarteira_backtest(tab_backtest, list_categorias)
 
-# Cria a segunda parte da aba de data analysis
-tab_data_analysis_part2(tab_data_analysis, df_result, SCORE_TYPE, MAX_PROFITABILITY, MAX_VOLATILITY, MIN_PROFITABILITY, MIN_VOLATILITY, TOOTLIP_SIMPLE, TOOLTIP_SIMPLE_COLUMNS, BTG_AVAILABLE)
\ No newline at end of file
+    # Modo de profiling (botão e resultados do rerun)
+    sidebar_profiling(profiler)
@@ -0,0 +1,226 @@
+# ======================================================== WORKERS DE PROCESSAMENTO ========================================================
+# ------------------------------------------------- FUNÇÕES EXECUTADAS EM OUTROS PROCESSOS -------------------------------------------------
+
+
+
+## Propósito deste código
+# Funções executadas em um pool de processos pelo FerramentaInvestimento.py (decodificação do webscrapping e backtest). Elas ficam em um
+# módulo separado porque funções definidas no script do Streamlit (__main__) não podem ser enviadas para outros processos, e porque este
+# módulo é leve de importar em cada worker.
+
+## Sumário
+# 01. Introdução
+# 02. Cockpit
+# 03. Funções
+
+
+# ------------------------------------------------------------- 01. INTRODUÇÃO -------------------------------------------------------------
+
+
+
+# Importa bibliotecas
+import json
+
+import numpy as np
+
+# Parser de JSON rápido quando disponível
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+
+# --------------------------------------------------------------- 02. COCKPIT --------------------------------------------------------------
+
+
+
+# Dicionário que ajuda a renomear as colunas (campo do JSON do Mais Retorno -> coluna do resultado)
+dict_rename_maisretorno = {
+    "nicename": "name",
+    "cnpj": "cnpj",
+    "stats.positive_months": "positive_months",
+    "stats.negative_months": "negative_months",
+    "stats.timeframe.last_12_months.profitability": "profitability_12m",
+    "stats.timeframe.last_12_months.volatility": "volatility_12m",
+    "stats.timeframe.last_36_months.profitability": "profitability_36m",
+    "stats.timeframe.last_36_months.volatility": "volatility_36m",
+    "stats.timeframe.last_60_months.profitability": "profitability_60m",
+    "stats.timeframe.last_60_months.volatility": "volatility_60m",
+    "stats.timeframe.begin.profitability": "profitability_begin",
+    "stats.timeframe.begin.volatility": "volatility_begin",
+    "stats.timeframe.begin.sharpe_ratio": "sharpe_ratio_begin"
+}
+
+# Caminho de cada campo dentro do JSON
+CAMINHOS_MAISRETORNO = [campo.split(".") for campo in dict_rename_maisretorno]
+
+# Dados do backtest carregados uma única vez em cada processo do pool (ver init_backtest_worker)
+DADOS_BACKTEST = {}
+
+
+# -------------------------------------------------------------- 03. FUNÇÕES ---------------------------------------------------------------
+
+
+
+# Função que decodifica um lote de respostas do Mais Retorno e extrai somente os campos usados
+def decode_maisretorno_batch(
+    lote: list
+):
+    """
+    Função que decodifica um lote de respostas do Mais Retorno e extrai somente os campos usados
+
+    Args:
+        lote (list): Lista de tuplas (ativo, bytes da resposta)
+
+    Returns:
+        list: Lista de tuplas (ativo, valores), em que valores segue a ordem de dict_rename_maisretorno ou é None caso a resposta seja inválida
+    """
+    list_resultados = []
+
+    for ativo, conteudo in lote:
+
+        # Decodifica a resposta; respostas que não são JSON ou não têm estatísticas são consideradas não encontradas
+        try:
+            dados = json_loads(conteudo)
+        except ValueError:
+            list_resultados.append((ativo, None))
+            continue
+
+        if isinstance(dados, dict) == False or isinstance(dados.get("stats"), dict) == False:
+            list_resultados.append((ativo, None))
+            continue
+
+        # Percorre o caminho de cada campo; campos ausentes viram None
+        valores = []
+        for caminho in CAMINHOS_MAISRETORNO:
+            valor = dados
+            for chave in caminho:
+                valor = valor.get(chave) if isinstance(valor, dict) else None
+            valores.append(valor)
+
+        list_resultados.append((ativo, tuple(valores)))
+
+    return list_resultados
+
+
+# Função que monta os pesos das carteiras do backtest para todas as datas e categorias de uma vez
+def build_backtest_weights(
+    membros: np.ndarray,
+    scores: np.ndarray,
+    esquema: str = "igual",
+    top_n: int = None
+):
+    """
+    Função que monta os pesos das carteiras do backtest para todas as datas e categorias de uma vez
+
+    Args:
+        membros (np.ndarray): Matriz booleana (datas x categorias x ativos) indicando os ativos listados em cada SuperCarteira
+        scores (np.ndarray): Matriz (datas x ativos) com o score de cada ativo na data, NaN onde não há score
+        esquema (str): "igual" (pesos iguais) ou "score" (pesos proporcionais ao score positivo)
+        top_n (int): Mantém somente os top_n ativos de maior score de cada categoria, caso None mantém todos
+
+    Returns:
+        np.ndarray: Matriz float32 (datas x categorias x ativos) com pesos que somam 1 em cada carteira (ou 0 se vazia)
+    """
+    scores = np.broadcast_to(scores[:, None, :], membros.shape)
+    pesos = membros.astype(np.float32)
+
+    # Somente os top_n de maior score de cada carteira (ativos sem score ficam por último)
+    if top_n is not None:
+        scores_membros = np.where(membros & ~np.isnan(scores), scores, -np.inf)
+        posicao = np.argsort(np.argsort(-scores_membros, axis = 2, kind = "stable"), axis = 2, kind = "stable")
+        pesos = pesos * ((posicao < top_n) & np.isfinite(scores_membros))
+
+    # Pesos proporcionais ao score (scores negativos ou ausentes não recebem peso)
+    if esquema == "score":
+        pesos = pesos * np.nan_to_num(np.maximum(scores, 0), nan = 0.0)
+
+    # Normaliza cada carteira
+    soma = pesos.sum(axis = 2, keepdims = True)
+
+    return np.divide(pesos, soma, out = np.zeros_like(pesos), where = soma > 0).astype(np.float32)
+
+
+# Função que calcula os retornos mensais futuros das carteiras de todas as datas e categorias de uma vez
+def backtest_portfolios(
+    pesos: np.ndarray,
+    retornos: np.ndarray,
+    colunas_inicio: np.ndarray,
+    horizonte: int
+):
+    """
+    Função que calcula os retornos mensais futuros das carteiras de todas as datas e categorias de uma vez
+
+    Cada carteira é rebalanceada todo mês para os pesos da data; ativos sem retorno no mês saem da carteira naquele mês
+    e os demais são renormalizados.
+
+    Args:
+        pesos (np.ndarray): Matriz (datas x categorias x ativos) com os pesos de cada carteira
+        retornos (np.ndarray): Painel (ativos x meses) de retornos mensais em decimal, com NaN onde não há dado
+        colunas_inicio (np.ndarray): Para cada data, coluna do painel com o primeiro mês após a data (negativa quando a data é anterior ao painel)
+        horizonte (int): Quantidade de meses acompanhados após cada data
+
+    Returns:
+        retornos_carteira: Matriz (datas x categorias x horizonte) com o retorno mensal de cada carteira, NaN sem dados
+        acumulado: Matriz (datas x categorias x horizonte) com o retorno acumulado até cada mês
+    """
+    # Retornos futuros de todos os ativos para todas as datas: (ativos x datas x horizonte)
+    colunas = np.asarray(colunas_inicio)[:, None] + np.arange(horizonte)[None, :]
+    dentro = (colunas >= 0) & (colunas < retornos.shape[1])
+    futuros = np.asarray(retornos[:, np.clip(colunas, 0, retornos.shape[1] - 1)], dtype = np.float32)
+    futuros[:, ~dentro] = np.nan
+
+    # Média ponderada somente entre os ativos com retorno em cada mês
+    validos = (~np.isnan(futuros)).astype(np.float32)
+    soma_ponderada = np.einsum("dca,adh->dch", pesos, np.nan_to_num(futuros, nan = 0.0))
+    soma_pesos = np.einsum("dca,adh->dch", pesos, validos)
+    retornos_carteira = np.divide(soma_ponderada, soma_pesos, out = np.full_like(soma_ponderada, np.nan), where = soma_pesos > 0)
+
+    # Retorno acumulado (meses sem dados não alteram o acumulado, mas ficam NaN na série)
+    acumulado = np.cumprod(1 + np.nan_to_num(retornos_carteira, nan = 0.0), axis = 2) - 1
+    acumulado[np.isnan(retornos_carteira)] = np.nan
+
+    return retornos_carteira, acumulado
+
+
+# Função que guarda os dados do backtest em cada processo do pool (chamada uma vez por processo)
+def init_backtest_worker(
+    membros: np.ndarray,
+    scores: np.ndarray,
+    retornos: np.ndarray,
+    colunas_inicio: np.ndarray
+):
+    """
+    Função que guarda os dados do backtest em cada processo do pool (chamada uma vez por processo)
+
+    Args:
+        membros (np.ndarray): Matriz booleana (datas x categorias x ativos)
+        scores (np.ndarray): Matriz (datas x ativos) de scores
+        retornos (np.ndarray): Painel (ativos x meses) de retornos mensais
+        colunas_inicio (np.ndarray): Primeira coluna do painel após cada data
+
+    Returns:
+        None
+    """
+    DADOS_BACKTEST.update(membros = membros, scores = scores, retornos = retornos, colunas_inicio = colunas_inicio)
+
+
+# Função que executa o backtest de uma combinação de parâmetros com os dados do processo
+def backtest_worker(
+    parametros: tuple
+):
+    """
+    Função que executa o backtest de uma combinação de parâmetros com os dados do processo
+
+    Args:
+        parametros (tuple): (esquema, top_n, horizonte)
+
+    Returns:
+        tuple: (parametros, retornos_carteira, acumulado)
+    """
+    esquema, top_n, horizonte = parametros
+    pesos = build_backtest_weights(DADOS_BACKTEST["membros"], DADOS_BACKTEST["scores"], esquema, top_n)
+    retornos_carteira, acumulado = backtest_portfolios(pesos, DADOS_BACKTEST["retornos"], DADOS_BACKTEST["colunas_inicio"], horizonte)
+
+    return parametros, retornos_carteira, acumulado